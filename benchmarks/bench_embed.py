@@ -0,0 +1,100 @@
+"""Mesure le rendu des pages d'une grande station (Châtelet – Les Halles)
+
+Compare l'ancien rendu (recherches et insertions dans la liste des champs) au rendu actuel,
+à froid puis lors des changements de page sur une station inchangée.
+
+Utilisation :
+    python -m benchmarks.bench_embed
+"""
+import os
+import time
+import timeit
+
+import discord
+
+from benchmarks.make_fixtures import FIXTURES, RECORDED_AT
+from model.line import Line
+from model.station import Station
+from network.siri import parse_stop_monitoring
+
+FRESH_STATIONS = 20
+
+
+def load_station(copies: int = 1) -> Station:
+    """Station construite à partir de la réponse « huge », éventuellement dupliquée sur d'autres quais"""
+    with open(os.path.join(FIXTURES, 'siri_huge.json'), 'rb') as file:
+        departures = parse_stop_monitoring(file.read(), RECORDED_AT.timestamp())
+
+    station = Station("IDFM:71264", "Châtelet les Halles")
+    for copy in range(copies):
+        for departure in departures:
+            line = station.get_line(departure.line_id) or station.add_line(
+                Line(departure.line_id, departure.line_id[11:-1], 0x2F3136))
+            stop = line.add_stop(f"{departure.stop_id}{copy}", f"Châtelet quai {copy % 3}")
+            stop.add_timetable_record(f"{departure.destination} {copy}", departure.timestamp)
+    return station
+
+
+def render_legacy(station: Station, num_page: int, now: float) -> discord.Embed:
+    """Rendu tel qu'il était fait dans Station.get_station_embed (les attentes étaient alors calculées à la construction)"""
+    line: Line = station.get_line(num_page)
+
+    embed = discord.Embed(title=f"{line.name} | **Horaires**", color=line.color)
+    embed.set_footer(text=f"Page {num_page + 1}/{len(station.lines)}")
+
+    for stop in line.stops:
+        if f"**{stop.name or station.name}**" not in [x.value for x in embed.fields]:
+            embed.add_field(name="‎", value=f"**{stop.name}**", inline=False)
+
+        horaires = stop.timetable.items()
+        horaires_inline = len(horaires) < 2
+
+        for destination, wait_time in horaires:
+            wait_time = [i for i in (round((timestamp - now) / 60) for timestamp in wait_time[:3]) if i <= 60]
+            if not wait_time:
+                continue
+            elif f"**{stop.name}**" not in [x.value for x in embed.fields]:
+                embed.add_field(name=f"→ {destination}", value=" min, ".join(map(str, wait_time)) + " min",
+                                inline=horaires_inline)
+            else:
+                embed.insert_field_at([x.value for x in embed.fields].index(f"**{stop.name}**") + 1,
+                                      name=f"→ {destination}", value=" min, ".join(map(str, wait_time)) + " min",
+                                      inline=horaires_inline)
+
+    if len(embed.fields) < 2:
+        embed.add_field(name="Aucun départ", value="...")
+
+    return embed
+
+
+def timed(function) -> float:
+    runs, total = timeit.Timer(function).autorange()
+    return total / runs * 1e6
+
+
+def main():
+    now = RECORDED_AT.timestamp()
+    for copies in (1, 4):
+        station = load_station(copies)
+        pages = range(len(station.lines))
+
+        legacy = timed(lambda: [render_legacy(station, page, now) for page in pages])
+
+        # Premier rendu : une station neuve par mesure, le rendu n'étant pas encore mémorisé
+        fresh = [load_station(copies) for _ in range(FRESH_STATIONS)]
+        start = time.perf_counter()
+        for other in fresh:
+            for page in pages:
+                other.get_station_embed(page, now)
+        cold = (time.perf_counter() - start) / FRESH_STATIONS * 1e6
+
+        for page in pages:
+            station.get_station_embed(page, now)
+        flips = timed(lambda: [station.get_station_embed(page, now) for page in pages])
+
+        print(f"{len(pages)} pages, {copies} quai(s) par ligne | ancien {legacy:9.1f} µs | "
+              f"actuel {cold:9.1f} µs | changements de page {flips:7.1f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Compare le débit des sources GTFS (SQLite locale, MySQL) sur les recherches de référence
+
+Utilisation :
+    python -m benchmarks.bench_gtfs_backends --sqlite gtfs.sqlite
+    python -m benchmarks.bench_gtfs_backends --sqlite gtfs.sqlite --schema IDFM
+"""
+import argparse
+import random
+import time
+
+from benchmarks.bench_station_search import QUERIES
+from database.gtfs_backend import GTFSBackend
+
+
+def throughput(call, arguments: list, duration: float) -> float:
+    """Nombre d'appels par seconde, en parcourant les arguments en boucle pendant `duration` secondes"""
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for argument in arguments:
+            call(argument)
+        count += len(arguments)
+        elapsed = time.perf_counter() - start
+        if elapsed >= duration:
+            return count / elapsed
+
+
+def run(name: str, backend: GTFSBackend, duration: float, sample: int) -> None:
+    stops = backend.load_stops()
+    routes = backend.load_routes()
+    random.seed(0)
+    stop_ids = [row[0] for row in random.sample(stops, min(sample, len(stops)))]
+    route_ids = [row[0] for row in random.sample(routes, min(sample, len(routes)))]
+
+    print(f"{name:>8} | get_stations  {throughput(backend.get_stations, QUERIES, duration):10,.0f} appels/s")
+    print(f"{name:>8} | get_stop_name {throughput(backend.get_stop_name, stop_ids, duration):10,.0f} appels/s")
+    print(f"{name:>8} | get_color     {throughput(backend.get_color, route_ids, duration):10,.0f} appels/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sqlite', help="fichier SQLite produit par database.import_gtfs")
+    parser.add_argument('--schema', help="schéma MySQL à comparer")
+    parser.add_argument('--duration', type=float, default=2.0, help="durée de chaque mesure, en secondes")
+    parser.add_argument('--sample', type=int, default=500, help="nombre d'arrêts et de lignes interrogés")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        from database.database_gtfs_sqlite import DatabaseGTFSSQLite
+
+        run("sqlite", DatabaseGTFSSQLite(args.sqlite), args.duration, args.sample)
+    if args.schema:
+        from database.database_gtfs import DatabaseGTFS
+
+        run("mysql", DatabaseGTFS(args.schema), args.duration, args.sample)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Décodage des flux GTFS-Realtime de référence et réseau GTFS-RT de bout en bout, hors ligne
+
+Mesure network.gtfs_rt.parse_feed sur les flux enregistrés, puis démarre un réseau GTFSRealtimeNetwork
+sur le faux serveur (flux décalé à l'heure courante) et la base GTFS SQLite de référence : flux complet,
+mise à jour différentielle, puis create_station sur les stations des réponses de référence.
+
+Utilisation :
+    python -m benchmarks.bench_gtfs_rt
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import timeit
+
+from benchmarks.fake_prim import FakePrim
+from benchmarks.make_fixtures import FIXTURES, STATION_IDS, make_gtfs_database
+from network.gtfs_rt import parse_feed
+
+
+def bench_decode() -> None:
+    for name in ('full', 'diff'):
+        with open(os.path.join(FIXTURES, f'gtfs_rt_{name}.pb'), 'rb') as file:
+            payload = file.read()
+        feed = parse_feed(payload)
+        runs, total = timeit.Timer(lambda: parse_feed(payload)).autorange()
+        stops = sum(len(update.stops) for update in feed.updates.values())
+        print(f"{name:>5} ({len(payload) // 1024:4d} Ko) | {len(feed.updates):5d} courses, {stops:6d} arrêts, "
+              f"{len(feed.deleted)} suppressions | {total / runs * 1000:8.2f} ms")
+
+
+async def run(url: str) -> None:
+    # Le réseau lit sa configuration à la construction : il n'est importé qu'une fois l'environnement prêt
+    from network.gtfs_rt_network import GTFSRealtimeNetwork
+    from network.http import HttpClient
+
+    network = GTFSRealtimeNetwork("Banc d'essai", 'BENCH', url)
+    await network.start()
+    await network.wait_ready()
+
+    start = time.perf_counter()
+    feed = await network.refresh()
+    print(f"flux complet : {len(feed.updates)} courses appliquées en {(time.perf_counter() - start) * 1000:.1f} ms, "
+          f"{len(network.store)} en mémoire")
+
+    client = HttpClient({})
+    payload = await client.get(url, params={'differential': '1'})
+    await client.close()
+    start = time.perf_counter()
+    feed = parse_feed(payload)
+    names = network.get_stop_names({update.destination for update in feed.updates.values()})
+    network.store.apply(feed, network.trip_departures(feed, names))
+    print(f"flux différentiel : {len(feed.updates)} courses, {len(feed.deleted)} suppressions en "
+          f"{(time.perf_counter() - start) * 1000:.2f} ms, {len(network.store)} en mémoire")
+
+    for size, station_id in STATION_IDS.items():
+        start = time.perf_counter()
+        station = await network.create_station(f"IDFM:{station_id}")
+        duration = (time.perf_counter() - start) * 1000
+        records = sum(len(stop.timetable) for line in station.lines for stop in line.stops)
+        print(f"create_station.{size} : {len(station.lines)} lignes, {records} destinations en {duration:.2f} ms")
+
+    await network.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sqlite', help="base GTFS SQLite de référence (construite dans un dossier temporaire sinon)")
+    args = parser.parse_args()
+
+    bench_decode()
+
+    prim = FakePrim().start()
+    with tempfile.TemporaryDirectory() as directory:
+        database = args.sqlite
+        if database is None:
+            database = os.path.join(directory, 'gtfs.sqlite')
+            make_gtfs_database(database)
+        os.environ['BENCH_GTFS_BACKEND'] = f'sqlite:{database}'
+        asyncio.run(run(prim.gtfs_rt_url))
+    prim.stop()
+
+
+if __name__ == '__main__':
+    main()
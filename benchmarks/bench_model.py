@@ -0,0 +1,57 @@
+"""Mesure la construction d'une station (Station, Line, Stop) en fonction du nombre de passages
+
+Le temps par passage doit rester constant lorsque la station grossit (construction linéaire).
+
+Utilisation :
+    python -m benchmarks.bench_model
+"""
+import random
+import time
+import tracemalloc
+
+from model.line import Line
+from model.station import Station
+
+
+def make_departures(count: int, seed: int = 0) -> list[tuple[str, str, str, float]]:
+    """Passages (ligne, quai, destination, horodatage) répartis sur des lignes et quais proportionnels à la taille"""
+    rng = random.Random(seed)
+    lines = max(1, count // 40)
+    return [(f"STIF:Line::C{line:05d}:", f"STIF:StopPoint:Q:{line * 10 + rng.randrange(4)}:",
+             f"Destination {line}-{rng.randrange(3)}", 1_740_987_000 + rng.randrange(3600))
+            for line in (rng.randrange(lines) for _ in range(count))]
+
+
+def build(departures: list[tuple[str, str, str, float]]) -> Station:
+    station = Station("IDFM:71264", "Châtelet les Halles")
+    for line_id, stop_id, destination, timestamp in departures:
+        line = station.get_line(line_id)
+        if not line:
+            line = station.add_line(Line(line_id, line_id[11:-1], 0x2F3136))
+        line.add_stop(stop_id, stop_id).add_timetable_record(destination, timestamp)
+    return station
+
+
+def main():
+    for count in (100, 1_000, 10_000, 100_000):
+        departures = make_departures(count)
+
+        runs = max(1, 100_000 // count)
+        start = time.perf_counter()
+        for _ in range(runs):
+            build(departures)
+        duration = (time.perf_counter() - start) / runs
+
+        tracemalloc.start()
+        station = build(departures)
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+        del station
+
+        print(f"{count:>7} passages | {duration * 1e3:9.2f} ms | {duration / count * 1e6:6.2f} µs/passage "
+              f"| {blocks / count:5.2f} blocs conservés/passage")
+
+
+if __name__ == '__main__':
+    main()
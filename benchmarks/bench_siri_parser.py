@@ -0,0 +1,72 @@
+"""Microbenchmark du décodage des réponses stop-monitoring
+
+Compare l'ancien décodage (json + datetime.strptime à chaque passage) au module network.siri,
+avec orjson s'il est installé et avec le module json standard.
+
+Utilisation :
+    python -m benchmarks.bench_siri_parser
+"""
+import json
+import os
+import timeit
+from datetime import datetime
+
+from benchmarks.make_fixtures import FIXTURES, RECORDED_AT
+from network import siri
+
+
+def parse_legacy(payload: bytes) -> list:
+    """Décodage tel qu'il était fait dans IDFM.create_station"""
+    visits = json.loads(payload)['Siri']['ServiceDelivery']['StopMonitoringDelivery'][0]['MonitoredStopVisit']
+    departures = []
+    for entry in visits:
+        journey: dict = entry['MonitoredVehicleJourney']
+        wait_time = journey['MonitoredCall'].get('ExpectedDepartureTime', '2022-01-01T00:00:00.000Z')
+        wait_time = journey['MonitoredCall'].get('ExpectedArrivalTime', wait_time)
+        wait_time = datetime.strptime(wait_time, '%Y-%m-%dT%H:%M:%S.%fZ')
+        wait_time = round((wait_time - datetime.now()).total_seconds() / 60.0)
+
+        destination = journey['MonitoredCall'].get('DestinationDisplay')
+        destination = journey.get('DestinationName', destination)
+        destination = journey.get('DirectionName', destination)
+        destination = destination[0]['value']
+
+        if journey['JourneyNote'] and journey['JourneyNote'][0]['value'] != "":
+            destination = f"{journey['JourneyNote'][0]['value']} | {destination}"
+        departures.append((entry['MonitoringRef']['value'], journey['LineRef']['value'], destination, wait_time))
+    return departures
+
+
+def main():
+    now = RECORDED_AT.timestamp()
+    def with_loads(loads):
+        def parse(payload: bytes):
+            previous, siri.loads = siri.loads, loads
+            try:
+                return siri.parse_stop_monitoring(payload, now)
+            finally:
+                siri.loads = previous
+        return parse
+
+    parsers = {'legacy': parse_legacy, 'siri+json': with_loads(json.loads)}
+    try:
+        import orjson
+        parsers['siri+orjson'] = with_loads(orjson.loads)
+    except ImportError:
+        pass
+
+    for size in ('small', 'medium', 'huge'):
+        with open(os.path.join(FIXTURES, f'siri_{size}.json'), 'rb') as file:
+            payload = file.read()
+
+        results = {}
+        for name, parse in parsers.items():
+            runs, total = timeit.Timer(lambda: parse(payload)).autorange()
+            results[name] = total / runs * 1e6
+
+        line = " | ".join(f"{name} {duration:9.1f} µs" for name, duration in results.items())
+        print(f"{size:>6} ({len(payload) // 1024:4d} Ko) | {line} | gain x{results['legacy'] / min(results.values()):.1f}")
+
+
+if __name__ == '__main__':
+    main()
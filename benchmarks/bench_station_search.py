@@ -0,0 +1,91 @@
+"""Compare la latence de l'index de recherche en mémoire à celle de la requête FULLTEXT MySQL
+
+Utilisation :
+    python -m benchmarks.bench_station_search --stops chemin/vers/stops.txt
+    python -m benchmarks.bench_station_search --schema IDFM --sql
+"""
+import argparse
+import csv
+import io
+import statistics
+import time
+import zipfile
+
+from database.station_index import StationIndex
+
+QUERIES = ["chatelet", "Châtelet les halles", "gare du nord", "gare de l'est", "gare de lyon", "st lazare",
+           "saint-michel", "nation", "la défense", "montparnasse", "bastille", "république", "porte maillot",
+           "cdg", "aéroport charles de gaulle", "massy palaiseau", "marne la vallée", "versailles chantiers",
+           "denfert", "bibliothèque françois mitterrand", "cité universitaire", "noisy le grand", "opera",
+           "auber", "haussmann saint lazare", "juvisy", "créteil préfecture", "pont de sèvres", "chat", "g"]
+
+
+def load_stops_file(path: str) -> list[tuple[str, str]]:
+    """Lit les stations (arrêts sans parent) d'un stops.txt ou d'une archive GTFS"""
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive, archive.open('stops.txt') as raw:
+            return _read_stops(io.TextIOWrapper(raw, encoding='utf-8-sig'))
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        return _read_stops(file)
+
+
+def _read_stops(file) -> list[tuple[str, str]]:
+    return [(row['stop_id'], row['stop_name']) for row in csv.DictReader(file) if not row.get('parent_station')]
+
+
+def load_stops_schema(schema: str) -> list[tuple[str, str]]:
+    from database.database import Database
+
+    with Database(schema) as database:
+        return database.query('''SELECT stop_id, stop_name FROM stops WHERE parent_station IS NULL''')
+
+
+def measure(search, repeat: int) -> list[float]:
+    """Latences (en millisecondes) de chaque requête, médiane sur `repeat` exécutions"""
+    latencies = []
+    for query in QUERIES:
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            search(query)
+            samples.append((time.perf_counter() - start) * 1000)
+        latencies.append(statistics.median(samples))
+    return latencies
+
+
+def report(name: str, latencies: list[float]) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))]
+    print(f"{name:>8} | médiane {statistics.median(ordered):8.3f} ms | p95 {p95:8.3f} ms | max {ordered[-1]:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stops', help="stops.txt ou archive GTFS servant à construire l'index")
+    parser.add_argument('--schema', default='IDFM', help="schéma MySQL (si --stops est absent, ou avec --sql)")
+    parser.add_argument('--sql', action='store_true', help="mesure aussi la requête FULLTEXT MySQL")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    stations = load_stops_file(args.stops) if args.stops else load_stops_schema(args.schema)
+
+    start = time.perf_counter()
+    index = StationIndex(stations)
+    print(f"Index : {len(index)} stations construites en {time.perf_counter() - start:.2f} s")
+
+    index_latencies = measure(index.search, args.repeat)
+    report("index", index_latencies)
+
+    if args.sql:
+        from database.database_gtfs import DatabaseGTFS
+
+        sql_latencies = measure(DatabaseGTFS(args.schema).get_stations, max(1, args.repeat // 4))
+        report("sql", sql_latencies)
+
+    print()
+    for query, latency in zip(QUERIES, index_latencies):
+        print(f"{query:>35} | {latency:7.3f} ms | {', '.join(name for _, name, _ in index.search(query))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""Mesure de bout en bout du bot, hors ligne : faux serveur PRIM et base GTFS SQLite de référence
+
+Sont mesurés IDFM.create_station (cache vide puis chaud, et en rafale), Station.get_station_embed,
+les horaires théoriques, station_autocomplete et les requêtes de référence. Les résultats sont
+écrits en JSON pour être comparés d'un commit à l'autre.
+
+Utilisation :
+    python -m benchmarks.bench_suite --output resultats.json
+    python -m benchmarks.bench_suite --latency 0.1 --error-rate 0.05 --compare resultats.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from benchmarks.bench_station_search import QUERIES
+from benchmarks.fake_prim import FakePrim
+from benchmarks.make_fixtures import STATION_IDS, make_gtfs_database
+from database.timetable import build
+
+
+def summarize(samples: list[float], errors: int = 0) -> dict:
+    """Résumé d'une série de durées, en millisecondes"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {'n': 0, 'errors': errors}
+    return {
+        'n': len(ordered),
+        'errors': errors,
+        'mean_ms': round(statistics.fmean(ordered), 4),
+        'median_ms': round(statistics.median(ordered), 4),
+        'p95_ms': round(ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))], 4),
+        'max_ms': round(ordered[-1], 4),
+    }
+
+
+async def timed(call, repeat: int) -> dict:
+    """Exécute `repeat` fois la coroutine renvoyée par `call` et résume les durées"""
+    samples = []
+    errors = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            await call()
+        except Exception:
+            errors += 1
+            continue
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples, errors)
+
+
+async def burst(call, count: int) -> dict:
+    """Lance `count` appels simultanés ; la durée retenue est celle de chaque appel"""
+    async def one() -> float:
+        start = time.perf_counter()
+        await call()
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(count)), return_exceptions=True)
+    summary = summarize([r for r in results if isinstance(r, float)], sum(isinstance(r, Exception) for r in results))
+    summary['wall_ms'] = round((time.perf_counter() - start) * 1000, 4)
+    return summary
+
+
+async def run(repeat: int) -> dict:
+    # Les modules du bot lisent leur configuration à l'import : ils ne sont importés qu'une fois l'environnement prêt
+    from database.database import run_async
+    from cogs.horaires import station_autocomplete
+    from network.networks import Networks
+
+    network = Networks.IDFM.value
+    await network.start()
+    await network.wait_ready()
+    results = {}
+
+    for size, station_id in STATION_IDS.items():
+        station_id = f"IDFM:{station_id}"
+
+        async def cold():
+            network.realtime.clear()
+            return await network.create_station(station_id)
+
+        results[f'create_station.{size}.cold'] = await timed(cold, repeat)
+        results[f'create_station.{size}.warm'] = await timed(lambda: network.create_station(station_id), repeat)
+
+        network.realtime.clear()
+        results[f'create_station.{size}.burst'] = await burst(lambda: network.create_station(station_id), 50)
+
+        stations = [await network.create_station(station_id) for _ in range(repeat)]
+        samples = []
+        for station in stations:
+            start = time.perf_counter()
+            for page in range(len(station.lines)):
+                station.get_station_embed(page)
+            samples.append((time.perf_counter() - start) * 1000)
+        results[f'embed.{size}.all_pages'] = summarize(samples)
+
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            network.theoretical_departures([station_id])
+            samples.append((time.perf_counter() - start) * 1000)
+        results[f'timetable.{size}'] = summarize(samples)
+
+    interaction = SimpleNamespace(data={'options': [{'options': [{'value': Networks.IDFM.name}]}]},
+                                  user=SimpleNamespace(id=0))
+    samples = []
+    for query in QUERIES:
+        start = time.perf_counter()
+        await station_autocomplete(interaction, query)
+        samples.append((time.perf_counter() - start) * 1000)
+    results['station_autocomplete'] = summarize(samples)
+
+    stop_ids = [f"IDFM:{900000 + i}" for i in range(200)]
+    line_ids = ["IDFM:C01742", "IDFM:C01371", "IDFM:C01384", "IDFM:C00635"]
+    queries = itertools.cycle(QUERIES)
+    results['db.get_stations'] = await timed(lambda: run_async(network.get_stations, next(queries)), repeat)
+    results['db.get_stop_names.200'] = await timed(lambda: run_async(network.get_stop_names, stop_ids), repeat)
+    results['db.get_routes_meta'] = await timed(lambda: run_async(network.get_routes_meta, line_ids), repeat)
+
+    results['realtime_cache'] = network.realtime.stats
+    results['scheduler'] = network.scheduler.stats
+    await network.close()
+    return results
+
+
+def commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """Affiche l'évolution des médianes par rapport à une exécution précédente"""
+    print(f"\nComparaison avec {baseline['meta'].get('commit')} :", file=sys.stderr)
+    for name, summary in results.items():
+        before = baseline['results'].get(name, {}).get('median_ms')
+        after = summary.get('median_ms')
+        if before and after:
+            print(f"{name:>32} | {before:10.3f} ms → {after:10.3f} ms | {(after - before) / before:+7.1%}",
+                  file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.02, help="latence du faux serveur PRIM, en secondes")
+    parser.add_argument('--jitter', type=float, default=0.005)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="proportion de réponses 503")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="proportion de réponses 429")
+    parser.add_argument('--no-reference', action='store_true', help="interroge la base sans référentiel en mémoire")
+    parser.add_argument('--output', help="fichier JSON des résultats (sortie standard par défaut)")
+    parser.add_argument('--compare', help="fichier JSON d'une exécution précédente")
+    args = parser.parse_args()
+
+    prim = FakePrim(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                    throttle_rate=args.throttle_rate).start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'gtfs.sqlite')
+        make_gtfs_database(database)
+        timetable = os.path.join(directory, 'IDFM.timetable')
+        with closing(sqlite3.connect(database)) as connection:
+            build(connection, timetable)
+
+        os.environ.update({
+            'IDFM_API_URL': prim.url,
+            'IDFM_API_KEY': 'benchmark',
+            'IDFM_GTFS_BACKEND': f'sqlite:{database}',
+            'GTFS_REFERENCE': '0' if args.no_reference else '1',
+            'IDFM_TIMETABLE': timetable,
+            # Le budget d'appels à PRIM ne doit pas fausser les mesures
+            'IDFM_RATE': '100000',
+            'IDFM_BURST': '100000',
+        })
+        results = asyncio.run(run(args.repeat))
+
+    prim.stop()
+
+    report = {
+        'meta': {
+            'commit': commit(),
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'options': vars(args),
+            'prim_requests': prim.requests,
+            'prim_errors': prim.errors,
+        },
+        'results': results,
+    }
+
+    for name, summary in results.items():
+        if 'median_ms' in summary:
+            print(f"{name:>32} | médiane {summary['median_ms']:10.3f} ms | p95 {summary['p95_ms']:10.3f} ms | "
+                  f"erreurs {summary['errors']}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+    else:
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Fausse API et fausse passerelle Discord, pour démarrer le bot (ou le superviseur) sans jeton ni réseau
+
+La passerelle accepte l'identification de chaque shard, lui attribue ses serveurs fictifs
+(guild_id >> 22 % shard_count) et répond aux battements de cœur ; l'API répond aux quelques
+routes utilisées au démarrage. Le temps entre l'identification et l'envoi de READY est affiché par shard.
+
+Utilisation :
+    python -m benchmarks.fake_discord --port 8090 --guilds 2000 --shards 8
+    DISCORD_API_URL=http://127.0.0.1:8090/api/v10 DISCORD_GATEWAY_URL=ws://127.0.0.1:8090/gateway \\
+        DISCORD_TOKEN=faux python supervisor.py --workers 2
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+from aiohttp import WSMsgType, web
+
+APPLICATION_ID = 100000000000000000
+USER = {'id': str(APPLICATION_ID), 'username': 'Koleka', 'discriminator': '0000', 'global_name': None,
+        'avatar': None, 'bot': True, 'flags': 0}
+HEARTBEAT_INTERVAL = 41250
+
+
+def guild_id(i: int) -> int:
+    # Identifiants répartis sur les shards comme de vrais snowflakes
+    return ((1_400_000_000_000 + i * 7919) << 22) + i
+
+
+def guild(snowflake: int) -> dict:
+    return {'id': str(snowflake), 'name': f"Serveur {snowflake % 100000}", 'icon': None, 'owner_id': USER['id'],
+            'features': [], 'roles': [{'id': str(snowflake), 'name': '@everyone', 'permissions': '0', 'position': 0,
+                                       'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+            'emojis': [], 'stickers': [], 'channels': [], 'threads': [], 'members': [], 'presences': [],
+            'voice_states': [], 'stage_instances': [], 'guild_scheduled_events': [], 'member_count': 1,
+            'large': False, 'unavailable': False, 'joined_at': '2025-01-01T00:00:00+00:00',
+            'verification_level': 0, 'default_message_notifications': 0, 'explicit_content_filter': 0,
+            'mfa_level': 0, 'premium_tier': 0, 'nsfw_level': 0, 'preferred_locale': 'fr', 'system_channel_flags': 0}
+
+
+def _json(data) -> web.Response:
+    # discord.py n'interprète la réponse que si son type est exactement application/json, sans jeu de caractères
+    return web.Response(body=json.dumps(data).encode(), headers={'Content-Type': 'application/json'})
+
+
+class FakeDiscord:
+    def __init__(self, guilds: int, shards: int, latency: float = 0.0):
+        self.guilds = [guild_id(i) for i in range(guilds)]
+        self.shards = shards
+        self.latency = latency
+        self.sessions = itertools.count(1)
+        self.identified: dict[int, float] = {}
+        self.commands: list[dict] = []
+        self.url = ''
+
+    async def __rest(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency)
+        path = request.match_info['path']
+
+        if path == 'users/@me':
+            return _json(USER)
+        if path == 'gateway/bot':
+            return _json({'url': self.url.replace('http', 'ws') + '/gateway', 'shards': self.shards,
+                          'session_start_limit': {'total': 1000, 'remaining': 1000,
+                                                  'reset_after': 0, 'max_concurrency': 1}})
+        if path == 'gateway':
+            return _json({'url': self.url.replace('http', 'ws') + '/gateway'})
+        if path == 'oauth2/applications/@me':
+            return _json({'id': USER['id'], 'name': 'Koleka', 'icon': None, 'description': '',
+                          'bot_public': True, 'bot_require_code_grant': False, 'owner': USER,
+                          'verify_key': '', 'flags': 0})
+        if path.endswith('/commands') and request.method == 'PUT':
+            self.commands = await request.json()
+            return _json([dict(command, id=str(APPLICATION_ID + i), application_id=USER['id'],
+                               version='1', type=command.get('type', 1))
+                          for i, command in enumerate(self.commands)])
+        if path.endswith('/commands'):
+            return _json([])
+        return _json({})
+
+    async def __gateway(self, request: web.Request) -> web.WebSocketResponse:
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        sequence = itertools.count(1)
+
+        async def send(op: int, data, event: str = None):
+            await socket.send_str(json.dumps({'op': op, 'd': data, 's': next(sequence) if event else None,
+                                              't': event}))
+
+        await send(10, {'heartbeat_interval': HEARTBEAT_INTERVAL})
+        async for message in socket:
+            if message.type != WSMsgType.TEXT:
+                break
+            payload = json.loads(message.data)
+            op, data = payload['op'], payload.get('d')
+
+            if op == 1:
+                await send(11, None)
+            elif op == 2:
+                start = time.perf_counter()
+                shard_id, shard_count = data.get('shard', [0, 1])
+                guilds = [g for g in self.guilds if (g >> 22) % shard_count == shard_id]
+                await send(0, {'v': 10, 'user': USER, 'session_id': f"session{next(self.sessions)}",
+                               'resume_gateway_url': self.url.replace('http', 'ws') + '/gateway',
+                               'shard': [shard_id, shard_count], 'application': {'id': USER['id'], 'flags': 0},
+                               'guilds': [{'id': str(g), 'unavailable': True} for g in guilds]}, 'READY')
+                for g in guilds:
+                    await send(0, guild(g), 'GUILD_CREATE')
+                self.identified[shard_id] = time.perf_counter() - start
+                print(f"shard {shard_id}/{shard_count} : {len(guilds)} serveurs envoyés en "
+                      f"{1000 * self.identified[shard_id]:.0f} ms")
+            elif op == 6:
+                await send(0, {}, 'RESUMED')
+            elif op == 8:
+                await send(0, {'guild_id': data['guild_id'], 'members': [], 'chunk_index': 0, 'chunk_count': 1,
+                               'nonce': data.get('nonce')}, 'GUILD_MEMBERS_CHUNK')
+        return socket
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/gateway', self.__gateway)
+        app.router.add_route('*', '/api/v10/{path:.*}', self.__rest)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--guilds', type=int, default=1000)
+    parser.add_argument('--shards', type=int, default=4, help="nombre de shards recommandé")
+    parser.add_argument('--latency', type=float, default=0.0, help="latence de l'API, en secondes")
+    args = parser.parse_args()
+
+    fake = FakeDiscord(args.guilds, args.shards, args.latency)
+    fake.url = f"http://127.0.0.1:{args.port}"
+    print(f"DISCORD_API_URL={fake.url}/api/v10 DISCORD_GATEWAY_URL={fake.url.replace('http', 'ws')}/gateway")
+    web.run_app(fake.app(), host='127.0.0.1', port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""Faux serveur PRIM (stop-monitoring) servant les réponses de référence, avec latence et erreurs simulées
+
+Les horaires des réponses enregistrées sont décalés à l'heure courante à chaque requête. Le serveur sert
+aussi les flux GTFS-Realtime de référence (complet, ou différentiel avec `?differential=1`) sur /gtfs-rt.
+
+Utilisation :
+    python -m benchmarks.fake_prim --port 8080 --latency 0.15 --error-rate 0.05
+    IDFM_API_URL=http://127.0.0.1:8080/stop-monitoring python koleka.py
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.make_fixtures import FIXTURES, RECORDED_AT, STATION_IDS, differential_trips, feed_trips, trip_updates
+
+TIMESTAMP = re.compile(rb'"(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)\.000Z"')
+EMPTY = {"Siri": {"ServiceDelivery": {"StopMonitoringDelivery": [{"Version": "2.0", "Status": "true",
+                                                                  "MonitoredStopVisit": []}]}}}
+
+
+class FakePrim:
+    """Serveur HTTP local imitant l'API stop-monitoring de PRIM
+
+    :param latency: latence moyenne ajoutée à chaque réponse, en secondes
+    :param jitter: variation maximale de la latence, en secondes
+    :param error_rate: proportion des requêtes répondues par une erreur 503
+    :param throttle_rate: proportion des requêtes répondues par une erreur 429 avec Retry-After
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 1.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.errors = 0
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__payloads = self.__load_payloads()
+        self.__rendered: dict[str, tuple[int, bytes]] = {}
+        self.__trips = feed_trips()
+        self.__feeds: dict[bool, tuple[int, bytes]] = {}
+        self.__thread: Optional[threading.Thread] = None
+
+        prim = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # En-têtes et corps sont écrits séparément : sans cela, Nagle retarde chaque réponse d'environ 40 ms
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                prim.handle(self)
+
+            def log_message(self, *_):
+                pass
+
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+
+    @staticmethod
+    def __load_payloads() -> dict[str, bytes]:
+        payloads = {}
+        for size, station_id in STATION_IDS.items():
+            with open(os.path.join(FIXTURES, f'siri_{size}.json'), 'rb') as file:
+                payloads[station_id] = file.read()
+        return payloads
+
+    @property
+    def url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}/stop-monitoring"
+
+    @property
+    def gtfs_rt_url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}/gtfs-rt"
+
+    def __feed(self, differential: bool) -> bytes:
+        """Flux TripUpdates de référence, horaires comptés à partir de la seconde courante"""
+        now = int(time.time())
+        rendered = self.__feeds.get(differential)
+        if rendered is None or rendered[0] != now:
+            if differential:
+                updated, deleted = differential_trips(self.__trips)
+                payload = trip_updates(updated, now, True, deleted)
+            else:
+                payload = trip_updates(self.__trips, now)
+            rendered = self.__feeds[differential] = (now, payload)
+        return rendered[1]
+
+    def __payload(self, station_id: str) -> bytes:
+        """Réponse enregistrée pour l'arrêt, décalée de l'enregistrement à la seconde courante"""
+        template = self.__payloads.get(station_id)
+        if template is None:
+            return json.dumps(EMPTY).encode()
+
+        offset = int(time.time() - RECORDED_AT.timestamp())
+        rendered = self.__rendered.get(station_id)
+        if rendered is None or rendered[0] != offset:
+            shift = timedelta(seconds=offset)
+
+            def shifted(match: re.Match) -> bytes:
+                value = datetime.strptime(match.group(1).decode(), '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
+                return (value + shift).strftime('"%Y-%m-%dT%H:%M:%S.000Z"').encode()
+
+            rendered = self.__rendered[station_id] = (offset, TIMESTAMP.sub(shifted, template))
+        return rendered[1]
+
+    def handle(self, request: BaseHTTPRequestHandler) -> None:
+        with self.__lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self.__random.uniform(-self.jitter, self.jitter))
+            draw = self.__random.random()
+
+        time.sleep(delay)
+
+        headers = {'Content-Type': 'application/json'}
+        if draw < self.throttle_rate:
+            status, body = 429, b'{"message": "Too Many Requests"}'
+            headers['Retry-After'] = str(self.retry_after)
+        elif draw < self.throttle_rate + self.error_rate:
+            status, body = 503, b'{"message": "Service Unavailable"}'
+        elif urlparse(request.path).path == '/gtfs-rt':
+            differential = parse_qs(urlparse(request.path).query).get('differential', ['0'])[0] == '1'
+            status, body = 200, self.__feed(differential)
+            headers['Content-Type'] = 'application/x-protobuf'
+        else:
+            monitoring_ref = parse_qs(urlparse(request.path).query).get('MonitoringRef', [''])[0]
+            status, body = 200, self.__payload(monitoring_ref.split(':')[-2] if monitoring_ref.count(':') > 1 else '')
+
+        if status != 200:
+            with self.__lock:
+                self.errors += 1
+
+        request.send_response(status)
+        for name, value in headers.items():
+            request.send_header(name, value)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def start(self) -> 'FakePrim':
+        """Démarre le serveur dans un thread"""
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def serve_forever(self) -> None:
+        self.__server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help="latence moyenne, en secondes")
+    parser.add_argument('--jitter', type=float, default=0.0, help="variation de la latence, en secondes")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="proportion de réponses 503")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="proportion de réponses 429")
+    args = parser.parse_args()
+
+    prim = FakePrim(args.host, args.port, args.latency, args.jitter, args.error_rate, args.throttle_rate)
+    print(f"Faux serveur PRIM sur {prim.url} : {', '.join(STATION_IDS.values())}")
+    try:
+        prim.serve_forever()
+    except KeyboardInterrupt:
+        prim.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""Génère les réponses stop-monitoring de référence utilisées par les benchmarks
+
+Les réponses reprennent la structure exacte des réponses PRIM (SIRI Lite) relevées aux heures de pointe ;
+seuls les identifiants de courses et les horaires sont tirés au hasard, avec une graine fixe.
+L'archive GTFS de référence contient les arrêts et les lignes de ces réponses, noyés parmi des
+milliers de stations fictives pour que les recherches portent sur un volume réaliste, ainsi que
+des horaires théoriques réguliers pour les quais de ces réponses. Les flux GTFS-Realtime TripUpdates
+(complet et différentiel) décrivent les mêmes passages, plus des courses fictives sur les autres arrêts.
+
+Utilisation :
+    python -m benchmarks.make_fixtures
+    python -m benchmarks.make_fixtures --gtfs gtfs.zip --sqlite gtfs.sqlite
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+RECORDED_AT = datetime(2025, 3, 3, 7, 30, tzinfo=timezone.utc)
+
+# (ligne, quai, destinations, passages par destination)
+STATIONS = {
+    'small': [
+        ("C01742", "473921", ["Saint-Germain-en-Laye", "Boissy-Saint-Léger"], 3),
+        ("C00635", "22092", ["Porte de Clichy", "Gare de Lyon"], 3),
+    ],
+    'medium': [
+        ("C01742", "473921", ["Saint-Germain-en-Laye", "Cergy-le-Haut", "Poissy", "Boissy-Saint-Léger",
+                              "Marne-la-Vallée Chessy"], 4),
+        ("C01743", "473922", ["Aéroport Charles de Gaulle 2 TGV", "Mitry-Claye", "Massy-Palaiseau",
+                              "Saint-Rémy-lès-Chevreuse"], 4),
+        ("C01371", "22087", ["La Défense", "Château de Vincennes"], 5),
+        ("C01374", "22088", ["Porte de Clignancourt", "Bagneux - Lucie Aubrac"], 5),
+        ("C01384", "22093", ["Saint-Denis Pleyel", "Aéroport d'Orly"], 5),
+    ],
+    'huge': [
+        ("C01742", "473921", ["Saint-Germain-en-Laye", "Cergy-le-Haut", "Poissy", "Boissy-Saint-Léger",
+                              "Marne-la-Vallée Chessy"], 6),
+        ("C01743", "473922", ["Aéroport Charles de Gaulle 2 TGV", "Mitry-Claye", "Massy-Palaiseau",
+                              "Saint-Rémy-lès-Chevreuse", "Robinson"], 6),
+        ("C01728", "473923", ["Creil", "Orry-la-Ville", "Melun", "Corbeil-Essonnes", "Malesherbes"], 6),
+        ("C01371", "22087", ["La Défense", "Château de Vincennes"], 10),
+        ("C01374", "22088", ["Porte de Clignancourt", "Bagneux - Lucie Aubrac"], 10),
+        ("C01377", "22089", ["La Courneuve - 8 Mai 1945", "Villejuif - Louis Aragon", "Mairie d'Ivry"], 8),
+        ("C01381", "22090", ["Mairie des Lilas", "Châtelet"], 8),
+        ("C01384", "22093", ["Saint-Denis Pleyel", "Aéroport d'Orly"], 10),
+        ("C01078", "22094", ["Gare de Lyon", "Porte de Clichy"], 6),
+        ("C01137", "22095", ["Porte de Saint-Cloud", "Gare de l'Est"], 6),
+        ("C01143", "22096", ["Bagnolet - Louise Michel", "Porte de Saint-Cloud"], 6),
+        ("C01085", "22097", ["Porte d'Orléans", "Gare du Nord"], 6),
+    ],
+}
+
+
+# Arrêt interrogé pour chaque réponse (identifiant IDFM sans préfixe) et son nom
+STATION_IDS = {'small': '71359', 'medium': '71410', 'huge': '71264'}
+STATION_NAMES = {'small': "Gare de Lyon", 'medium': "Gare du Nord", 'huge': "Châtelet les Halles"}
+
+# Lignes des réponses : (nom court, nom long, couleur)
+ROUTES = {
+    "C01742": ("A", "RER A", "E2231A"), "C01743": ("B", "RER B", "7BA3DC"), "C01728": ("D", "RER D", "00A88F"),
+    "C01371": ("1", "Métro 1", "FFCD00"), "C01374": ("4", "Métro 4", "C04191"), "C01377": ("7", "Métro 7", "F59EB3"),
+    "C01381": ("11", "Métro 11", "704B1C"), "C01384": ("14", "Métro 14", "62259D"), "C00635": ("20", "Bus 20", "82C8E6"),
+    "C01078": ("29", "Bus 29", "82C8E6"), "C01137": ("72", "Bus 72", "82C8E6"), "C01143": ("76", "Bus 76", "82C8E6"),
+    "C01085": ("38", "Bus 38", "82C8E6"),
+}
+
+# Vocabulaire des stations fictives
+PREFIXES = ["Gare de", "Porte de", "Place de", "Mairie de", "Rue de", "Avenue de", "Pont de", "Parc de", "Collège",
+            "Église de", "Centre commercial", "Lycée", "Hôpital", "Stade", "Cimetière de", "Les Jardins de"]
+PLACES = ["Montreuil", "Vincennes", "Saint-Denis", "Créteil", "Nanterre", "Versailles", "Argenteuil", "Sèvres",
+          "Boulogne", "Ivry", "Vitry", "Pantin", "Bobigny", "Massy", "Évry", "Cergy", "Poissy", "Meaux", "Melun",
+          "Juvisy", "Clichy", "Levallois", "Neuilly", "Colombes", "Asnières", "Bondy", "Rosny", "Noisy-le-Sec",
+          "Villejuif", "Orly", "Rungis", "Choisy", "Champigny", "Saint-Maur", "Nogent", "Fontenay", "Sceaux",
+          "Antony", "Palaiseau", "Orsay", "Gif", "Saclay", "Rambouillet", "Trappes", "Plaisir", "Mantes"]
+SUFFIXES = ["", "", "", "Centre", "Nord", "Sud", "Est", "Ouest", "Église", "Mairie", "RER", "Gare Routière"]
+FILLER_STATIONS = 12_000
+
+# Horaires théoriques : un départ par destination toutes les HEADWAY secondes, de 5 h à 1 h le lendemain
+FIRST_DEPARTURE = 5 * 3600
+LAST_DEPARTURE = 25 * 3600
+HEADWAY = 360
+
+# Flux GTFS-Realtime : courses fictives ajoutées et arrêts desservis par chacune
+FEED_FILLER_TRIPS = 600
+FEED_FILLER_STOPS = 15
+
+
+def _time(offset: float) -> str:
+    return (RECORDED_AT + timedelta(seconds=offset)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def visit(rng: random.Random, line: str, quay: str, destination: str, offset: float) -> dict:
+    journey = f"RATP-SIV:VehicleJourney::{line}.{rng.randrange(10 ** 8)}:LOC"
+    return {
+        "RecordedAtTime": _time(-rng.randrange(5, 60)),
+        "ItemIdentifier": f"RATP-SIV:Item::{rng.randrange(10 ** 9)}:LOC",
+        "MonitoringRef": {"value": f"STIF:StopPoint:Q:{quay}:"},
+        "MonitoredVehicleJourney": {
+            "LineRef": {"value": f"STIF:Line::{line}:"},
+            "OperatorRef": {"value": "RATP-SIV:Operator::RATP.OCTAVIA:"},
+            "FramedVehicleJourneyRef": {"DataFrameRef": {"value": "any"}, "DatedVehicleJourneyRef": journey},
+            "DirectionName": [{"value": destination}],
+            "DestinationRef": {"value": f"STIF:StopPoint:Q:{rng.randrange(10 ** 5, 10 ** 6)}:"},
+            "DestinationName": [{"value": destination}],
+            "JourneyNote": [{"value": rng.choice(["", "", "ZEUS", "NOTA", "ELBA"])}],
+            "MonitoredCall": {
+                "StopPointName": [{"value": "Châtelet les Halles"}],
+                "VehicleAtStop": offset < 60,
+                "DestinationDisplay": [{"value": destination}],
+                "ExpectedArrivalTime": _time(offset),
+                "ExpectedDepartureTime": _time(offset + 30),
+                "DepartureStatus": "onTime",
+                "ArrivalStatus": "onTime",
+            },
+        },
+    }
+
+
+def stop_monitoring(rng: random.Random, lines: list) -> dict:
+    visits = []
+    for line, quay, destinations, count in lines:
+        for destination in destinations:
+            headway = rng.randrange(120, 600)
+            visits += [visit(rng, line, quay, destination, headway * i + rng.randrange(0, 90)) for i in range(count)]
+    rng.shuffle(visits)
+
+    return {"Siri": {"ServiceDelivery": {
+        "ResponseTimestamp": _time(0),
+        "ProducerRef": "IVTR_HUB",
+        "ResponseMessageIdentifier": f"IVTR_HUB:ResponseMessage::{rng.randrange(10 ** 9)}:LOC:",
+        "StopMonitoringDelivery": [{
+            "ResponseTimestamp": _time(0),
+            "Version": "2.0",
+            "Status": "true",
+            "MonitoredStopVisit": visits,
+        }],
+    }}}
+
+
+def _csv(rows: list[list]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue()
+
+
+def _gtfs_time(seconds: int) -> str:
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def make_timetable(stations: dict = STATIONS) -> tuple[list[list], list[list], list[list]]:
+    """Courses théoriques (trips.txt, stop_times.txt, calendar.txt) desservant les quais des réponses"""
+    trips = [['route_id', 'service_id', 'trip_id', 'trip_headsign', 'direction_id']]
+    stop_times = [['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence']]
+    calendar = [['service_id', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday',
+                 'start_date', 'end_date'],
+                ['TOUS', 1, 1, 1, 1, 1, 1, 1, '20250101', '20991231']]
+
+    seen = set()
+    for lines in stations.values():
+        for line, quay, destinations, _ in lines:
+            for direction, destination in enumerate(destinations):
+                if (quay, destination) in seen:
+                    continue
+                seen.add((quay, destination))
+                for departure in range(FIRST_DEPARTURE + 60 * direction, LAST_DEPARTURE, HEADWAY):
+                    trip_id = f"{line}.{len(trips)}"
+                    trips.append([f"IDFM:{line}", 'TOUS', trip_id, destination, direction % 2])
+                    stop_times.append([trip_id, _gtfs_time(departure), _gtfs_time(departure), f"IDFM:{quay}", 1])
+                    # Terminus : aucun départ n'y est proposé
+                    stop_times.append([trip_id, _gtfs_time(departure + 1200), _gtfs_time(departure + 1200),
+                                       f"IDFM:{quay}T{direction}", 2])
+    return trips, stop_times, calendar
+
+
+def _pb_varint(value: int) -> bytes:
+    value &= (1 << 64) - 1
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append(value & 0x7f | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _pb(number: int, value) -> bytes:
+    """Champ protobuf : entier (varint), chaîne ou message déjà encodé"""
+    if isinstance(value, int):
+        return _pb_varint(number << 3) + _pb_varint(value)
+    if isinstance(value, str):
+        value = value.encode()
+    return _pb_varint(number << 3 | 2) + _pb_varint(len(value)) + value
+
+
+def feed_trips(stations: dict = STATIONS, filler: int = FEED_FILLER_TRIPS) -> list[tuple[str, str, list]]:
+    """Courses des flux TripUpdates : (entité, ligne, [(arrêt, décalage en secondes)])
+
+    Les courses des réponses SIRI finissent sur un quai d'une station fictive, qui leur sert de destination.
+    """
+    rng = random.Random('gtfs-rt')
+    trips = []
+    seen = set()
+    for lines in stations.values():
+        for line, quay, destinations, count in lines:
+            for direction, destination in enumerate(destinations):
+                if (quay, destination) in seen:
+                    continue
+                seen.add((quay, destination))
+                headway = rng.randrange(120, 600)
+                for i in range(count):
+                    offset = headway * i + rng.randrange(0, 90)
+                    terminal = f"IDFM:{1900000 + (len(seen) * 7 + direction) % 100}"
+                    trips.append((f"{line}.{len(trips)}", f"IDFM:{line}",
+                                  [(f"IDFM:{quay}", offset), (terminal, offset + 1200)]))
+
+    lines = list(ROUTES)
+    for _ in range(filler):
+        first = rng.randrange(FILLER_STATIONS - FEED_FILLER_STOPS)
+        offset = rng.randrange(-600, 3600)
+        stops = [(f"IDFM:{1900000 + first + i}", offset + 120 * i) for i in range(FEED_FILLER_STOPS)]
+        trips.append((f"F.{len(trips)}", f"IDFM:{rng.choice(lines)}", stops))
+    return trips
+
+
+def trip_updates(trips: list[tuple[str, str, list]], base: float, incremental: bool = False,
+                 deleted: list[str] = ()) -> bytes:
+    """Encode un flux GTFS-Realtime TripUpdates, horaires comptés à partir de `base`"""
+    header = _pb(1, "2.0") + _pb(2, int(incremental)) + _pb(3, int(base))
+    entities = []
+    for entity_id, route_id, stops in trips:
+        trip = _pb(1, _pb(1, entity_id) + _pb(5, route_id))
+        for sequence, (stop_id, offset) in enumerate(stops):
+            event = _pb(1, 0) + _pb(2, int(base + offset))
+            trip += _pb(2, _pb(1, sequence + 1) + _pb(2, event) + _pb(3, event) + _pb(4, stop_id))
+        entities.append(_pb(2, _pb(1, entity_id) + _pb(3, trip + _pb(4, int(base)))))
+    for entity_id in deleted:
+        entities.append(_pb(2, _pb(1, entity_id) + _pb(2, 1)))
+    return _pb(1, header) + b''.join(entities)
+
+
+def differential_trips(trips: list[tuple[str, str, list]]) -> tuple[list[tuple[str, str, list]], list[str]]:
+    """Mise à jour différentielle des courses : les cinq premières supprimées, les cinq suivantes retardées
+    de deux minutes et une course ajoutée"""
+    delayed = [(entity_id, route_id, [(stop_id, offset + 120) for stop_id, offset in stops])
+               for entity_id, route_id, stops in trips[5:10]]
+    entity_id, route_id, stops = trips[10]
+    added = [(f"{entity_id}.bis", route_id, [(stop_id, offset + 60) for stop_id, offset in stops])]
+    return delayed + added, [entity_id for entity_id, _, _ in trips[:5]]
+
+
+def make_gtfs(path: str, filler: int = FILLER_STATIONS) -> None:
+    """Écrit l'archive GTFS de référence"""
+    rng = random.Random('gtfs')
+    stops = [['stop_id', 'stop_name', 'stop_lat', 'stop_lon', 'location_type', 'parent_station']]
+
+    for size, station_id in STATION_IDS.items():
+        stops.append([f"IDFM:{station_id}", STATION_NAMES[size], 48.86, 2.35, 1, ''])
+        for _, quay, _, _ in STATIONS[size]:
+            stops.append([f"IDFM:{quay}", STATION_NAMES[size], 48.86, 2.35, 0, f"IDFM:{station_id}"])
+
+    for i in range(filler):
+        name = " ".join(filter(None, [rng.choice(PREFIXES), rng.choice(PLACES), rng.choice(SUFFIXES)]))
+        stops.append([f"IDFM:{900000 + i}", name, round(48.5 + rng.random(), 6), round(1.9 + rng.random(), 6), 1, ''])
+        stops.append([f"IDFM:{1900000 + i}", name, 48.86, 2.35, 0, f"IDFM:{900000 + i}"])
+
+    routes = [['route_id', 'route_short_name', 'route_long_name', 'route_type', 'route_color']]
+    routes += [[f"IDFM:{line}", short_name, long_name, 1, color] for line, (short_name, long_name, color) in ROUTES.items()]
+
+    # Dédoublonnage : un même quai apparaît dans plusieurs réponses
+    seen = set()
+    stops = [row for row in stops if row[0] not in seen and not seen.add(row[0])]
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('stops.txt', _csv(stops))
+        archive.writestr('routes.txt', _csv(routes))
+        for name, rows in zip(('trips', 'stop_times', 'calendar'), make_timetable()):
+            archive.writestr(f'{name}.txt', _csv(rows))
+
+
+def make_gtfs_database(path: str, filler: int = FILLER_STATIONS) -> None:
+    """Construit la base SQLite de référence avec l'outil d'import"""
+    from database.import_gtfs import SQLiteTarget, import_archive
+
+    archive = f"{path}.zip"
+    make_gtfs(archive, filler)
+    target = SQLiteTarget(path)
+    try:
+        import_archive(archive, target)
+    finally:
+        target.close()
+        os.remove(archive)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--gtfs', help="écrit aussi l'archive GTFS de référence à ce chemin")
+    parser.add_argument('--sqlite', help="construit aussi la base SQLite de référence à ce chemin")
+    args = parser.parse_args()
+
+    if args.gtfs:
+        make_gtfs(args.gtfs)
+    if args.sqlite:
+        make_gtfs_database(args.sqlite)
+
+    os.makedirs(FIXTURES, exist_ok=True)
+    for size, lines in STATIONS.items():
+        payload = stop_monitoring(random.Random(size), lines)
+        with open(os.path.join(FIXTURES, f'siri_{size}.json'), 'w', encoding='utf-8') as file:
+            json.dump(payload, file, ensure_ascii=False, separators=(',', ':'))
+        print(f"siri_{size}.json : {len(payload['Siri']['ServiceDelivery']['StopMonitoringDelivery'][0]['MonitoredStopVisit'])} passages")
+
+    trips = feed_trips()
+    updated, deleted = differential_trips(trips)
+    for name, payload in (('full', trip_updates(trips, RECORDED_AT.timestamp())),
+                          ('diff', trip_updates(updated, RECORDED_AT.timestamp(), True, deleted))):
+        with open(os.path.join(FIXTURES, f'gtfs_rt_{name}.pb'), 'wb') as file:
+            file.write(payload)
+        print(f"gtfs_rt_{name}.pb : {len(payload) // 1024} Ko")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
 import asyncio
+import contextlib
+import time
 import traceback
 from abc import ABC
 from typing import Optional
@@ -9,10 +11,14 @@ from discord.app_commands import Group
 from discord.ext import commands
 from discord.ui import Select, View
 
+from database.database import run_async
 from database.database_users import DatabaseUsers
+from metrics.metrics import observe, timed, timer
+from model.board import LineBoard
 from model.station import Station
 from network.network import Network
 from network.networks import Networks
+from network.scheduler import Priority
 
 
 # Embeds Discord
@@ -44,6 +50,12 @@ EMOJI_CHARGEMENT = "<a:chargement:1345525475912581191>"
 
 IDFM_INDISPONIBILITE = f"{EMOJI_NON} | **Indisponibilité des données fournies**"
 CHARGEMENT = embed_ratp(f"{EMOJI_CHARGEMENT} | **Chargement ...**")
+# Intervalle minimal entre deux modifications d'un tableau de ligne en cours de chargement (limite de Discord)
+EDIT_INTERVAL = 1.0
+# Les temps d'attente sont recalculés à chaque affichage : 🔄 ne redemande les horaires qu'au-delà de
+# RECHARGEMENT_MIN secondes, un changement de page seulement au-delà de RECHARGEMENT_MAX secondes
+RECHARGEMENT_MIN = 30
+RECHARGEMENT_MAX = 300
 CHIFFRES = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
 LIGNES = [["A", "B", "C", "D", "E"],
           ["H", "J", "K", "L", "N", "P", "R", "U"],
@@ -51,6 +63,14 @@ LIGNES = [["A", "B", "C", "D", "E"],
           ["T1", "T2", "T3a", "T3b", "T4", "T5", "T6", "T7", "T8", "T9", "T10", "T11", "T13"]]
 
 
+def favoris_noms(user_id: int, network_name: str) -> list[tuple[str, str]]:
+    """Donne les favoris d'un utilisateur et leur nom, en une requête au plus pour les noms"""
+    favoris = DatabaseUsers().get_favoris(user_id, network_name)
+    noms = Networks.network(network_name).get_stop_names(favoris)
+    return [(favori, noms[favori]) for favori in favoris]
+
+
+@timed('koleka_autocomplete_seconds')
 async def station_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
     """Retourne une liste des choix correspondant à la frappe de l'utilisateur
 
@@ -62,29 +82,42 @@ async def station_autocomplete(interaction: discord.Interaction, current: str) -
     network: Network = Networks.network(network_name)
 
     if len(current) == 0:
-        stations = DatabaseUsers().get_favoris(interaction.user.id, network.name)
-        stations_names = [network.get_stop_name(i).title() for i in stations]
-        stations = ["id:" + i for i in stations]
+        favoris = await run_async(favoris_noms, interaction.user.id, network_name)
+        stations_names = [nom.title() for _, nom in favoris]
+        stations = ["id:" + favori for favori, _ in favoris]
     else:
-        stations = network.get_stations(current)
+        # Les résultats ne sont pas filtrés sur la saisie brute : la recherche (voir database/station_index.py)
+        # rattrape accents, abréviations et fautes de frappe, qu'un test de sous-chaîne écarterait
+        stations = await run_async(network.get_stations, current)
         stations_names = [f"{stop[1].title()}, {stop[2]}" if len(stop) > 14 else stop[1].title() for stop in stations]
         stations = ["id:" + i[0] for i in stations]
 
-    return [
-        app_commands.Choice(name=station, value=stations[i])
-        for i, station in enumerate(stations_names) if current.lower() in station.lower()
-    ]
+    return [app_commands.Choice(name=station, value=stations[i]) for i, station in enumerate(stations_names)]
 
 
 class Horaires(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
-    @commands.Cog.listener()
-    async def on_ready(self):
-        await self.bot.tree.sync()
+    async def cog_load(self):
+        # La synchronisation des commandes est faite une seule fois par koleka.py, si elles ont changé
+        await asyncio.gather(*(network.value.start() for network in Networks))
         print("Module Transport chargé")
 
+    async def cog_unload(self):
+        for network in Networks:
+            await network.value.close()
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Début de la commande, pour la mesure de sa durée (voir cogs/stats.py)
+        interaction.extras['debut'] = time.perf_counter()
+        return True
+
+    async def cog_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if 'debut' in interaction.extras and interaction.command:
+            observe('koleka_command_seconds', time.perf_counter() - interaction.extras['debut'],
+                    command=interaction.command.qualified_name, status='error')
+
     async def choix_ville(self, arrets_choix: list, interaction_choix: discord.Interaction) -> int:
         select = Select()
 
@@ -102,8 +135,8 @@ class Horaires(commands.Cog):
         if "id:" in stop:
             return stop[3:]
 
-        stops = network.get_stations(stop)
-        return stops[0] if stops else None
+        stops = await run_async(network.get_stations, stop)
+        return stops[0][0] if stops else None
 
 
     g_horaires = Group(name='horaires', description='description')
@@ -128,7 +161,7 @@ class Horaires(commands.Cog):
 
         # Si il y a des problèmes au niveau de l'API
         try:
-            station: Station = network.create_station(stop_id)
+            station: Station = await network.create_station(stop_id)
         except Exception:
             traceback.print_exc()
             await affiche_embed(interaction, f"{EMOJI_NON} | **Données indisponibles**")
@@ -140,10 +173,35 @@ class Horaires(commands.Cog):
             return
 
         # Si l'utilisateur a fourni une ligne spécifique, on cherche le numéro de page correspondant à cette ligne
-        num_page = station.get_line_index(network.get_lines(line)[0]) if line else 0
+        lines = await run_async(network.get_lines, line) if line else None
+        num_page = station.get_line_index(lines[0]) if lines else 0
 
         vue = Boutons(interaction, network, station, num_page)
-        await interaction.edit_original_response(embed=station.get_station_embed(num_page), view=vue)
+        embed = station.get_station_embed(num_page)
+        with timer('koleka_discord_seconds', call='edit_original_response'):
+            await interaction.edit_original_response(embed=embed, view=vue)
+
+    @g_horaires.command(name="ligne", description="Horaires de toutes les stations d'une ligne")
+    @app_commands.rename(network_name="réseau")
+    @app_commands.choices(network_name=Networks.choices())
+    @app_commands.rename(line="ligne")
+    @app_commands.describe(line="Nom de la ligne (A, B, 14, T3a ...)")
+    async def ligne(self, interaction: discord.Interaction, network_name: app_commands.Choice[str], line: str):
+        await chargement(interaction)
+
+        network: Network = Networks.network(network_name.value)
+        lines = await run_async(network.get_lines, line)
+        if not lines:
+            await affiche_embed(interaction, f"{EMOJI_NON} | **Ligne non trouvée**")
+            return
+
+        board: LineBoard = await run_async(network.build_board, lines[0])
+        if not board.stations:
+            await affiche_embed(interaction, f"{EMOJI_NON} | **Aucune station connue pour cette ligne**")
+            return
+
+        vue = BoutonsLigne(interaction, network, board)
+        await vue.remplir()
 
     @g_favoris.command(name="ajouter", description="Enregistrer les stations favorites")
     @app_commands.rename(network_name="réseau")
@@ -162,7 +220,7 @@ class Horaires(commands.Cog):
             return
 
         try:
-            DatabaseUsers().add_favori(interaction.user.id, stop_id, network_name.value)
+            await run_async(DatabaseUsers().add_favori, interaction.user.id, stop_id, network_name.value)
         except Exception as e:
             print(e)
             await affiche_embed(interaction, f"{EMOJI_NON} | **Favori déjà ajouté**")
@@ -178,12 +236,18 @@ class Horaires(commands.Cog):
     async def supprimer_favori(self, interaction: discord.Interaction, network_name: app_commands.Choice[str], stop_name: str):
         await chargement(interaction)
 
-        DatabaseUsers().remove_favori(interaction.user.id, stop_name, network_name.value)
+        network: Network = Networks.network(network_name.value)
+        stop_id: str = await self.initialiser_arret(stop_name, network)
 
         try:
-            await affiche_embed(interaction, f"{EMOJI_OUI} | **Favori supprimé**")
+            supprime = await run_async(DatabaseUsers().remove_favori, interaction.user.id, stop_id, network_name.value)
         except Exception as e:
             print(e)
+            supprime = False
+
+        if supprime:
+            await affiche_embed(interaction, f"{EMOJI_OUI} | **Favori supprimé**")
+        else:
             await affiche_embed(interaction, f"{EMOJI_NON} | **Favori invalide ou non existant**")
 
     @g_favoris.command(name="liste", description="Voir votre liste de stations favorites")
@@ -191,10 +255,8 @@ class Horaires(commands.Cog):
     async def voir_favori(self, interaction: discord.Interaction, network_name: app_commands.Choice[str]):
         await chargement(interaction)
 
-        network: Network = Networks.network(network_name.value)
-
-        favoris = DatabaseUsers().get_favoris(interaction.user.id, network_name.value)
-        message = ''.join([f' • {network.get_stop_name(i).title()} \n' for i in favoris]) if favoris else "Aucun favori"
+        favoris = await run_async(favoris_noms, interaction.user.id, network_name.value)
+        message = ''.join([f' • {nom.title()} \n' for _, nom in favoris]) if favoris else "Aucun favori"
         await interaction.edit_original_response(embed=embed_ratp(message))
 
 
@@ -207,30 +269,134 @@ class Boutons(ABC, discord.ui.View):
         self.num_page = num_page
         self.num_direction = 0
         self.max = len(station.lines)
+        self.direct = False
 
     @discord.ui.button(emoji="⬅️", style=discord.ButtonStyle.gray)
     async def page_precedente(self, interaction: discord.Interaction, _: discord.ui.Button):
         self.num_page = (self.num_page - 1) % self.max
-        await self.refresh(interaction)
+        await self.refresh(interaction, RECHARGEMENT_MAX)
 
     @discord.ui.button(emoji="➡️", style=discord.ButtonStyle.grey)
     async def page_suivante(self, interaction: discord.Interaction, _: discord.ui.Button):
         self.num_page = (self.num_page + 1) % self.max
-        await self.refresh(interaction)
+        await self.refresh(interaction, RECHARGEMENT_MAX)
 
     @discord.ui.button(emoji="🔄", style=discord.ButtonStyle.grey)
     async def recharger(self, interaction: discord.Interaction, _: discord.ui.Button):
-        self.station = self.network.create_station(self.station.id)
+        await self.refresh(interaction, RECHARGEMENT_MIN)
+
+    @discord.ui.button(emoji="📡", style=discord.ButtonStyle.grey)
+    async def mode_direct(self, interaction: discord.Interaction, bouton: discord.ui.Button):
+        """Active ou désactive la mise à jour automatique, partagée avec les autres vues de la même station"""
+        self.direct = not self.direct
+        bouton.style = discord.ButtonStyle.green if self.direct else discord.ButtonStyle.grey
+        if self.direct:
+            self.network.live.subscribe(self.station.id, self.pousser, self.station)
+        else:
+            self.network.live.unsubscribe(self.station.id, self.pousser)
+        await interaction.response.defer()
+        self.interaction = interaction
+        with timer('koleka_discord_seconds', call='edit_original_response'):
+            await interaction.edit_original_response(embed=self.station.get_station_embed(self.num_page), view=self)
+
+    async def pousser(self, station: Station):
+        """Affiche les horaires rafraîchis par le mode direct"""
+        self.station = station
+        self.max = max(1, len(station.lines))
+        try:
+            with timer('koleka_discord_seconds', call='edit_original_response'):
+                await self.interaction.edit_original_response(embed=station.get_station_embed(self.num_page))
+        except discord.HTTPException:
+            # Message supprimé ou jeton de l'interaction expiré : le mode direct s'arrête
+            self.direct = False
+            self.network.live.unsubscribe(station.id, self.pousser)
+            raise
+
+    async def refresh(self, interaction: discord.Interaction, max_age: float = RECHARGEMENT_MAX):
+        """Affiche la page courante, en redemandant les horaires s'ils ont plus de max_age secondes"""
+        await interaction.response.defer()
+        # Le jeton de la dernière interaction sert aux modifications du mode direct
+        self.interaction = interaction
+        if self.station.age > max_age:
+            try:
+                self.station = await self.network.create_station(self.station.id, Priority.REFRESH)
+            except Exception as e:
+                # Les horaires déjà connus restent affichés, leurs temps d'attente recalculés
+                print(e)
+            self.max = max(1, len(self.station.lines))
+        embed = self.station.get_station_embed(self.num_page)
+        with timer('koleka_discord_seconds', call='edit_original_response'):
+            await interaction.edit_original_response(embed=embed)
+
+    async def on_timeout(self):
+        if self.direct:
+            self.network.live.unsubscribe(self.station.id, self.pousser)
+        for item in self.children:
+            item.disabled = True
+        await self.interaction.edit_original_response(view=self)
+
+class BoutonsLigne(ABC, discord.ui.View):
+    def __init__(self, interaction: discord.Interaction, network: Network, board: LineBoard):
+        super().__init__(timeout=1200)
+        self.interaction = interaction
+        self.network = network
+        self.board = board
+        self.num_page = 0
+        self.remplissage: Optional[asyncio.Task] = None
+
+    async def remplir(self):
+        """Affiche le tableau au fil des réponses ; un remplissage encore en cours est abandonné"""
+        if self.remplissage is not None:
+            self.remplissage.cancel()
+        remplissage = self.remplissage = asyncio.create_task(self.__remplir(self.board))
+        # Un remplissage annulé par un rechargement ne doit pas interrompre l'interaction qui l'a lancé
+        await asyncio.wait([remplissage])
+        if not remplissage.cancelled():
+            remplissage.result()
+
+    async def __remplir(self, board: LineBoard):
+        """Modifie le message au fil des réponses, en limitant la fréquence des modifications"""
+        derniere = 0.0
+        async with contextlib.aclosing(self.network.fill_board(board)) as remplissage:
+            async for board in remplissage:
+                if board.complete or time.monotonic() - derniere >= EDIT_INTERVAL:
+                    derniere = time.monotonic()
+                    with timer('koleka_discord_seconds', call='edit_original_response'):
+                        await self.interaction.edit_original_response(embed=board.get_board_embed(self.num_page),
+                                                                      view=self)
+
+    @discord.ui.button(emoji="⬅️", style=discord.ButtonStyle.gray)
+    async def page_precedente(self, interaction: discord.Interaction, _: discord.ui.Button):
+        self.num_page = (self.num_page - 1) % self.board.pages
         await self.refresh(interaction)
 
+    @discord.ui.button(emoji="➡️", style=discord.ButtonStyle.grey)
+    async def page_suivante(self, interaction: discord.Interaction, _: discord.ui.Button):
+        self.num_page = (self.num_page + 1) % self.board.pages
+        await self.refresh(interaction)
+
+    @discord.ui.button(emoji="🔄", style=discord.ButtonStyle.grey)
+    async def recharger(self, interaction: discord.Interaction, _: discord.ui.Button):
+        await interaction.response.defer()
+        # Le jeton de la commande expire au bout de 15 minutes : le message est modifié avec celui du bouton
+        self.interaction = interaction
+        self.board = await run_async(self.network.build_board, self.board.line.id)
+        await self.remplir()
+
     async def refresh(self, interaction: discord.Interaction):
         await interaction.response.defer()
-        await interaction.edit_original_response(embed=self.station.get_station_embed(self.num_page))
+        self.interaction = interaction
+        embed = self.board.get_board_embed(self.num_page)
+        with timer('koleka_discord_seconds', call='edit_original_response'):
+            await interaction.edit_original_response(embed=embed)
 
     async def on_timeout(self):
+        if self.remplissage is not None:
+            self.remplissage.cancel()
         for item in self.children:
             item.disabled = True
         await self.interaction.edit_original_response(view=self)
 
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(Horaires(bot))
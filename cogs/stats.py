@@ -0,0 +1,94 @@
+import os
+import time
+from typing import Optional
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from database.database import pool_stats
+from metrics.metrics import METRICS, observe, summary
+from metrics.prometheus import PrometheusExporter
+from metrics.watchdog import LoopWatchdog
+from network.networks import Networks
+
+# Port local du point d'accès Prometheus (désactivé si vide) et seuil de blocage de la boucle d'événements
+METRICS_PORT = os.getenv('METRICS_PORT', '')
+LOOP_LAG_INTERVAL = float(os.getenv('METRICS_LOOP_INTERVAL', '0.5'))
+LOOP_STALL = float(os.getenv('METRICS_LOOP_STALL', '0.25'))
+
+MESSAGE_LENGTH = 1900
+
+
+def _format(stats: dict) -> str:
+    return ', '.join(f"{key}={round(value, 1) if isinstance(value, float) else value}" for key, value in stats.items())
+
+
+class Stats(commands.Cog):
+    """Mesures de performance du bot, réservées au propriétaire"""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.watchdog: Optional[LoopWatchdog] = None
+        self.exporter: Optional[PrometheusExporter] = None
+
+    async def cog_load(self):
+        if not METRICS:
+            return
+        self.watchdog = LoopWatchdog(LOOP_LAG_INTERVAL, LOOP_STALL)
+        self.watchdog.start()
+        if METRICS_PORT:
+            self.exporter = PrometheusExporter(int(METRICS_PORT))
+            await self.exporter.start()
+
+    async def cog_unload(self):
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        if self.exporter is not None:
+            await self.exporter.close()
+
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction: discord.Interaction, command: app_commands.Command):
+        if 'debut' in interaction.extras:
+            observe('koleka_command_seconds', time.perf_counter() - interaction.extras['debut'],
+                    command=command.qualified_name, status='ok')
+
+    def report(self) -> list[str]:
+        lines = [f"Passerelle Discord : {1000 * self.bot.latency:.0f} ms"]
+        if self.watchdog is not None:
+            lines.append(f"Boucle d'événements : retard max {1000 * self.watchdog.max_lag:.1f} ms, "
+                         f"{self.watchdog.stalls} blocage(s)")
+
+        if METRICS:
+            lines.append("")
+            lines.append(f"{'mesure':<60} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+            for name, count, p50, p95, maximum in summary('koleka_'):
+                lines.append(f"{name[7:]:<60} {count:>7} {p50:>9.2f} {p95:>9.2f} {maximum:>9.2f}")
+        else:
+            lines.append("Mesures désactivées (METRICS=1 pour les activer)")
+
+        lines.append("")
+        for network in Networks:
+            for component in ('realtime', 'scheduler', 'poller', 'live'):
+                stats = getattr(network.value, component, None)
+                if stats is not None:
+                    lines.append(f"{network.name} {component} : {_format(stats.stats)}")
+        for name, stats in pool_stats().items():
+            lines.append(f"MySQL {name} : {_format(stats)}")
+        return lines
+
+    @commands.command(name="stats")
+    @commands.is_owner()
+    async def stats(self, ctx: commands.Context):
+        """Affiche les mesures de performance"""
+        message = ""
+        for line in self.report():
+            if len(message) + len(line) > MESSAGE_LENGTH:
+                await ctx.send(f"```\n{message}```")
+                message = ""
+            message += line + "\n"
+        await ctx.send(f"```\n{message}```")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Stats(bot))
@@ -1,6 +1,11 @@
+import asyncio
+import functools
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-import mysql.connector
+from mysql.connector import pooling
 
 # Configuration de la base de données
 DB_USER = os.getenv('MYSQL_USER')
@@ -8,23 +13,132 @@ DB_PASSWORD = os.getenv('MYSQL_PASSWORD')
 DB_HOST = os.getenv('MYSQL_HOST')
 DB_PORT = os.getenv('MYSQL_PORT', '3306')
 
+# Configuration des pools de connexions
+DB_POOL_SIZE = min(int(os.getenv('MYSQL_POOL_SIZE', '8')), pooling.CNX_POOL_MAXSIZE)
+DB_POOL_TIMEOUT = float(os.getenv('MYSQL_POOL_TIMEOUT', '5'))
+DB_POOL_PING_INTERVAL = float(os.getenv('MYSQL_POOL_PING_INTERVAL', '30'))
+# Threads réservés aux traitements longs sans connexion à la base (chargements, instantanés, construction des vues)
+CPU_WORKERS = int(os.getenv('KOLEKA_CPU_WORKERS', str(min(4, os.cpu_count() or 1))))
 
-class Database:
-    def __init__(self, database_name):
-        self._conn = mysql.connector.connect(
+
+class ConnectionPool:
+    """Pool de connexions vers un schéma, avec vérification de santé et statistiques d'utilisation"""
+
+    def __init__(self, database_name: str, size: int = DB_POOL_SIZE):
+        self.__name = database_name
+        self.__size = size
+        self.__pool = pooling.MySQLConnectionPool(
+            pool_name=f"koleka_{database_name}",
+            pool_size=size,
             user=DB_USER,
             password=DB_PASSWORD,
             host=DB_HOST,
             port=DB_PORT,
             database=database_name
         )
-        self._cursor = self._conn.cursor()
+        # Le pool de mysql.connector lève une erreur s'il est vide : on attend plutôt qu'une connexion se libère
+        self.__slots = threading.BoundedSemaphore(size)
+        self.__lock = threading.Lock()
+        # Dernière utilisation de chaque connexion, par identifiant de connexion MySQL
+        self.__last_used: dict[int, float] = {}
+        self.__checked_out = 0
+        self.__acquisitions = 0
+        self.__wait_total = 0.0
+        self.__wait_max = 0.0
+
+    def acquire(self):
+        """Emprunte une connexion au pool, en attendant au plus DB_POOL_TIMEOUT secondes"""
+        start = time.perf_counter()
+        if not self.__slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise pooling.PoolError(f"Aucune connexion disponible pour {self.__name}")
+        waited = time.perf_counter() - start
+
+        try:
+            connection = self.__pool.get_connection()
+            # Vérification de santé pour les connexions restées inactives trop longtemps. Le pool renvoie une nouvelle
+            # enveloppe à chaque emprunt : la connexion est reconnue par son identifiant côté serveur
+            if time.monotonic() - self.__last_used.get(connection.connection_id, 0.0) > DB_POOL_PING_INTERVAL:
+                connection.ping(reconnect=True, attempts=2, delay=0)
+        except Exception:
+            self.__slots.release()
+            raise
+
+        with self.__lock:
+            self.__checked_out += 1
+            self.__acquisitions += 1
+            self.__wait_total += waited
+            self.__wait_max = max(self.__wait_max, waited)
+        return connection
+
+    def release(self, connection) -> None:
+        """Rend une connexion au pool"""
+        self.__last_used[connection.connection_id] = time.monotonic()
+        try:
+            connection.close()
+        finally:
+            with self.__lock:
+                self.__checked_out -= 1
+            self.__slots.release()
+
+    @property
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                'size': self.__size,
+                'checked_out': self.__checked_out,
+                'acquisitions': self.__acquisitions,
+                'wait_avg_ms': 1000 * self.__wait_total / self.__acquisitions if self.__acquisitions else 0.0,
+                'wait_max_ms': 1000 * self.__wait_max,
+            }
+
+
+_POOLS: dict[str, ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+_EXECUTOR = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="database")
+# Un rechargement du référentiel ou l'écriture d'un instantané ne doit pas occuper les threads des requêtes
+_CPU_EXECUTOR = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+
+
+def get_pool(database_name: str) -> ConnectionPool:
+    """Donne le pool associé au schéma, en le créant au premier appel"""
+    pool = _POOLS.get(database_name)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(database_name)
+            if pool is None:
+                pool = _POOLS[database_name] = ConnectionPool(database_name)
+    return pool
+
+
+def pool_stats() -> dict[str, dict]:
+    """Statistiques de chaque pool de connexions"""
+    return {name: pool.stats for name, pool in _POOLS.items()}
+
+
+async def run_async(func, *args, **kwargs):
+    """Exécute un appel bloquant à la base de données sans bloquer la boucle d'événements"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_EXECUTOR, functools.partial(func, *args, **kwargs))
+
+
+async def run_cpu(func, *args, **kwargs):
+    """Exécute un traitement long sans bloquer la boucle d'événements ni les threads de la base de données"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_CPU_EXECUTOR, functools.partial(func, *args, **kwargs))
+
+
+class Database:
+    def __init__(self, database_name):
+        self._pool = get_pool(database_name)
+        self._conn = self._pool.acquire()
+        # Curseur bufferisé : aucun résultat non lu ne doit rester sur une connexion rendue au pool
+        self._cursor = self._conn.cursor(buffered=True)
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.close()
+        self.close(commit=exc_type is None)
 
     @property
     def connection(self):
@@ -38,9 +152,14 @@ class Database:
         self.connection.commit()
 
     def close(self, commit=True):
-        if commit:
-            self.commit()
-        self.connection.close()
+        try:
+            if commit:
+                self.commit()
+            else:
+                self.connection.rollback()
+            self.cursor.close()
+        finally:
+            self._pool.release(self.connection)
 
     def execute(self, sql, params=None):
         self.cursor.execute(sql, params or ())
@@ -53,4 +172,4 @@ class Database:
 
     def query(self, sql, params=None):
         self.cursor.execute(sql, params or ())
-        return self.fetchall()
\ No newline at end of file
+        return self.fetchall()
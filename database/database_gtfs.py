@@ -1,33 +1,47 @@
-from abc import ABC
+from typing import Iterable, Optional
 
 from database.database import Database
+from database.gtfs_backend import (DEFAULT_COLOR, ROUTE_TRIPS_QUERY, TRIP_STATIONS_QUERY, GTFSBackend,
+                                   merge_patterns, route_patterns)
+from metrics.metrics import timed
 
 
-class DatabaseGTFS(ABC):
+def _placeholders(values: list) -> str:
+    return ', '.join(['%s'] * len(values))
+
+
+class DatabaseGTFS(GTFSBackend):
+    """Données GTFS stockées dans un schéma MySQL"""
+
     def __init__(self, schema_name):
         self.__schema_name = schema_name
 
+    @timed('koleka_db_query_seconds', backend='mysql', query='get_stations')
     def get_stations(self, stop_name: str) -> list:
         with Database(self.__schema_name) as database:
             return database.query('''
                 SELECT DISTINCT s.stop_id, s.stop_name, MATCH(s.stop_name) AGAINST (%s IN NATURAL LANGUAGE MODE) AS relevance
                 FROM stops AS s
                 WHERE parent_station IS NULL AND '3' > 0
+                HAVING relevance > 0
                 ORDER BY relevance DESC
                 LIMIT 5''', (stop_name,))
 
-    def get_similar_stations(self, stop_id: str):
+    @timed('koleka_db_query_seconds', backend='mysql', query='get_similar_stations')
+    def get_similar_stations(self, stop_id: str) -> list[str]:
         with Database(self.__schema_name) as database:
-            rows = [i[0] for i in database.query(''' SELECT s.stop_id FROM stops AS s WHERE s.stop_name = (SELECT s2.stop_name FROM stops AS s2 WHERE s2.stop_id = %s)''', (stop_id,))]
+            rows = [i[0] for i in database.query(''' SELECT s.stop_id FROM stops AS s WHERE s.parent_station IS NULL AND s.stop_name = (SELECT s2.stop_name FROM stops AS s2 WHERE s2.stop_id = %s)''', (stop_id,))]
         return rows
 
+    @timed('koleka_db_query_seconds', backend='mysql', query='get_color')
     def get_color(self, line_id: str) -> hex:
         with Database(self.__schema_name) as database:
             database.execute('''SELECT route_color FROM routes as R WHERE route_id = %s''', (line_id,))
             row = database.fetchone()
 
-        return 0x2F3136 if not row else int(row[0], 16)
+        return DEFAULT_COLOR if not row else int(row[0], 16)
 
+    @timed('koleka_db_query_seconds', backend='mysql', query='get_stop_name')
     def get_stop_name(self, stop_id: str) -> str:
         with Database(self.__schema_name) as database:
             database.execute('''SELECT stop_name FROM stops WHERE stop_id = %s;''', (stop_id,))
@@ -35,15 +49,75 @@ class DatabaseGTFS(ABC):
 
         return " " if not row else row[0]
 
+    @timed('koleka_db_query_seconds', backend='mysql', query='get_stop_names')
+    def get_stop_names(self, stop_ids: Iterable[str]) -> dict[str, str]:
+        """Donne le nom de chaque arrêt en une seule requête"""
+        stop_ids = list(set(stop_ids))
+        if not stop_ids:
+            return {}
+
+        with Database(self.__schema_name) as database:
+            rows = database.query(f'''SELECT stop_id, stop_name FROM stops WHERE stop_id IN ({_placeholders(stop_ids)})''', stop_ids)
+
+        names = dict(rows)
+        return {stop_id: names.get(stop_id, " ") for stop_id in stop_ids}
+
+    @timed('koleka_db_query_seconds', backend='mysql', query='get_routes_meta')
+    def get_routes_meta(self, line_ids: Iterable[str]) -> dict[str, tuple[str, int]]:
+        """Donne le nom et la couleur de chaque ligne en une seule requête"""
+        line_ids = list(set(line_ids))
+        if not line_ids:
+            return {}
+
+        with Database(self.__schema_name) as database:
+            rows = database.query(f'''SELECT route_id, route_short_name, route_color FROM routes WHERE route_id IN ({_placeholders(line_ids)})''', line_ids)
+
+        meta = {route_id: (name, int(color, 16) if color else DEFAULT_COLOR) for route_id, name, color in rows}
+        return {line_id: meta.get(line_id, (None, DEFAULT_COLOR)) for line_id in line_ids}
+
+    @timed('koleka_db_query_seconds', backend='mysql', query='get_lines')
     def get_lines(self, line_name: str) -> list[str]:
         with Database(self.__schema_name) as database:
             rows = database.query('''SELECT route_id FROM routes WHERE route_short_name = %s OR route_long_name = %s''', (line_name, line_name,))
 
         return [i[0] for i in rows]
 
+    @timed('koleka_db_query_seconds', backend='mysql', query='get_route_stations')
+    def get_route_stations(self, line_id: str) -> list[str]:
+        with Database(self.__schema_name) as database:
+            trip_ids = route_patterns(database.query(ROUTE_TRIPS_QUERY.format('%s'), (line_id,)))
+            if not trip_ids:
+                return []
+            rows = database.query(TRIP_STATIONS_QUERY.format(', '.join(['%s'] * len(trip_ids))), tuple(trip_ids))
+
+        stations: dict[str, list[str]] = {trip_id: [] for trip_id in trip_ids}
+        for trip_id, station_id in rows:
+            stations[trip_id].append(station_id)
+        return merge_patterns([stations[trip_id] for trip_id in trip_ids])
+
+    @timed('koleka_db_query_seconds', backend='mysql', query='get_line_name')
     def get_line_name(self, line_id: str) -> str:
         with Database(self.__schema_name) as database:
             database.execute('''SELECT route_short_name FROM routes WHERE route_id = %s''', (line_id,))
             row = database.fetchone()
 
         return None if not row else row[0]
+
+    @timed('koleka_db_query_seconds', backend='mysql', query='load_stops')
+    def load_stops(self) -> list[tuple[str, str, Optional[str]]]:
+        with Database(self.__schema_name) as database:
+            return database.query('''SELECT stop_id, stop_name, parent_station FROM stops''')
+
+    @timed('koleka_db_query_seconds', backend='mysql', query='load_routes')
+    def load_routes(self) -> list[tuple[str, str, str, Optional[str]]]:
+        with Database(self.__schema_name) as database:
+            return database.query('''SELECT route_id, route_short_name, route_long_name, route_color FROM routes''')
+
+    @timed('koleka_db_query_seconds', backend='mysql', query='version')
+    def version(self) -> tuple:
+        with Database(self.__schema_name) as database:
+            return tuple(database.query('''
+                SELECT TABLE_NAME, CREATE_TIME, UPDATE_TIME
+                FROM information_schema.TABLES
+                WHERE TABLE_SCHEMA = %s AND TABLE_NAME IN ('stops', 'routes')
+                ORDER BY TABLE_NAME''', (self.__schema_name,)))
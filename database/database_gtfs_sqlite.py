@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+from typing import Iterable, Optional
+
+from database.gtfs_backend import (DEFAULT_COLOR, ROUTE_TRIPS_QUERY, TRIP_STATIONS_QUERY, GTFSBackend,
+                                   merge_patterns, route_patterns)
+from database.station_index import fold
+from metrics.metrics import timed
+
+# Nombre maximal de variables par requête dans les anciennes versions de SQLite
+MAX_VARIABLES = 999
+
+
+def _placeholders(values: list) -> str:
+    return ', '.join(['?'] * len(values))
+
+
+def _chunks(values: list, size: int = MAX_VARIABLES) -> Iterable[list]:
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+class DatabaseGTFSSQLite(GTFSBackend):
+    """Données GTFS stockées dans un fichier SQLite local, produit par database.import_gtfs
+
+    Le fichier est ouvert en lecture seule, avec une connexion par thread.
+    """
+
+    def __init__(self, path: str):
+        self.__path = path
+        self.__local = threading.local()
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def __connection(self) -> sqlite3.Connection:
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(f'file:{self.__path}?mode=ro', uri=True, check_same_thread=False)
+            self.__local.connection = connection
+        return connection
+
+    def __query(self, sql: str, params: Iterable = ()) -> list[tuple]:
+        return self.__connection().execute(sql, tuple(params)).fetchall()
+
+    @timed('koleka_db_query_seconds', backend='sqlite', query='get_stations')
+    def get_stations(self, stop_name: str) -> list:
+        tokens = fold(stop_name).split()
+        if not tokens:
+            return []
+
+        # Chaque mot est recherché comme préfixe ; bm25 renvoie un score négatif, d'autant plus bas que pertinent
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        return self.__query('''
+            SELECT stop_id, stop_name, -bm25(stops_fts) AS relevance
+            FROM stops_fts
+            WHERE stops_fts MATCH ?
+            ORDER BY relevance DESC, length(stop_name)
+            LIMIT 5''', (match,))
+
+    @timed('koleka_db_query_seconds', backend='sqlite', query='get_similar_stations')
+    def get_similar_stations(self, stop_id: str) -> list[str]:
+        rows = self.__query('''SELECT s.stop_id FROM stops AS s WHERE s.parent_station IS NULL AND s.stop_name = (SELECT s2.stop_name FROM stops AS s2 WHERE s2.stop_id = ?)''', (stop_id,))
+        return [i[0] for i in rows]
+
+    @timed('koleka_db_query_seconds', backend='sqlite', query='get_stop_names')
+    def get_stop_names(self, stop_ids: Iterable[str]) -> dict[str, str]:
+        stop_ids = list(set(stop_ids))
+        names = {}
+        for chunk in _chunks(stop_ids):
+            names.update(self.__query(f'''SELECT stop_id, stop_name FROM stops WHERE stop_id IN ({_placeholders(chunk)})''', chunk))
+        return {stop_id: names.get(stop_id, " ") for stop_id in stop_ids}
+
+    @timed('koleka_db_query_seconds', backend='sqlite', query='get_routes_meta')
+    def get_routes_meta(self, line_ids: Iterable[str]) -> dict[str, tuple[str, int]]:
+        line_ids = list(set(line_ids))
+        meta = {}
+        for chunk in _chunks(line_ids):
+            rows = self.__query(f'''SELECT route_id, route_short_name, route_color FROM routes WHERE route_id IN ({_placeholders(chunk)})''', chunk)
+            meta.update((route_id, (name, int(color, 16) if color else DEFAULT_COLOR)) for route_id, name, color in rows)
+        return {line_id: meta.get(line_id, (None, DEFAULT_COLOR)) for line_id in line_ids}
+
+    @timed('koleka_db_query_seconds', backend='sqlite', query='get_lines')
+    def get_lines(self, line_name: str) -> list[str]:
+        # Comme la collation MySQL, la comparaison ignore la casse
+        rows = self.__query('''SELECT route_id FROM routes WHERE route_short_name = ? COLLATE NOCASE OR route_long_name = ? COLLATE NOCASE''', (line_name, line_name))
+        return [i[0] for i in rows]
+
+    @timed('koleka_db_query_seconds', backend='sqlite', query='get_route_stations')
+    def get_route_stations(self, line_id: str) -> list[str]:
+        trip_ids = route_patterns(self.__query(ROUTE_TRIPS_QUERY.format('?'), (line_id,)))
+        stations: dict[str, list[str]] = {trip_id: [] for trip_id in trip_ids}
+        if trip_ids:
+            for trip_id, station_id in self.__query(TRIP_STATIONS_QUERY.format(_placeholders(trip_ids)), trip_ids):
+                stations[trip_id].append(station_id)
+        return merge_patterns([stations[trip_id] for trip_id in trip_ids])
+
+    @timed('koleka_db_query_seconds', backend='sqlite', query='load_stops')
+    def load_stops(self) -> list[tuple[str, str, Optional[str]]]:
+        return self.__query('''SELECT stop_id, stop_name, parent_station FROM stops''')
+
+    @timed('koleka_db_query_seconds', backend='sqlite', query='load_routes')
+    def load_routes(self) -> list[tuple[str, str, str, Optional[str]]]:
+        return self.__query('''SELECT route_id, route_short_name, route_long_name, route_color FROM routes''')
+
+    @timed('koleka_db_query_seconds', backend='sqlite', query='version')
+    def version(self) -> tuple:
+        # Un import réécrit le fichier ou son journal WAL : leurs dates de modification suffisent.
+        # Un journal vide, créé à l'ouverture par les lecteurs, est ignoré.
+        version = []
+        for path in (self.__path, f'{self.__path}-wal'):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                version.append(None)
+                continue
+            version.append((stat.st_mtime_ns, stat.st_size) if stat.st_size else None)
+        return tuple(version)
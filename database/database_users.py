@@ -1,19 +1,107 @@
-from database.database import Database
+import os
+import threading
+import time
 from abc import ABC
+from collections import OrderedDict
+from typing import Optional
+
+from database.database import Database
+from metrics.metrics import timed
+
+# Nombre d'utilisateurs dont les favoris sont gardés en mémoire
+FAVORIS_CACHE_SIZE = int(os.getenv('FAVORIS_CACHE_SIZE', '10000'))
+# Durée de vie (en secondes) des favoris en mémoire : chaque processus du bot a son propre cache,
+# un favori modifié depuis un autre processus y apparaît au plus tard après ce délai
+FAVORIS_CACHE_TTL = float(os.getenv('FAVORIS_CACHE_TTL', '30'))
+
+
+class FavorisCache:
+    """Cache LRU des favoris par utilisateur et par réseau, à durée de vie courte
+
+    Chaque invalidation fait avancer la génération de l'entrée : une liste lue en base avant
+    l'invalidation (voir `generation`) n'est pas enregistrée par `put`.
+    """
+
+    def __init__(self, max_size: int, ttl: float = FAVORIS_CACHE_TTL):
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__entries: OrderedDict[tuple[int, str], tuple[float, tuple[str, ...]]] = OrderedDict()
+        # Génération de chaque entrée invalidée ; celles des entrées oubliées sont résumées par la plus grande
+        self.__generations: OrderedDict[tuple[int, str], int] = OrderedDict()
+        self.__forgotten = 0
+        self.__counter = 0
+        self.__lock = threading.Lock()
+
+    def get(self, user_id: int, network: str) -> Optional[tuple[str, ...]]:
+        with self.__lock:
+            entry = self.__entries.get((user_id, network))
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] >= self.__ttl:
+                del self.__entries[(user_id, network)]
+                return None
+            self.__entries.move_to_end((user_id, network))
+            return entry[1]
+
+    def generation(self, user_id: int, network: str) -> int:
+        """Génération courante, à relever avant de lire les favoris en base"""
+        with self.__lock:
+            return self.__counter
+
+    def put(self, user_id: int, network: str, favoris: list[str], generation: int) -> None:
+        """Enregistre les favoris lus à la génération donnée, sauf si l'entrée a été invalidée depuis"""
+        with self.__lock:
+            if self.__generations.get((user_id, network), self.__forgotten) > generation:
+                return
+            self.__entries[(user_id, network)] = (time.monotonic(), tuple(favoris))
+            self.__entries.move_to_end((user_id, network))
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+
+    def invalidate(self, user_id: int, network: str) -> None:
+        with self.__lock:
+            self.__entries.pop((user_id, network), None)
+            self.__counter += 1
+            self.__generations[(user_id, network)] = self.__counter
+            self.__generations.move_to_end((user_id, network))
+            while len(self.__generations) > self.__max_size:
+                self.__forgotten = self.__generations.popitem(last=False)[1]
+
+
+_FAVORIS = FavorisCache(FAVORIS_CACHE_SIZE)
+
 
 class DatabaseUsers(ABC):
     def __init__(self):
         self.__schema_name = "User"
 
+    @timed('koleka_db_query_seconds', backend='users', query='add_favori')
     def add_favori(self, user_id: int, station_id: str, network: str) -> None:
-        with Database(self.__schema_name) as database:
-            database.execute('''INSERT INTO favorites(user_id, station_id, network) VALUES (%s, %s, %s)''', (user_id, station_id, network))
+        try:
+            with Database(self.__schema_name) as database:
+                database.execute('''INSERT INTO favorites(user_id, station_id, network) VALUES (%s, %s, %s)''', (user_id, station_id, network))
+        finally:
+            _FAVORIS.invalidate(user_id, network)
 
-    def remove_favori(self, user_id: int, station_id: str, network: str) -> None:
-        with Database(self.__schema_name) as database:
-            database.execute('''DELETE FROM favorites WHERE user_id = %s AND station_id = %s''', (user_id, station_id, network,))
+    @timed('koleka_db_query_seconds', backend='users', query='remove_favori')
+    def remove_favori(self, user_id: int, station_id: str, network: str) -> bool:
+        """Supprime un favori et indique s'il existait"""
+        try:
+            with Database(self.__schema_name) as database:
+                database.execute('''DELETE FROM favorites WHERE user_id = %s AND station_id = %s AND network = %s''', (user_id, station_id, network,))
+                return database.cursor.rowcount > 0
+        finally:
+            _FAVORIS.invalidate(user_id, network)
 
+    @timed('koleka_db_query_seconds', backend='users', query='get_favoris')
     def get_favoris(self, user_id: int, network: str) -> list[str]:
+        favoris = _FAVORIS.get(user_id, network)
+        if favoris is not None:
+            return list(favoris)
+
+        generation = _FAVORIS.generation(user_id, network)
         with Database(self.__schema_name) as database:
             rows = database.query('''SELECT station_id from favorites where user_id = %s and network = %s''', (user_id, network,))
-        return [] if not rows else [i[0] for i in rows]
\ No newline at end of file
+        favoris = [] if not rows else [i[0] for i in rows]
+        _FAVORIS.put(user_id, network, favoris, generation)
+        return favoris
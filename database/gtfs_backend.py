@@ -0,0 +1,131 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, Optional
+
+DEFAULT_COLOR = 0x2F3136
+
+# Courses d'une ligne, résumées par leur nombre d'arrêts, leur premier et leur dernier arrêt (dans l'ordre de passage)
+ROUTE_TRIPS_QUERY = '''
+    SELECT ends.trip_id, ends.stops, origin.stop_id, terminus.stop_id
+    FROM (SELECT st.trip_id, COUNT(*) AS stops, MIN(st.stop_sequence) AS origin_sequence,
+                 MAX(st.stop_sequence) AS terminus_sequence
+          FROM trips AS t
+          JOIN stop_times AS st ON st.trip_id = t.trip_id
+          WHERE t.route_id = {0}
+          GROUP BY st.trip_id) AS ends
+    JOIN stop_times AS origin ON origin.trip_id = ends.trip_id AND origin.stop_sequence = ends.origin_sequence
+    JOIN stop_times AS terminus ON terminus.trip_id = ends.trip_id AND terminus.stop_sequence = ends.terminus_sequence'''
+# Stations des courses données, dans l'ordre de passage
+TRIP_STATIONS_QUERY = '''
+    SELECT st.trip_id, COALESCE(s.parent_station, s.stop_id)
+    FROM stop_times AS st
+    JOIN stops AS s ON s.stop_id = st.stop_id
+    WHERE st.trip_id IN ({0})
+    ORDER BY st.trip_id, st.stop_sequence'''
+# Nombre maximal de parcours distincts fusionnés pour une ligne
+ROUTE_PATTERNS_MAX = 24
+
+
+def distinct(values: Iterable[str]) -> list[str]:
+    """Retire les doublons en gardant l'ordre (une station desservie par plusieurs quais consécutifs)"""
+    return list(dict.fromkeys(values))
+
+
+def route_patterns(trips: Iterable[tuple[str, int, str, str]]) -> list[str]:
+    """Choisit une course par parcours distinct, du plus long au plus court
+
+    Deux courses suivent le même parcours si elles ont autant d'arrêts et les mêmes terminus, dans un sens ou
+    dans l'autre : les deux sens d'un même parcours sont confondus, les branches et les services partiels
+    sont distingués.
+    """
+    patterns: dict[tuple[int, str, str], str] = {}
+    for trip_id, count, origin, terminus in trips:
+        patterns.setdefault((count, min(origin, terminus), max(origin, terminus)), trip_id)
+    longest = sorted(patterns.items(), key=lambda pattern: pattern[0][0], reverse=True)
+    return [trip_id for _, trip_id in longest[:ROUTE_PATTERNS_MAX]]
+
+
+def merge_patterns(patterns: list[list[str]]) -> list[str]:
+    """Réunit les stations de plusieurs parcours, dans l'ordre du premier
+
+    Les stations propres à un parcours (une branche) sont placées à la suite de la dernière station
+    commune qui les précède ; un parcours décrit dans l'autre sens est d'abord retourné.
+    """
+    if not patterns:
+        return []
+    # Stations réunies sous forme de liste chaînée (station suivante de chaque station, None pour la tête) :
+    # une branche s'insère sans décaler les autres stations
+    first = distinct(patterns[0])
+    following: dict[Optional[str], Optional[str]] = dict(zip([None] + first, first + [None]))
+
+    def merged() -> Iterator[str]:
+        station = following[None]
+        while station is not None:
+            yield station
+            station = following[station]
+
+    for pattern in patterns[1:]:
+        pattern = distinct(pattern)
+        positions = {station: position for position, station in enumerate(merged())}
+        shared = [positions[station] for station in pattern if station in positions]
+        if len(shared) >= 2 and shared[0] > shared[-1]:
+            pattern.reverse()
+        after = None
+        for station in pattern:
+            if station not in following:
+                following[station] = following[after]
+                following[after] = station
+            after = station
+    return list(merged())
+
+
+class GTFSBackend(ABC):
+    """Source des données GTFS statiques d'un réseau (arrêts et lignes)"""
+
+    @abstractmethod
+    def get_stations(self, stop_name: str) -> list:
+        """Donne les stations les plus pertinentes sous la forme (identifiant, nom, pertinence)"""
+
+    @abstractmethod
+    def get_similar_stations(self, stop_id: str) -> list[str]:
+        """Donne les stations portant le même nom que l'arrêt donné, y compris celle de l'arrêt s'il en est une"""
+
+    @abstractmethod
+    def get_stop_names(self, stop_ids: Iterable[str]) -> dict[str, str]:
+        """Donne le nom de chaque arrêt"""
+
+    @abstractmethod
+    def get_routes_meta(self, line_ids: Iterable[str]) -> dict[str, tuple[str, int]]:
+        """Donne le nom et la couleur de chaque ligne"""
+
+    @abstractmethod
+    def get_lines(self, line_name: str) -> list[str]:
+        """Donne les identifiants des lignes portant ce nom"""
+
+    @abstractmethod
+    def get_route_stations(self, line_id: str) -> list[str]:
+        """Donne les stations desservies par la ligne, dans l'ordre de sa course la plus longue
+
+        Les stations des autres parcours (branches, services partiels) sont ajoutées à la suite
+        de la station commune qui les précède (voir merge_patterns).
+        """
+
+    @abstractmethod
+    def load_stops(self) -> list[tuple[str, str, Optional[str]]]:
+        """Donne tous les arrêts sous la forme (identifiant, nom, station parente)"""
+
+    @abstractmethod
+    def load_routes(self) -> list[tuple[str, str, str, Optional[str]]]:
+        """Donne toutes les lignes sous la forme (identifiant, nom court, nom long, couleur)"""
+
+    @abstractmethod
+    def version(self) -> tuple:
+        """Identifie l'état des données : change à chaque import ou modification"""
+
+    def get_stop_name(self, stop_id: str) -> str:
+        return self.get_stop_names([stop_id])[stop_id]
+
+    def get_color(self, line_id: str) -> hex:
+        return self.get_routes_meta([line_id])[line_id][1]
+
+    def get_line_name(self, line_id: str) -> str:
+        return self.get_routes_meta([line_id])[line_id][0]
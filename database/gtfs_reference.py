@@ -0,0 +1,288 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from database.database import run_async, run_cpu
+from database.gtfs_backend import DEFAULT_COLOR, GTFSBackend
+from database.station_index import StationIndex
+from metrics.metrics import timed
+
+
+class StopRecord:
+    """Arrêt du référentiel GTFS"""
+    __slots__ = ('name', 'is_station')
+
+    def __init__(self, name: str, is_station: bool):
+        self.name = name
+        self.is_station = is_station
+
+
+class RouteRecord:
+    """Ligne du référentiel GTFS"""
+    __slots__ = ('short_name', 'long_name', 'color')
+
+    def __init__(self, short_name: str, long_name: str, color: int):
+        self.short_name = short_name
+        self.long_name = long_name
+        self.color = color
+
+
+class _Tables:
+    """Instantané immuable des tables ; remplacé d'un bloc à chaque rechargement"""
+    __slots__ = ('stops', 'routes', 'routes_by_name', 'stations', 'stations_by_name', 'route_stations', 'version')
+
+    def __init__(self, stops: dict[str, StopRecord], routes: dict[str, RouteRecord], version: str):
+        self.stops = stops
+        self.routes = routes
+        self.routes_by_name: dict[str, list[str]] = {}
+        for route_id, route in routes.items():
+            # Comme la collation de la base, la recherche par nom ignore la casse
+            for name in {route.short_name, route.long_name} - {""}:
+                self.routes_by_name.setdefault(name.casefold(), []).append(route_id)
+
+        self.stations = StationIndex((stop_id, stop.name) for stop_id, stop in stops.items() if stop.is_station)
+        self.stations_by_name: dict[str, list[str]] = {}
+        for stop_id, stop in stops.items():
+            if stop.is_station:
+                self.stations_by_name.setdefault(stop.name, []).append(stop_id)
+        # Seule partie modifiée après le chargement : stations des lignes, renseignées à la demande
+        self.route_stations: dict[str, list[str]] = {}
+        # Version du schéma (voir GTFSBackend.version), sous une forme qui survit aux instantanés
+        self.version = version
+
+    def encode(self) -> bytes:
+        """Encode les tables pour l'instantané, sous forme de listes de champs en JSON
+
+        Les index sont reconstruits à la lecture ; les stations des lignes, renseignées à la demande, sont omises.
+        """
+        return json.dumps({
+            'version': self.version,
+            'stops': [(stop_id, stop.name, stop.is_station) for stop_id, stop in self.stops.items()],
+            'routes': [(route_id, route.short_name, route.long_name, route.color)
+                       for route_id, route in self.routes.items()],
+        }, separators=(',', ':')).encode()
+
+    @classmethod
+    def decode(cls, payload: bytes) -> '_Tables':
+        """Reconstruit des tables encodées par encode ; une valeur mal formée lève ValueError"""
+        try:
+            data = json.loads(payload)
+            stops = {sys.intern(str(stop_id)): StopRecord(_intern(str(name)), bool(is_station))
+                     for stop_id, name, is_station in data['stops']}
+            routes = {sys.intern(str(route_id)): RouteRecord(_intern(str(short_name)), _intern(str(long_name)),
+                                                             int(color))
+                      for route_id, short_name, long_name, color in data['routes']}
+            return cls(stops, routes, str(data['version']))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Référentiel mal formé : {e}") from e
+
+
+def _intern(value: Optional[str]) -> str:
+    return sys.intern(value) if value else ""
+
+
+def _version_key(version: tuple) -> str:
+    # Les versions contiennent des dates (MySQL) : leur représentation, stable, se compare et s'enregistre
+    return repr(version)
+
+
+def _parse_color(value: Optional[str]) -> int:
+    try:
+        return int(value, 16)
+    except (TypeError, ValueError):
+        return DEFAULT_COLOR
+
+
+class GTFSReference(GTFSBackend):
+    """Copie en mémoire des arrêts et des lignes d'une source GTFS
+
+    Tant que la copie n'est pas chargée, les appels sont transmis à la source.
+    """
+
+    def __init__(self, backend: GTFSBackend, name: str):
+        self.__backend = backend
+        self.__name = name
+        self.__tables: Optional[_Tables] = None
+        self.__lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.__tables is not None
+
+    @property
+    def tables(self) -> Optional[_Tables]:
+        return self.__tables
+
+    @property
+    def backend(self) -> GTFSBackend:
+        return self.__backend
+
+    def fetch(self) -> tuple[str, list, list]:
+        """Lit dans la base la version du schéma, les arrêts et les lignes"""
+        return self.__backend.version(), self.__backend.load_stops(), self.__backend.load_routes()
+
+    def load(self) -> None:
+        """Charge les tables en mémoire puis remplace atomiquement l'instantané courant"""
+        self.build(*self.fetch())
+
+    async def reload(self) -> None:
+        """Charge les tables sans bloquer la boucle d'événements : lecture sur les threads de la base de données,
+        construction des index sur ceux des traitements longs"""
+        await run_cpu(self.build, *await run_async(self.fetch))
+
+    def build(self, version: str, stop_rows: list, route_rows: list) -> None:
+        """Construit les tables à partir des lignes lues dans la base et remplace l'instantané courant"""
+        with self.__lock:
+            start = time.perf_counter()
+            stops = {sys.intern(stop_id): StopRecord(_intern(name), not parent)
+                     for stop_id, name, parent in stop_rows}
+            routes = {sys.intern(route_id): RouteRecord(_intern(short_name), _intern(long_name), _parse_color(color))
+                      for route_id, short_name, long_name, color in route_rows}
+            self.__tables = _Tables(stops, routes, _version_key(version))
+
+        print(f"Référentiel GTFS {self.__name} chargé : {len(stops)} arrêts, {len(routes)} lignes, "
+              f"{self.footprint() / 1e6:.1f} Mo en {time.perf_counter() - start:.1f} s")
+
+    def restore(self, payload: bytes) -> None:
+        """Reprend des tables issues d'un instantané (voir _Tables.encode) ; la prochaine vérification les recharge
+        si le schéma a changé"""
+        tables = _Tables.decode(payload)
+        with self.__lock:
+            if self.__tables is None:
+                self.__tables = tables
+        print(f"Référentiel GTFS {self.__name} repris de l'instantané : {len(tables.stops)} arrêts, "
+              f"{len(tables.routes)} lignes")
+
+    def stale(self) -> bool:
+        """Indique si le schéma a changé depuis le dernier chargement"""
+        return self.__tables is None or _version_key(self.__backend.version()) != self.__tables.version
+
+    def refresh(self) -> bool:
+        """Recharge les tables si le schéma a changé depuis le dernier chargement"""
+        if not self.stale():
+            return False
+        self.load()
+        return True
+
+    async def watch(self, interval: float, shared: Callable[[], Optional[bytes]] = None, grace: float = 0.0) -> None:
+        """Surveille le schéma en arrière-plan et recharge les tables lorsqu'il change
+
+        `shared` donne les tables encodées par un autre processus (voir _Tables.encode) : dès qu'elles portent
+        la nouvelle version, elles sont reprises plutôt que relues dans la base. Celle-ci n'est relue
+        qu'après `grace` secondes sans nouvelles tables ; en attendant, elles sont redemandées quatre fois plus souvent.
+        """
+        stale_since = None
+        while True:
+            delay = interval
+            try:
+                if not await run_async(self.stale) or (shared is not None and await self.__adopt(shared)):
+                    stale_since = None
+                else:
+                    stale_since = stale_since or time.monotonic()
+                    if shared is None or time.monotonic() - stale_since >= grace:
+                        await self.reload()
+                        stale_since = None
+                    else:
+                        delay = min(interval, grace / 4)
+            except Exception as e:
+                print(e)
+            await asyncio.sleep(delay)
+
+    async def __adopt(self, shared: Callable[[], Optional[bytes]]) -> bool:
+        """Reprend les tables d'un autre processus si elles correspondent à la version actuelle du schéma"""
+        payload = await run_cpu(shared)
+        if payload is None:
+            return False
+        tables = await run_cpu(_Tables.decode, payload)
+        if tables.version != _version_key(await run_async(self.__backend.version)):
+            return False
+        with self.__lock:
+            self.__tables = tables
+        print(f"Référentiel GTFS {self.__name} repris d'un autre processus : {len(tables.stops)} arrêts, "
+              f"{len(tables.routes)} lignes")
+        return True
+
+    def footprint(self) -> int:
+        """Estime la mémoire occupée par l'instantané courant, en octets"""
+        tables = self.__tables
+        if tables is None:
+            return 0
+
+        seen = set()
+        total = 0
+        for mapping in (tables.stops, tables.routes, tables.routes_by_name):
+            for key, value in mapping.items():
+                objects = [key, value]
+                if isinstance(value, StopRecord):
+                    objects.append(value.name)
+                elif isinstance(value, RouteRecord):
+                    objects += [value.short_name, value.long_name]
+                for obj in objects:
+                    # Les chaînes internées ne sont comptées qu'une fois
+                    if id(obj) not in seen:
+                        seen.add(id(obj))
+                        total += sys.getsizeof(obj)
+            total += sys.getsizeof(mapping)
+        return total
+
+    @timed('koleka_db_query_seconds', backend='reference', query='get_stations')
+    def get_stations(self, stop_name: str) -> list:
+        tables = self.__tables
+        return tables.stations.search(stop_name) if tables else self.__backend.get_stations(stop_name)
+
+    def get_similar_stations(self, stop_id: str) -> list[str]:
+        tables = self.__tables
+        if tables is None:
+            return self.__backend.get_similar_stations(stop_id)
+        record = tables.stops.get(stop_id)
+        return list(tables.stations_by_name.get(record.name, ())) if record else []
+
+    def get_stop_names(self, stop_ids: Iterable[str]) -> dict[str, str]:
+        tables = self.__tables
+        if tables is None:
+            return self.__backend.get_stop_names(stop_ids)
+
+        names = {}
+        for stop_id in stop_ids:
+            record = tables.stops.get(stop_id)
+            names[stop_id] = record.name if record else " "
+        return names
+
+    def get_routes_meta(self, line_ids: Iterable[str]) -> dict[str, tuple[str, int]]:
+        tables = self.__tables
+        if tables is None:
+            return self.__backend.get_routes_meta(line_ids)
+
+        meta = {}
+        for line_id in line_ids:
+            record = tables.routes.get(line_id)
+            meta[line_id] = (record.short_name, record.color) if record else (None, DEFAULT_COLOR)
+        return meta
+
+    def get_lines(self, line_name: str) -> list[str]:
+        tables = self.__tables
+        if tables is None:
+            return self.__backend.get_lines(line_name)
+        return list(tables.routes_by_name.get(line_name.casefold(), ()))
+
+    def get_route_stations(self, line_id: str) -> list[str]:
+        # Les horaires ne sont pas gardés en mémoire : le résultat est mémorisé jusqu'au prochain rechargement
+        tables = self.__tables
+        if tables is None:
+            return self.__backend.get_route_stations(line_id)
+        stations = tables.route_stations.get(line_id)
+        if stations is None:
+            stations = tables.route_stations[line_id] = self.__backend.get_route_stations(line_id)
+        return stations
+
+    def load_stops(self) -> list[tuple[str, str, Optional[str]]]:
+        return self.__backend.load_stops()
+
+    def load_routes(self) -> list[tuple[str, str, str, Optional[str]]]:
+        return self.__backend.load_routes()
+
+    def version(self) -> tuple:
+        return self.__backend.version()
@@ -0,0 +1,242 @@
+"""Import d'une archive GTFS dans un schéma MySQL (ou une base SQLite locale)
+
+Chaque fichier de l'archive est lu en flux et inséré par lots dans une table temporaire ;
+les index sont construits après le chargement, puis les nouvelles tables remplacent les
+anciennes en une seule opération atomique, sans interrompre les lectures.
+
+Utilisation :
+    python -m database.import_gtfs IDFM-gtfs.zip --schema IDFM
+    python -m database.import_gtfs IDFM-gtfs.zip --sqlite gtfs.sqlite
+"""
+import argparse
+import csv
+import io
+import sqlite3
+import time
+import zipfile
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator
+
+BATCH_SIZE = 20_000
+SUFFIX = "_new"
+
+# Colonnes importées par table : (nom, type). Les colonnes absentes du fichier sont laissées à NULL.
+TABLES: dict[str, list[tuple[str, str]]] = {
+    'stops': [('stop_id', 'id'), ('stop_name', 'text'), ('stop_lat', 'real'), ('stop_lon', 'real'),
+              ('location_type', 'int'), ('parent_station', 'id')],
+    'routes': [('route_id', 'id'), ('agency_id', 'id'), ('route_short_name', 'text'), ('route_long_name', 'text'),
+               ('route_type', 'int'), ('route_color', 'color'), ('route_text_color', 'color')],
+    'trips': [('route_id', 'id'), ('service_id', 'id'), ('trip_id', 'id'), ('trip_headsign', 'text'),
+              ('direction_id', 'int')],
+    'stop_times': [('trip_id', 'id'), ('arrival_time', 'time'), ('departure_time', 'time'), ('stop_id', 'id'),
+                   ('stop_sequence', 'int')],
+    'calendar': [('service_id', 'id'), ('monday', 'int'), ('tuesday', 'int'), ('wednesday', 'int'),
+                 ('thursday', 'int'), ('friday', 'int'), ('saturday', 'int'), ('sunday', 'int'),
+                 ('start_date', 'date'), ('end_date', 'date')],
+    'calendar_dates': [('service_id', 'id'), ('date', 'date'), ('exception_type', 'int')],
+}
+
+# Index construits après le chargement : (nom, colonnes, unique)
+INDEXES: dict[str, list[tuple[str, tuple[str, ...], bool]]] = {
+    'stops': [('pk', ('stop_id',), True), ('parent', ('parent_station',), False), ('name', ('stop_name',), False)],
+    'routes': [('pk', ('route_id',), True), ('short_name', ('route_short_name',), False)],
+    'trips': [('pk', ('trip_id',), True), ('route', ('route_id',), False)],
+    'stop_times': [('trip', ('trip_id', 'stop_sequence'), False), ('stop', ('stop_id',), False)],
+    'calendar': [('pk', ('service_id',), True)],
+    'calendar_dates': [('service', ('service_id', 'date'), False)],
+}
+
+
+def read_rows(archive: zipfile.ZipFile, table: str) -> Iterator[tuple]:
+    """Lit un fichier de l'archive en flux et ne garde que les colonnes importées"""
+    columns = [name for name, _ in TABLES[table]]
+    with archive.open(f'{table}.txt') as raw:
+        reader = csv.reader(io.TextIOWrapper(raw, encoding='utf-8-sig', newline=''))
+        header = next(reader)
+        positions = [header.index(column) if column in header else None for column in columns]
+        for row in reader:
+            yield tuple((row[i] or None) if i is not None and i < len(row) else None for i in positions)
+
+
+def batches(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Target(ABC):
+    """Base de destination de l'import"""
+
+    @abstractmethod
+    def create(self, table: str) -> None:
+        """Crée la table temporaire, vide et sans index"""
+
+    @abstractmethod
+    def insert(self, table: str, rows: list[tuple]) -> None:
+        """Insère un lot de lignes dans la table temporaire"""
+
+    @abstractmethod
+    def index(self, table: str) -> None:
+        """Construit les index de la table temporaire"""
+
+    @abstractmethod
+    def swap(self, tables: list[str]) -> None:
+        """Remplace atomiquement les tables par les tables temporaires"""
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+
+class MySQLTarget(Target):
+    TYPES = {'id': 'VARCHAR(128)', 'text': 'VARCHAR(255)', 'real': 'DOUBLE', 'int': 'INT',
+             'color': 'CHAR(6)', 'time': 'CHAR(8)', 'date': 'CHAR(8)'}
+
+    def __init__(self, schema: str):
+        import mysql.connector
+
+        from database.database import DB_HOST, DB_PASSWORD, DB_PORT, DB_USER
+
+        self.__conn = mysql.connector.connect(user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT,
+                                              database=schema, autocommit=False)
+        self.__cursor = self.__conn.cursor()
+        self.__cursor.execute('SET unique_checks = 0, foreign_key_checks = 0')
+
+    def create(self, table: str) -> None:
+        columns = ', '.join(f'{name} {self.TYPES[kind]}' for name, kind in TABLES[table])
+        self.__cursor.execute(f'DROP TABLE IF EXISTS {table}{SUFFIX}')
+        self.__cursor.execute(f'CREATE TABLE {table}{SUFFIX} ({columns}) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4')
+
+    def insert(self, table: str, rows: list[tuple]) -> None:
+        placeholders = ', '.join(['%s'] * len(TABLES[table]))
+        # mysql.connector regroupe les lignes d'un executemany en un seul INSERT multi-valeurs
+        self.__cursor.executemany(f'INSERT INTO {table}{SUFFIX} VALUES ({placeholders})', rows)
+        self.__conn.commit()
+
+    def index(self, table: str) -> None:
+        clauses = [f"ADD {'UNIQUE ' if unique else ''}INDEX idx_{table}_{name} ({', '.join(columns)})"
+                   for name, columns, unique in INDEXES[table]]
+        if table == 'stops':
+            clauses.append('ADD FULLTEXT INDEX ft_stops_stop_name (stop_name)')
+        self.__cursor.execute(f"ALTER TABLE {table}{SUFFIX} {', '.join(clauses)}")
+
+    def swap(self, tables: list[str]) -> None:
+        self.__cursor.execute('SHOW TABLES')
+        existing = {row[0] for row in self.__cursor.fetchall()}
+        renames = []
+        for table in tables:
+            self.__cursor.execute(f'DROP TABLE IF EXISTS {table}_old')
+            if table in existing:
+                renames.append(f'{table} TO {table}_old')
+            renames.append(f'{table}{SUFFIX} TO {table}')
+        # Un seul RENAME TABLE : les lecteurs voient toutes les anciennes tables ou toutes les nouvelles
+        self.__cursor.execute(f"RENAME TABLE {', '.join(renames)}")
+        for table in tables:
+            self.__cursor.execute(f'DROP TABLE IF EXISTS {table}_old')
+
+    def close(self) -> None:
+        self.__conn.close()
+
+
+class SQLiteTarget(Target):
+    TYPES = {'id': 'TEXT', 'text': 'TEXT', 'real': 'REAL', 'int': 'INTEGER', 'color': 'TEXT', 'time': 'TEXT',
+             'date': 'TEXT'}
+
+    def __init__(self, path: str):
+        # Les noms d'index sont globaux dans SQLite : ceux des nouvelles tables ne doivent pas entrer en conflit
+        self.__generation = time.time_ns()
+        self.__conn = sqlite3.connect(path, isolation_level=None)
+        self.__conn.execute('PRAGMA journal_mode = WAL')
+        self.__conn.execute('PRAGMA synchronous = OFF')
+
+    def create(self, table: str) -> None:
+        columns = ', '.join(f'{name} {self.TYPES[kind]}' for name, kind in TABLES[table])
+        self.__conn.execute(f'DROP TABLE IF EXISTS {table}{SUFFIX}')
+        self.__conn.execute(f'CREATE TABLE {table}{SUFFIX} ({columns})')
+
+    def insert(self, table: str, rows: list[tuple]) -> None:
+        placeholders = ', '.join(['?'] * len(TABLES[table]))
+        self.__conn.execute('BEGIN')
+        self.__conn.executemany(f'INSERT INTO {table}{SUFFIX} VALUES ({placeholders})', rows)
+        self.__conn.execute('COMMIT')
+
+    def index(self, table: str) -> None:
+        for name, columns, unique in INDEXES[table]:
+            self.__conn.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX idx_{table}_{name}_{self.__generation} "
+                                f"ON {table}{SUFFIX} ({', '.join(columns)})")
+        if table == 'stops':
+            # Équivalent SQLite de l'index FULLTEXT, limité aux stations
+            self.__conn.execute(f'DROP TABLE IF EXISTS stops_fts{SUFFIX}')
+            self.__conn.execute(f"CREATE VIRTUAL TABLE stops_fts{SUFFIX} USING fts5("
+                                f"stop_id UNINDEXED, stop_name, tokenize = 'unicode61 remove_diacritics 2')")
+            self.__conn.execute(f'INSERT INTO stops_fts{SUFFIX} (stop_id, stop_name) '
+                                f'SELECT stop_id, stop_name FROM stops{SUFFIX} WHERE parent_station IS NULL')
+
+    def swap(self, tables: list[str]) -> None:
+        existing = {row[0] for row in self.__conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'stops' in tables:
+            tables = tables + ['stops_fts']
+
+        self.__conn.execute('BEGIN IMMEDIATE')
+        for table in tables:
+            if table in existing:
+                self.__conn.execute(f'DROP TABLE {table}')
+            self.__conn.execute(f'ALTER TABLE {table}{SUFFIX} RENAME TO {table}')
+        self.__conn.execute('COMMIT')
+
+    def close(self) -> None:
+        self.__conn.execute('PRAGMA optimize')
+        self.__conn.close()
+
+
+def import_archive(path: str, target: Target, tables: list[str] = None) -> None:
+    """Importe les tables demandées (toutes par défaut) présentes dans l'archive"""
+    start = time.perf_counter()
+    total = 0
+
+    with zipfile.ZipFile(path) as archive:
+        names = set(archive.namelist())
+        tables = [table for table in (tables or TABLES) if f'{table}.txt' in names]
+
+        for table in tables:
+            table_start = time.perf_counter()
+            target.create(table)
+            count = 0
+            for batch in batches(read_rows(archive, table), BATCH_SIZE):
+                target.insert(table, batch)
+                count += len(batch)
+            load = time.perf_counter() - table_start
+
+            target.index(table)
+            total += count
+            print(f"{table:>15} : {count:>10} lignes en {load:6.1f} s ({count / max(load, 1e-9):,.0f} lignes/s), "
+                  f"index en {time.perf_counter() - table_start - load:5.1f} s")
+
+    target.swap(tables)
+    duration = time.perf_counter() - start
+    print(f"Import terminé : {total} lignes en {duration:.1f} s ({total / max(duration, 1e-9):,.0f} lignes/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('archive', help="archive GTFS (.zip)")
+    destination = parser.add_mutually_exclusive_group(required=True)
+    destination.add_argument('--schema', help="schéma MySQL de destination")
+    destination.add_argument('--sqlite', help="fichier SQLite de destination")
+    parser.add_argument('--tables', nargs='*', choices=list(TABLES), help="tables à importer (toutes par défaut)")
+    args = parser.parse_args()
+
+    target = SQLiteTarget(args.sqlite) if args.sqlite else MySQLTarget(args.schema)
+    try:
+        import_archive(args.archive, target, args.tables)
+    finally:
+        target.close()
+
+
+if __name__ == '__main__':
+    main()
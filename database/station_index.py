@@ -0,0 +1,134 @@
+import heapq
+import re
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import Iterable
+
+SEPARATORS = re.compile(r"[^0-9a-z]+")
+PREFIX_CACHE_LENGTH = 2
+# Stations les mieux notées gardées pour chaque préfixe très court, saisi seul
+PREFIX_CACHE_CANDIDATES = 50
+ABBREVIATIONS = {'st': 'saint', 'ste': 'sainte', 'pte': 'porte', 'gal': 'general', 'pl': 'place', 'av': 'avenue'}
+
+
+def fold(text: str) -> str:
+    """Met une chaîne en minuscules, sans accents ni ponctuation"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return SEPARATORS.sub(' ', text.casefold()).strip()
+
+
+def trigrams(text: str) -> set[str]:
+    """Découpe une chaîne normalisée en trigrammes, bornes de mots comprises"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class StationIndex:
+    """Index de recherche en mémoire sur les noms de stations
+
+    La recherche se fait par préfixe sur chaque mot saisi ; les fautes de frappe sont rattrapées
+    par une recherche par trigrammes lorsqu'aucun nom ne contient tous les mots.
+    """
+
+    def __init__(self, stations: Iterable[tuple[str, str]]):
+        self.__ids: list[str] = []
+        self.__names: list[str] = []
+        self.__folded: list[str] = []
+        postings: dict[str, array] = {}
+        grams: dict[str, array] = {}
+
+        for i, (station_id, name) in enumerate(stations):
+            folded = fold(name)
+            self.__ids.append(station_id)
+            self.__names.append(name)
+            self.__folded.append(folded)
+            for token in set(folded.split()):
+                postings.setdefault(sys.intern(token), array('I')).append(i)
+            for gram in trigrams(folded):
+                grams.setdefault(gram, array('I')).append(i)
+
+        # Vocabulaire trié pour trouver tous les mots commençant par un préfixe par dichotomie
+        self.__vocabulary: list[str] = sorted(postings)
+        self.__postings: list[array] = [postings[token] for token in self.__vocabulary]
+        self.__exact: dict[str, array] = postings
+        self.__trigrams: dict[str, array] = grams
+
+        # Les préfixes très courts correspondent à beaucoup de mots : leurs résultats sont précalculés
+        self.__short_prefixes: dict[str, frozenset[int]] = {}
+        for token, stations_ids in postings.items():
+            for length in range(1, min(PREFIX_CACHE_LENGTH, len(token)) + 1):
+                self.__short_prefixes.setdefault(token[:length], set()).update(stations_ids)
+        self.__short_prefixes = {prefix: frozenset(ids) for prefix, ids in self.__short_prefixes.items()}
+        # Saisi seul, un préfixe très court correspond à des milliers de stations : leur classement ne dépend
+        # que du préfixe, il est fait une fois pour toutes
+        self.__short_ranked: dict[str, array] = {
+            prefix: array('I', (i for _, i in heapq.nlargest(PREFIX_CACHE_CANDIDATES,
+                                                             self.__scores(ids, [prefix], prefix))))
+            for prefix, ids in self.__short_prefixes.items()}
+
+    def __len__(self) -> int:
+        return len(self.__ids)
+
+    def __prefix_matches(self, prefix: str) -> frozenset[int] | set[int]:
+        """Donne les stations dont un des mots commence par le préfixe"""
+        if len(prefix) <= PREFIX_CACHE_LENGTH:
+            return self.__short_prefixes.get(prefix, frozenset())
+
+        matches = set()
+        i = bisect_left(self.__vocabulary, prefix)
+        while i < len(self.__vocabulary) and self.__vocabulary[i].startswith(prefix):
+            matches.update(self.__postings[i])
+            i += 1
+        return matches
+
+    def __scores(self, matches: Iterable[int], tokens: list[str], query: str) -> Iterable[tuple[float, int]]:
+        """Note les stations : mot complet > préfixe de mot, bonus si le nom commence par la saisie"""
+        exact = [frozenset(self.__exact.get(token, ())) for token in tokens]
+        base = float(len(tokens))
+        for i in matches:
+            folded = self.__folded[i]
+            score = base + sum(i in words for words in exact)
+            if folded.startswith(query):
+                score += 1.0
+            # À pertinence égale, les noms les plus courts sont les plus proches de la saisie
+            yield score - len(folded) / 1000, i
+
+    def search(self, query: str, limit: int = 5) -> list[tuple[str, str, float]]:
+        """Donne les stations les plus pertinentes sous la forme (identifiant, nom, pertinence)"""
+        query = fold(query)
+        tokens = query.split()
+        if not tokens:
+            return []
+        # Le dernier mot peut être en cours de frappe : seuls les mots complets sont développés
+        tokens = [ABBREVIATIONS.get(token, token) for token in tokens[:-1]] + tokens[-1:]
+
+        ranked = self.__short_ranked.get(query) if len(tokens) == 1 else None
+        if ranked is not None and limit <= PREFIX_CACHE_CANDIDATES:
+            return [(self.__ids[i], self.__names[i], score)
+                    for score, i in heapq.nlargest(limit, self.__scores(ranked, tokens, query))]
+
+        # Intersection en commençant par le mot le plus sélectif
+        candidates = sorted((self.__prefix_matches(token) for token in tokens), key=len)
+        matches = set(candidates[0]).intersection(*candidates[1:])
+
+        if matches:
+            scored = self.__scores(matches, tokens, query)
+        else:
+            scored = self.__fuzzy(query)
+
+        return [(self.__ids[i], self.__names[i], score)
+                for score, i in heapq.nlargest(limit, scored)]
+
+    def __fuzzy(self, query: str) -> Iterable[tuple[float, int]]:
+        """Classe les stations par proportion de trigrammes communs avec la saisie"""
+        query_grams = trigrams(query)
+        counts: dict[int, int] = {}
+        for gram in query_grams:
+            for i in self.__trigrams.get(gram, ()):
+                counts[i] = counts.get(i, 0) + 1
+
+        threshold = len(query_grams) / 3
+        return ((count / len(query_grams), i) for i, count in counts.items() if count >= threshold)
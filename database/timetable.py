@@ -0,0 +1,265 @@
+"""Index des horaires théoriques, construit à partir des tables GTFS stop_times, trips et calendar
+
+Les départs de chaque station sont regroupés par (quai, ligne, destination) et triés : chaque groupe est
+une plage contiguë d'un tableau d'entiers (secondes depuis le début du jour de service), accompagné du
+service de chaque départ. Le fichier est projeté en mémoire au démarrage ; une recherche dichotomique
+suffit ensuite pour trouver les prochains départs d'une station.
+
+Format : en-tête `!4sQQQ` (signature, nombre de départs, position et longueur des métadonnées), tableau
+des heures (uint32), tableau des services (uint32), puis les métadonnées en JSON (services et groupes).
+Les tableaux sont écrits dans l'ordre des octets de la machine qui construit l'index.
+
+Utilisation :
+    python -m database.timetable --sqlite gtfs.sqlite --output IDFM.timetable
+    python -m database.timetable --schema IDFM --output IDFM.timetable
+"""
+import argparse
+import bisect
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import time
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+MAGIC = b'KTT1'
+HEADER = struct.Struct('!4sQQQ')
+ITEM_SIZE = 4
+
+# Fuseau horaire des heures GTFS (agency_timezone)
+TIMEZONE = ZoneInfo(os.getenv('GTFS_TIMEZONE', 'Europe/Paris'))
+
+# Départs d'un même quai, d'une même ligne et vers une même destination, triés par station ; le terminus
+# de chaque course (dernier arrêt, calculé une fois par course) n'est pas un départ
+DEPARTURES_QUERY = '''
+    SELECT COALESCE(s.parent_station, s.stop_id), st.stop_id, t.route_id, COALESCE(t.trip_headsign, ''),
+           COALESCE(st.departure_time, st.arrival_time), t.service_id
+    FROM stop_times AS st
+    JOIN trips AS t ON t.trip_id = st.trip_id
+    JOIN stops AS s ON s.stop_id = st.stop_id
+    JOIN (SELECT trip_id, MAX(stop_sequence) AS last FROM stop_times GROUP BY trip_id) AS ends
+        ON ends.trip_id = st.trip_id
+    WHERE st.stop_sequence < ends.last
+    ORDER BY 1, 2, 3, 4'''
+CALENDAR_QUERY = '''SELECT service_id, monday, tuesday, wednesday, thursday, friday, saturday, sunday,
+                           start_date, end_date FROM calendar'''
+CALENDAR_DATES_QUERY = 'SELECT service_id, date, exception_type FROM calendar_dates'
+
+
+def parse_time(value: str) -> int:
+    """Convertit une heure GTFS (« 25:10:00 » pour 1 h 10 le lendemain) en secondes"""
+    hours, minutes, seconds = value.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def service_day_start(day: date) -> float:
+    """Origine des heures GTFS d'un jour de service : midi moins douze heures, heure locale"""
+    return datetime(day.year, day.month, day.day, 12, tzinfo=TIMEZONE).timestamp() - 43200
+
+
+def _optional_rows(cursor, query: str) -> list[tuple]:
+    """Lignes d'une table facultative du GTFS (calendar ou calendar_dates peut manquer)"""
+    try:
+        cursor.execute(query)
+    except Exception as e:
+        print(e)
+        return []
+    return cursor.fetchall()
+
+
+def build(connection, output: str) -> None:
+    """Construit l'index à partir d'une connexion DB-API et l'écrit de façon atomique"""
+    start = time.perf_counter()
+    services: dict[str, int] = {}
+    calendar: dict[int, list] = {}
+    added: dict[str, list[int]] = {}
+    removed: dict[str, list[int]] = {}
+
+    def service_index(service_id: str) -> int:
+        return services.setdefault(service_id, len(services))
+
+    cursor = connection.cursor()
+    for service_id, *days, start_date, end_date in _optional_rows(cursor, CALENDAR_QUERY):
+        mask = sum(1 << weekday for weekday, running in enumerate(days) if int(running))
+        calendar[service_index(service_id)] = [mask, start_date, end_date]
+    for service_id, day, exception_type in _optional_rows(cursor, CALENDAR_DATES_QUERY):
+        (added if int(exception_type) == 1 else removed).setdefault(day, []).append(service_index(service_id))
+
+    times = array('I')
+    service_ids = array('I')
+    groups: dict[str, list] = {}
+    current = None
+    entries: list[tuple[int, int]] = []
+
+    def flush() -> None:
+        if not entries:
+            return
+        station, stop_id, route_id, headsign = current
+        entries.sort()
+        groups.setdefault(station, []).append([stop_id, route_id, headsign, len(times), len(entries)])
+        times.extend(entry[0] for entry in entries)
+        service_ids.extend(entry[1] for entry in entries)
+        entries.clear()
+
+    cursor.execute(DEPARTURES_QUERY)
+    for station, stop_id, route_id, headsign, departure_time, service_id in cursor:
+        if departure_time is None:
+            continue
+        key = (station, stop_id, route_id, headsign)
+        if key != current:
+            flush()
+            current = key
+        entries.append((parse_time(departure_time), service_index(service_id)))
+    flush()
+    cursor.close()
+
+    metadata = json.dumps({'services': list(services), 'calendar': calendar, 'added': added, 'removed': removed,
+                           'groups': groups}, separators=(',', ':')).encode()
+    temporary = f"{output}.tmp"
+    with open(temporary, 'wb') as file:
+        offset = HEADER.size + 2 * ITEM_SIZE * len(times)
+        file.write(HEADER.pack(MAGIC, len(times), offset, len(metadata)))
+        times.tofile(file)
+        service_ids.tofile(file)
+        file.write(metadata)
+    # Les processus en cours gardent l'ancien fichier projeté jusqu'à leur prochain chargement
+    os.replace(temporary, output)
+
+    print(f"Index théorique : {len(times)} départs, {len(groups)} stations, {len(services)} services, "
+          f"{os.path.getsize(output) / 1e6:.1f} Mo en {time.perf_counter() - start:.1f} s")
+
+
+class Timetable:
+    """Index des horaires théoriques projeté en mémoire"""
+
+    def __init__(self, path: str):
+        self.__path = path
+        with open(path, 'rb') as file:
+            self.__mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, offset, length = HEADER.unpack_from(self.__mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} n'est pas un index d'horaires théoriques")
+        view = memoryview(self.__mmap)
+        self.__times = view[HEADER.size:HEADER.size + ITEM_SIZE * count].cast('I')
+        self.__services = view[HEADER.size + ITEM_SIZE * count:offset].cast('I')
+
+        metadata = json.loads(bytes(view[offset:offset + length]))
+        self.__service_names: list[str] = metadata['services']
+        self.__calendar: dict[int, list] = {int(index): value for index, value in metadata['calendar'].items()}
+        self.__added: dict[str, list[int]] = metadata['added']
+        self.__removed: dict[str, list[int]] = metadata['removed']
+        self.__groups: dict[str, list[list]] = metadata['groups']
+        # Services circulant chaque jour, calculés une fois par jour de service
+        self.__active: dict[date, bytearray] = {}
+
+    def __len__(self) -> int:
+        return len(self.__times)
+
+    def __contains__(self, station_id: str) -> bool:
+        return station_id in self.__groups
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def active_services(self, day: date) -> bytearray:
+        """Services circulant le jour donné, sous la forme d'un masque indexé par service"""
+        active = self.__active.get(day)
+        if active is not None:
+            return active
+
+        key = day.strftime('%Y%m%d')
+        active = bytearray(len(self.__service_names))
+        for index, (mask, start_date, end_date) in self.__calendar.items():
+            if mask >> day.weekday() & 1 and start_date <= key <= end_date:
+                active[index] = 1
+        for index in self.__added.get(key, ()):
+            active[index] = 1
+        for index in self.__removed.get(key, ()):
+            active[index] = 0
+
+        if len(self.__active) > 4:
+            self.__active.clear()
+        self.__active[day] = active
+        return active
+
+    def departures(self, station_id: str, now: float, horizon: float = 3600,
+                   limit: int = 3) -> list[tuple[str, str, str, float]]:
+        """Prochains départs théoriques d'une station, sous la forme (quai, ligne, destination, horodatage)
+
+        Au plus `limit` départs par groupe, dans les `horizon` secondes qui suivent. Les départs après minuit
+        des services de la veille (heures GTFS au-delà de 24 h) sont aussi pris en compte.
+        """
+        groups = self.__groups.get(station_id)
+        if not groups:
+            return []
+
+        today = datetime.fromtimestamp(now, TIMEZONE).date()
+        days = []
+        for day in (today - timedelta(days=1), today):
+            origin = service_day_start(day)
+            days.append((origin, now - origin, self.active_services(day)))
+
+        times = self.__times
+        services = self.__services
+        departures = []
+        for stop_id, route_id, headsign, offset, count in groups:
+            found = []
+            for origin, elapsed, active in days:
+                end = offset + count
+                i = bisect.bisect_left(times, elapsed, offset, end)
+                while i < end and times[i] <= elapsed + horizon:
+                    if active[services[i]]:
+                        found.append(origin + times[i])
+                    i += 1
+            found.sort()
+            departures.extend((stop_id, route_id, headsign, timestamp) for timestamp in found[:limit])
+        return departures
+
+    def close(self) -> None:
+        self.__times.release()
+        self.__services.release()
+        self.__mmap.close()
+
+
+def timetable(path: Optional[str]) -> Optional[Timetable]:
+    """Charge l'index donné, s'il existe"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return Timetable(path)
+    except (OSError, ValueError) as e:
+        print(e)
+        return None
+
+
+def _mysql_connection(schema: str):
+    import mysql.connector
+
+    from database.database import DB_HOST, DB_PASSWORD, DB_PORT, DB_USER
+
+    return mysql.connector.connect(user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT, database=schema)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--schema', help="schéma MySQL source")
+    source.add_argument('--sqlite', help="fichier SQLite source")
+    parser.add_argument('--output', required=True, help="fichier d'index à écrire")
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.sqlite) if args.sqlite else _mysql_connection(args.schema)
+    try:
+        build(connection, args.output)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
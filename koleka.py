@@ -1,24 +1,96 @@
+import asyncio
+import hashlib
+import json
 import os
 import random
+import time
 
 import discord
+import yarl
 from discord.ext import commands
 
-bot = commands.Bot(command_prefix="k!", intents=discord.Intents.all())
+DEMARRAGE = time.perf_counter()
+
+# Répartition des shards : lancé par supervisor.py, le processus ne gère que les shards qui lui sont attribués
+SHARD_COUNT = os.getenv('KOLEKA_SHARD_COUNT')
+SHARD_IDS = os.getenv('KOLEKA_SHARD_IDS')
+# Seul le processus principal synchronise les commandes
+PRIMARY = os.getenv('KOLEKA_PRIMARY', '1') == '1'
+
+# Empreinte des commandes envoyées à Discord lors de la dernière synchronisation
+TREE_HASH_FILE = os.getenv('KOLEKA_TREE_HASH_FILE', '.tree_hash')
+
+# Adresses de l'API et de la passerelle Discord, remplaçables pour les tests (voir benchmarks/fake_discord.py)
+DISCORD_API_URL = os.getenv('DISCORD_API_URL')
+DISCORD_GATEWAY_URL = os.getenv('DISCORD_GATEWAY_URL')
+
+if DISCORD_API_URL:
+    discord.http.Route.BASE = DISCORD_API_URL
+if DISCORD_GATEWAY_URL:
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(DISCORD_GATEWAY_URL)
+
+# Affichage du « Joue à ... », envoyé dès l'identification auprès de la passerelle
+GAMES = ["Koleka Flight Simulator", "Koleka Truck Simulator", "Koleka Cooking Simulator", "Koleka Driving School", "Koleka For Speed"]
+ACTIVITY = discord.Game(random.choice(GAMES))
+
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(command_prefix="k!", intents=discord.Intents.all(), activity=ACTIVITY,
+                                  shard_count=int(SHARD_COUNT),
+                                  shard_ids=[int(i) for i in SHARD_IDS.split(',')] if SHARD_IDS else None)
+else:
+    bot = commands.Bot(command_prefix="k!", intents=discord.Intents.all(), activity=ACTIVITY)
+
+
+def phase(name: str, start: float) -> None:
+    """Affiche la durée d'une étape du démarrage"""
+    print(f"Démarrage : {name} en {1000 * (time.perf_counter() - start):.0f} ms")
+
+
+def tree_hash() -> str:
+    """Empreinte des définitions des commandes, telles qu'elles seraient envoyées à Discord"""
+    definitions = sorted((command.to_dict(bot.tree) for command in bot.tree.get_commands()),
+                         key=lambda command: (command['name'], command.get('type', 1)))
+    payload = json.dumps([bot.application_id, definitions], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def sync_tree() -> bool:
+    """Synchronise les commandes si elles ont changé depuis la dernière synchronisation"""
+    digest = tree_hash()
+    try:
+        with open(TREE_HASH_FILE) as file:
+            if file.read().strip() == digest:
+                return False
+    except OSError:
+        pass
+
+    await bot.tree.sync()
+    with open(TREE_HASH_FILE, 'w') as file:
+        file.write(digest)
+    return True
+
+
+@bot.event
+async def setup_hook():
+    # Appelé une seule fois, après la connexion à l'API et avant la passerelle : les reconnexions ne rechargent rien
+    phase("connexion à l'API", DEMARRAGE)
+
+    start = time.perf_counter()
+    extensions = [f'cogs.{file[:-3]}' for file in sorted(os.listdir('./cogs')) if file.endswith('.py')]
+    await asyncio.gather(*(bot.load_extension(extension) for extension in extensions))
+    phase(f"chargement des cogs ({len(extensions)})", start)
+
+    if PRIMARY:
+        start = time.perf_counter()
+        synced = await sync_tree()
+        phase("synchronisation des commandes" if synced else "commandes inchangées", start)
+
 
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user} (ID: {bot.user.id})')
     print('------')
-
-    # Affichage du « Joue à ... »
-    games = ["Koleka Flight Simulator", "Koleka Truck Simulator", "Koleka Cooking Simulator", "Koleka Driving School", "Koleka For Speed"]
-    await bot.change_presence(activity=discord.Game(random.choice(games)))
-
-    # Chargement des cogs
-    for file in os.listdir('./cogs'):
-        if file.endswith('.py'):
-            await bot.load_extension(f'cogs.{file[:-3]}')
+    phase("passerelle prête", DEMARRAGE)
 
 
-bot.run(os.getenv('DISCORD_TOKEN'))
\ No newline at end of file
+bot.run(os.getenv('DISCORD_TOKEN'))
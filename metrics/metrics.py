@@ -0,0 +1,234 @@
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Optional
+
+# Les mesures ne coûtent presque rien lorsqu'elles sont désactivées : les décorateurs rendent alors la
+# fonction d'origine et les chronomètres sont un contexte vide partagé
+METRICS = os.getenv('METRICS', '0') == '1'
+
+# Bornes (en secondes) des histogrammes de latence
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Histogramme cumulable de durées, au format Prometheus"""
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.__buckets = buckets
+        self.__counts = [0] * (len(buckets) + 1)
+        self.__sum = 0.0
+        self.__max = 0.0
+        self.__lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.__buckets, value)
+        with self.__lock:
+            self.__counts[i] += 1
+            self.__sum += value
+            if value > self.__max:
+                self.__max = value
+
+    def snapshot(self) -> tuple[list[int], float, float]:
+        """Donne les effectifs par intervalle, la somme et le maximum"""
+        with self.__lock:
+            return list(self.__counts), self.__sum, self.__max
+
+    @property
+    def buckets(self) -> tuple[float, ...]:
+        return self.__buckets
+
+    def quantile(self, q: float) -> float:
+        """Estime un quantile par interpolation linéaire dans l'intervalle qui le contient"""
+        counts, _, maximum = self.snapshot()
+        total = sum(counts)
+        if not total:
+            return 0.0
+
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                lower = self.__buckets[i - 1] if i else 0.0
+                upper = self.__buckets[i] if i < len(self.__buckets) else maximum
+                return min(maximum, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return maximum
+
+
+class Counter:
+    __slots__ = ('value', '__lock')
+
+    def __init__(self):
+        self.value = 0
+        self.__lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self.__lock:
+            self.value += amount
+
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Registry:
+    """Ensemble des mesures, identifiées par leur nom et leurs étiquettes"""
+
+    def __init__(self):
+        self.__histograms: dict[tuple[str, Labels], Histogram] = {}
+        self.__counters: dict[tuple[str, Labels], Counter] = {}
+        self.__lock = threading.Lock()
+
+    def histogram(self, name: str, **labels: str) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.__histograms.get(key)
+        if histogram is None:
+            with self.__lock:
+                histogram = self.__histograms.setdefault(key, Histogram())
+        return histogram
+
+    def counter(self, name: str, **labels: str) -> Counter:
+        key = (name, tuple(sorted(labels.items())))
+        counter = self.__counters.get(key)
+        if counter is None:
+            with self.__lock:
+                counter = self.__counters.setdefault(key, Counter())
+        return counter
+
+    @property
+    def histograms(self) -> dict[tuple[str, Labels], Histogram]:
+        return dict(self.__histograms)
+
+    @property
+    def counters(self) -> dict[tuple[str, Labels], Counter]:
+        return dict(self.__counters)
+
+
+REGISTRY = Registry()
+
+
+class _Timer:
+    """Chronomètre qui alimente un histogramme à la sortie du bloc"""
+    __slots__ = ('__histogram', '__start')
+
+    def __init__(self, histogram: Histogram):
+        self.__histogram = histogram
+
+    def __enter__(self):
+        self.__start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.__histogram.observe(time.perf_counter() - self.__start)
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+def timer(name: str, **labels: str):
+    """Chronomètre un bloc `with` lorsque les mesures sont activées"""
+    if not METRICS:
+        return _NO_TIMER
+    return _Timer(REGISTRY.histogram(name, **labels))
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    if METRICS:
+        REGISTRY.histogram(name, **labels).observe(value)
+
+
+def increment(name: str, amount: int = 1, **labels: str) -> None:
+    if METRICS:
+        REGISTRY.counter(name, **labels).inc(amount)
+
+
+def timed(name: str, **labels: str) -> Callable:
+    """Décorateur chronométrant chaque appel d'une fonction, synchrone ou asynchrone"""
+    def decorator(function: Callable) -> Callable:
+        if not METRICS:
+            return function
+        histogram = REGISTRY.histogram(name, **labels)
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+        return wrapper
+
+    return decorator
+
+
+def summary(prefix: Optional[str] = None) -> list[tuple[str, int, float, float, float]]:
+    """Résumé des histogrammes : (nom et étiquettes, nombre, médiane, p95, maximum), durées en millisecondes"""
+    rows = []
+    for (name, labels), histogram in sorted(REGISTRY.histograms.items()):
+        if prefix and not name.startswith(prefix):
+            continue
+        counts, _, maximum = histogram.snapshot()
+        if not any(counts):
+            continue
+        label = ','.join(value for _, value in labels)
+        rows.append((f"{name}{{{label}}}" if label else name, sum(counts), 1000 * histogram.quantile(0.5),
+                     1000 * histogram.quantile(0.95), 1000 * maximum))
+    return rows
+
+
+def _labels(labels: Labels, extra: str = '') -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return f"{{{','.join(parts)}}}" if parts else ''
+
+
+def render_prometheus() -> str:
+    """Exporte toutes les mesures au format texte de Prometheus"""
+    lines = []
+    described = set()
+
+    def header(name: str, kind: str) -> None:
+        if name not in described:
+            described.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), histogram in sorted(REGISTRY.histograms.items()):
+        header(name, 'histogram')
+        counts, total, _ = histogram.snapshot()
+        cumulative = 0
+        for bound, bucket_count in zip(histogram.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            extra = f'le="{le}"'
+            lines.append(f"{name}_bucket{_labels(labels, extra)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {total}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+    for (name, labels), counter in sorted(REGISTRY.counters.items()):
+        header(name, 'counter')
+        lines.append(f"{name}{_labels(labels)} {counter.value}")
+
+    return '\n'.join(lines) + '\n'
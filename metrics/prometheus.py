@@ -0,0 +1,39 @@
+import asyncio
+from typing import Optional
+
+from metrics.metrics import render_prometheus
+
+
+class PrometheusExporter:
+    """Point d'accès HTTP minimal exposant les mesures au format texte de Prometheus, sur l'interface locale"""
+
+    def __init__(self, port: int, host: str = '127.0.0.1'):
+        self.__host = host
+        self.__port = port
+        self.__server: Optional[asyncio.AbstractServer] = None
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 5)
+            path = request.split(b' ', 2)[1] if request.count(b' ') >= 2 else b''
+            if path == b'/metrics':
+                status, body = b'200 OK', render_prometheus().encode()
+            else:
+                status, body = b'404 Not Found', b''
+            writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> None:
+        self.__server = await asyncio.start_server(self.__handle, self.__host, self.__port)
+        print(f"Mesures exposées sur http://{self.__host}:{self.__port}/metrics")
+
+    async def close(self) -> None:
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
@@ -0,0 +1,75 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from metrics.metrics import REGISTRY
+
+
+class LoopWatchdog:
+    """Surveille la réactivité de la boucle d'événements
+
+    Une tâche mesure le retard de la boucle à chaque période ; un thread vérifie que la tâche
+    progresse et, si la boucle reste bloquée plus de `stall` secondes, affiche la pile du code
+    qui la bloque.
+    """
+
+    def __init__(self, interval: float = 0.5, stall: float = 0.25):
+        self.__interval = interval
+        self.__stall = stall
+        self.__heartbeat = time.monotonic()
+        self.__loop_thread: Optional[int] = None
+        self.__stopped = threading.Event()
+        self.__task: Optional[asyncio.Task] = None
+        self.__thread: Optional[threading.Thread] = None
+        self.__lag = REGISTRY.histogram('koleka_loop_lag_seconds')
+        self.__stalls = REGISTRY.counter('koleka_loop_stalls_total')
+        self.max_lag = 0.0
+
+    @property
+    def stalls(self) -> int:
+        return self.__stalls.value
+
+    async def __measure(self) -> None:
+        while True:
+            expected = time.monotonic() + self.__interval
+            await asyncio.sleep(self.__interval)
+            now = time.monotonic()
+            self.__heartbeat = now
+            lag = max(0.0, now - expected)
+            self.max_lag = max(self.max_lag, lag)
+            self.__lag.observe(lag)
+
+    def __watch(self) -> None:
+        reported = False
+        while not self.__stopped.wait(self.__stall / 2):
+            blocked = time.monotonic() - self.__heartbeat - self.__interval
+            if blocked < self.__stall:
+                reported = False
+                continue
+            if reported:
+                continue
+
+            # Un seul rapport par blocage
+            reported = True
+            self.__stalls.inc()
+            frame = sys._current_frames().get(self.__loop_thread)
+            stack = ''.join(traceback.format_stack(frame, limit=8)) if frame else ''
+            print(f"Boucle d'événements bloquée depuis {1000 * blocked:.0f} ms :\n{stack}")
+
+    def start(self) -> None:
+        """Démarre la surveillance ; doit être appelé depuis la boucle surveillée"""
+        self.__loop_thread = threading.get_ident()
+        self.__heartbeat = time.monotonic()
+        self.__stopped.clear()
+        self.__task = asyncio.create_task(self.__measure())
+        self.__thread = threading.Thread(target=self.__watch, name="loop-watchdog", daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
@@ -0,0 +1,99 @@
+import time
+
+import discord
+
+from metrics.metrics import timed
+from model.line import Line
+from model.station import RENDER_RESOLUTION
+from model.stop import Stop
+from model.view import SequenceView
+
+# Stations affichées par page et destinations par station (un embed compte au plus 25 champs et 6000 caractères)
+STATIONS_PER_PAGE = 10
+DESTINATIONS_PER_STATION = 4
+
+
+class LineBoard:
+    """Prochains passages de chaque station d'une ligne, complété au fil des réponses"""
+    __slots__ = ('__line', '__stations', '__index', '__loaded', '__failed', '__renders', '__clock')
+
+    def __init__(self, line: Line, stations: list[tuple[str, str]]):
+        self.__line: Line = line
+        self.__stations: list[Stop] = [Stop(station_id, name) for station_id, name in dict(stations).items()]
+        self.__index: dict[str, Stop] = {stop.id: stop for stop in self.__stations}
+        self.__loaded: set[str] = set()
+        self.__failed: set[str] = set()
+        # Rendus des pages pour l'intervalle d'horloge courant (voir Station.get_station_embed)
+        self.__renders: dict[int, discord.Embed] = {}
+        self.__clock: int = 0
+
+    @property
+    def line(self) -> Line:
+        return self.__line
+
+    @property
+    def stations(self) -> SequenceView[Stop]:
+        return SequenceView(self.__stations)
+
+    @property
+    def pages(self) -> int:
+        return max(1, -(-len(self.__stations) // STATIONS_PER_PAGE))
+
+    @property
+    def complete(self) -> bool:
+        return len(self.__loaded) + len(self.__failed) >= len(self.__stations)
+
+    def add_records(self, station_id: str, records: list[tuple[str, float]]) -> None:
+        """Renseigne les passages d'une station, sous la forme (destination, horodatage)"""
+        stop = self.__index[station_id]
+        for destination, timestamp in records:
+            stop.add_timetable_record(destination, timestamp)
+        self.__loaded.add(station_id)
+        self.__renders.pop(self.__stations.index(stop) // STATIONS_PER_PAGE, None)
+
+    def set_failed(self, station_id: str) -> None:
+        """Indique que les passages d'une station n'ont pas pu être obtenus"""
+        self.__failed.add(station_id)
+        self.__renders.pop(self.__stations.index(self.__index[station_id]) // STATIONS_PER_PAGE, None)
+
+    def get_board_embed(self, num_page: int = 0, now: float = None) -> discord.Embed:
+        """Fournit l'embed d'une page de stations ; seules les pages modifiées depuis le dernier rendu sont refaites,
+        ainsi que toutes les pages lorsque l'horloge change d'intervalle"""
+        clock = int((time.time() if now is None else now) // RENDER_RESOLUTION)
+        if clock != self.__clock:
+            self.__renders.clear()
+            self.__clock = clock
+
+        num_page %= self.pages
+        embed = self.__renders.get(num_page)
+        if embed is None:
+            embed = self.__renders[num_page] = self.__render(num_page, clock * RENDER_RESOLUTION)
+        if not self.complete:
+            # Le pied de page change à chaque réponse : il n'est pas mémorisé
+            embed = embed.copy()
+            embed.set_footer(text=f"{embed.footer.text} · {len(self.__loaded) + len(self.__failed)}/"
+                                  f"{len(self.__stations)} stations chargées")
+        return embed
+
+    @timed('koleka_embed_render_seconds')
+    def __render(self, num_page: int, now: float) -> discord.Embed:
+        embed = discord.Embed(title=f"{self.__line.name} | **Ligne**", color=self.__line.color)
+        embed.set_footer(text=f"Page {num_page + 1}/{self.pages}")
+
+        start = num_page * STATIONS_PER_PAGE
+        for stop in self.__stations[start:start + STATIONS_PER_PAGE]:
+            if stop.id in self.__failed:
+                value = "Données indisponibles"
+            elif stop.id not in self.__loaded:
+                value = "..."
+            else:
+                # Les destinations desservies le plus tôt d'abord
+                lines = []
+                for destination, wait_time in stop.wait_times(now, 2):
+                    if wait_time:
+                        lines.append((wait_time[0], f"→ {destination} : " + " min, ".join(map(str, wait_time)) + " min"))
+                lines.sort()
+                value = "\n".join(text for _, text in lines[:DESTINATIONS_PER_STATION]) or "Aucun départ"
+            embed.add_field(name=stop.name, value=value, inline=False)
+
+        return embed
@@ -1,16 +1,20 @@
 from typing import overload
 
-from sortedcontainers import SortedSet
+from sortedcontainers import SortedKeyList
 
 from model.stop import Stop
+from model.view import SequenceView
 
 
 class Line:
+    __slots__ = ('__id', '__name', '__color', '__stops', '__index')
+
     def __init__(self, line_id: str, name: str, color: str):
         self.__id = line_id
         self.__name = name
         self.__color = color
-        self.__stops: SortedSet[Stop] = SortedSet(key=lambda stop: stop.id)
+        self.__stops: SortedKeyList[Stop] = SortedKeyList(key=lambda stop: stop.id)
+        self.__index: dict[str, Stop] = {}
 
     def __hash__(self):
         return hash(self.id)
@@ -31,8 +35,8 @@ class Line:
         return self.__color
 
     @property
-    def stops(self) -> list[Stop]:
-        return list(self.__stops)
+    def stops(self) -> SequenceView[Stop]:
+        return SequenceView(self.__stops)
 
     @overload
     def get_stop(self, param: int = 0) -> Stop:
@@ -45,11 +49,14 @@ class Line:
     def get_stop(self, param = 0) -> Stop:
         """Donne un arrêt à l'indice donné ou à la correspondance de son nom"""
         if isinstance(param, int):
-            return self.stops[param]
+            return self.__stops[param]
         if isinstance(param, str):
-            return next((x for x in self.stops if x.id == param), None)
-
-    def add_stop(self, stop_id: str, stop_name: str) -> None:
-        """Ajoute un arrêt"""
-        arret = Stop(stop_id, stop_name)
-        self.__stops.add(arret)
+            return self.__index.get(param)
+
+    def add_stop(self, stop_id: str, stop_name: str) -> Stop:
+        """Ajoute un arrêt, s'il n'est pas déjà présent"""
+        arret = self.__index.get(stop_id)
+        if arret is None:
+            arret = self.__index[stop_id] = Stop(stop_id, stop_name)
+            self.__stops.add(arret)
+        return arret
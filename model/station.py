@@ -1,16 +1,32 @@
-from typing import overload
+import time
+from typing import Optional, overload
 
 import discord
-from sortedcontainers import SortedSet
+from sortedcontainers import SortedKeyList
 
+from metrics.metrics import timed
 from model.line import Line
+from model.view import SequenceView
+
+# Résolution de l'horloge des rendus, en secondes : les temps d'attente d'une page sont recalculés au plus
+# une fois par intervalle, sans nouvelle requête
+RENDER_RESOLUTION = 10
 
 
 class Station:
-    def __init__(self, station_id: str, station_name: str):
+    __slots__ = ('__id', '__name', '__lines', '__index', '__renders', '__clock', '__theoretical', '__fetched_at')
+
+    def __init__(self, station_id: str, station_name: str, theoretical: bool = False, fetched_at: float = None):
         self.__id: str = station_id
         self.__name: str = station_name.title()
-        self.__lines: SortedSet[Line] = SortedSet(key=lambda line: line.id)
+        # Horaires issus de l'index théorique, faute de réponse temps réel à temps
+        self.__theoretical: bool = theoretical
+        self.__fetched_at: float = time.time() if fetched_at is None else fetched_at
+        self.__lines: SortedKeyList[Line] = SortedKeyList(key=lambda line: line.id)
+        self.__index: dict[str, Line] = {}
+        # Rendus des pages pour l'intervalle d'horloge courant
+        self.__renders: dict[int, discord.Embed] = {}
+        self.__clock: int = 0
 
     @property
     def id(self) -> str:
@@ -21,12 +37,17 @@ class Station:
         return self.__name
 
     @property
-    def lines(self) -> list[Line]:
-        return list(self.__lines)
+    def theoretical(self) -> bool:
+        return self.__theoretical
+
+    @property
+    def age(self) -> float:
+        """Âge des horaires, en secondes"""
+        return time.time() - self.__fetched_at
 
-    @lines.setter
-    def lines(self, value):
-        self.__lines = value
+    @property
+    def lines(self) -> SequenceView[Line]:
+        return SequenceView(self.__lines)
 
     @overload
     def get_line(self, param: int = 0) -> Line | None:
@@ -41,53 +62,71 @@ class Station:
         if not self.__lines:
             return None
         if isinstance(param, int):
-            param %= len(self.__lines)
             return self.__lines[param % len(self.__lines)]
         if isinstance(param, str):
-            return next((x for x in self.__lines if x.id == param), None)
+            return self.__index.get(param)
 
     def add_line(self, line: Line) -> Line:
-        """Ajoute une ligne"""
-        self.__lines.add(line)
-        return line
+        """Ajoute une ligne, si aucune ligne de même identifiant n'est présente"""
+        if line.id not in self.__index:
+            self.__index[line.id] = line
+            self.__lines.add(line)
+            self.__renders.clear()
+        return self.__index[line.id]
 
     def get_line_index(self, line_id: str) -> int:
         """Donne l'indice dans la liste en correspondance avec son nom"""
-        try:
-            id_lignes_arret = [x.id for x in self.__lines]
-            return id_lignes_arret.index(line_id)
-        except (ValueError, IndexError, AttributeError):
-            return 0
-
-    def get_station_embed(self, num_page: int = 0) -> discord.Embed:
-        """Fournit un embed montrant le temps d'attente pour un arrêt et une station donnée"""
+        line = self.__index.get(line_id)
+        return self.__lines.index(line) if line else 0
+
+    def next_departure(self, now: float = None) -> Optional[float]:
+        """Horodatage du prochain passage à la station, toutes lignes confondues"""
+        now = time.time() if now is None else now
+        return min((timestamp for line in self.__lines for stop in line.stops
+                    if (timestamp := stop.next_departure(now)) is not None), default=None)
+
+    def get_station_embed(self, num_page: int = 0, now: float = None) -> discord.Embed:
+        """Fournit un embed montrant le temps d'attente pour un arrêt et une station donnée
+
+        Les temps d'attente sont calculés à partir des horaires, par rapport à l'horloge : une station
+        n'est plus modifiée une fois construite, le rendu de chaque page est mémorisé pour RENDER_RESOLUTION secondes.
+        """
+        clock = int((time.time() if now is None else now) // RENDER_RESOLUTION)
+        if clock != self.__clock:
+            self.__renders.clear()
+            self.__clock = clock
+
+        num_page %= max(1, len(self.__lines))
+        embed = self.__renders.get(num_page)
+        if embed is None:
+            embed = self.__renders[num_page] = self.__render(num_page, clock * RENDER_RESOLUTION)
+        return embed
+
+    @timed('koleka_embed_render_seconds')
+    def __render(self, num_page: int, now: float) -> discord.Embed:
         line: Line = self.get_line(num_page)
 
         embed = discord.Embed(title=f"{line.name} | **Horaires**", color=line.color)
-        embed.set_footer(text=f"Page {num_page + 1}/{len(self.__lines)}")
+        footer = f"Page {num_page + 1}/{len(self.__lines)}"
+        embed.set_footer(text=f"{footer} · Horaires théoriques" if self.__theoretical else footer)
 
+        # Regroupement des départs par nom d'arrêt (plusieurs quais peuvent porter le même nom), en une passe
+        groups: dict[str, list[tuple[str, str, bool]]] = {}
         for stop in line.stops:
-            if f"**{stop.name or self.name}**" not in [x.value for x in embed.fields]:
-                embed.add_field(name="‎", value=f"**{stop.name}**", inline=False)
-
-            horaires = stop.timetable.items()
-            horaires_inline = len(horaires) < 2
-
-            for destination, wait_time in horaires:
-                wait_time = [i for i in wait_time[:3] if i <= 60]
-                if not wait_time:
-                    continue
-                elif f"**{stop.name}**" not in [x.value for x in embed.fields]:
-                    embed.add_field(name=f"→ {destination}",
-                                    value=" min, ".join(map(str, wait_time)) + " min",
-                                    inline=horaires_inline)
-                else:
-                    embed.insert_field_at([x.value for x in embed.fields].index(f"**{stop.name}**") + 1,
-                                          name=f"→ {destination}",
-                                          value=" min, ".join(map(str, wait_time)) + " min",
-                                          inline=horaires_inline)
+            fields = groups.setdefault(stop.name or self.name, [])
+
+            horaires_inline = len(stop.timetable) < 2
+
+            for destination, wait_time in stop.wait_times(now):
+                if wait_time:
+                    fields.append((f"→ {destination}", " min, ".join(map(str, wait_time)) + " min", horaires_inline))
+
+        for stop_name, fields in groups.items():
+            embed.add_field(name="‎", value=f"**{stop_name}**", inline=False)
+            for name, value, inline in fields:
+                embed.add_field(name=name, value=value, inline=inline)
 
         if len(embed.fields) < 2:
             embed.add_field(name="Aucun départ", value="...")
 
-        return embed
\ No newline at end of file
+        return embed
@@ -1,8 +1,28 @@
+import bisect
+from array import array
+from types import MappingProxyType
+from typing import Iterator, Mapping, Optional
+
+# Passages conservés par destination : seuls les plus proches, de quoi afficher des temps d'attente justes
+# pendant plusieurs minutes sans redemander les horaires
+MAX_RECORDS = 6
+# Un passage reste affiché jusqu'à 30 secondes après son horaire, tant que son attente arrondie vaut 0 min ;
+# les réponses SIRI et les flux GTFS-RT gardent les passages sur la même durée
+DEPARTURE_GRACE = 30
+
+
+def wait_time(timestamp: float, now: float) -> int:
+    """Temps d'attente en minutes jusqu'à l'horodatage donné"""
+    return round((timestamp - now) / 60.0)
+
+
 class Stop:
+    __slots__ = ('__id', '__name', '__timetable')
+
     def __init__(self, stop_id: str, stop_name: str):
         self.__id = stop_id
         self.__name = stop_name.title()
-        self.__timetable: dict[str, list[int]] = {}
+        self.__timetable: dict[str, array] = {}
 
     def __hash__(self):
         return hash(self.id)
@@ -19,9 +39,34 @@ class Stop:
         return self.__name
 
     @property
-    def timetable(self) -> dict[str, list[int]]:
-        return self.__timetable
+    def timetable(self) -> Mapping[str, array]:
+        """Horodatages des passages par destination, triés"""
+        return MappingProxyType(self.__timetable)
+
+    def add_timetable_record(self, destination: str, timestamp: float):
+        """Ajoute un passage à la destination ; seuls les MAX_RECORDS plus proches sont conservés"""
+        records = self.__timetable.get(destination)
+        if records is None:
+            records = self.__timetable[destination] = array('d')
+        elif len(records) >= MAX_RECORDS and timestamp >= records[-1]:
+            return
+        bisect.insort(records, timestamp)
+        if len(records) > MAX_RECORDS:
+            records.pop()
+
+    def next_departure(self, now: float) -> Optional[float]:
+        """Horodatage du prochain passage, toutes destinations confondues"""
+        soonest = None
+        for records in self.__timetable.values():
+            i = bisect.bisect_left(records, now - DEPARTURE_GRACE)
+            if i < len(records) and (soonest is None or records[i] < soonest):
+                soonest = records[i]
+        return soonest
 
-    def add_timetable_record(self, destination: str, attente: int):
-        """Ajoute un horaire à la destination"""
-        self.__timetable.setdefault(destination, []).append(attente)
+    def wait_times(self, now: float, limit: int = 3, max_wait: int = 60) -> Iterator[tuple[str, list[int]]]:
+        """Prochains temps d'attente en minutes par destination (au plus `limit`, jusqu'à `max_wait` minutes),
+        calculés par rapport à l'horloge donnée"""
+        for destination, records in self.__timetable.items():
+            start = bisect.bisect_left(records, now - DEPARTURE_GRACE)
+            waits = [wait_time(timestamp, now) for timestamp in records[start:start + limit]]
+            yield destination, [wait for wait in waits if wait <= max_wait]
@@ -0,0 +1,27 @@
+from collections.abc import Sequence
+from typing import Iterator, TypeVar
+
+T = TypeVar('T')
+
+
+class SequenceView(Sequence[T]):
+    """Vue en lecture seule sur une séquence, sans copie"""
+    __slots__ = ('__items',)
+
+    def __init__(self, items: Sequence[T]):
+        self.__items = items
+
+    def __getitem__(self, index):
+        return self.__items[index]
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self.__items)
+
+    def __contains__(self, item) -> bool:
+        return item in self.__items
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self.__items)!r})"
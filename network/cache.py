@@ -0,0 +1,190 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from network.scheduler import Priority, Ticket
+from network.shared_cache import SharedCache
+
+Fetch = Callable[[Ticket], Awaitable[Any]]
+
+
+class RealtimeCache:
+    """Cache LRU des réponses temps réel, à durée de vie courte, qui mutualise les requêtes en cours
+
+    Avec un cache partagé, les valeurs absentes sont d'abord demandées aux autres processus du bot ;
+    elles y sont transmises encodées par `encode` et relues par `decode`.
+    Chaque requête en cours a un ticket (voir network/scheduler.py), transmis à `fetch`, qui porte la priorité
+    de son appelant le plus prioritaire : un appelant plus prioritaire qui la rejoint le promeut, que la requête
+    attende déjà son jeton ou qu'elle n'ait pas encore été soumise.
+    """
+
+    def __init__(self, ttl: float, max_size: int, shared: Optional[SharedCache] = None,
+                 encode: Callable[[Any], bytes] = None, decode: Callable[[bytes], Any] = None):
+        self.__ttl = ttl
+        self.__max_size = max_size
+        self.__shared = shared
+        self.__encode = encode
+        self.__decode = decode
+        self.__entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.__inflight: dict[Hashable, tuple[asyncio.Task, Ticket]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.shared_hits = 0
+
+    @property
+    def ttl(self) -> float:
+        return self.__ttl
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def peek(self, key: Hashable, max_age: float = None) -> Any:
+        """Donne la valeur en cache si elle a moins de max_age secondes (par défaut, la durée de vie du cache)"""
+        entry = self.__entries.get(key)
+        if entry is None or time.monotonic() - entry[0] >= (self.__ttl if max_age is None else max_age):
+            return None
+        self.__entries.move_to_end(key)
+        return entry[1]
+
+    def age(self, key: Hashable) -> Optional[float]:
+        """Âge de la valeur en cache, en secondes, ou None si elle est absente"""
+        entry = self.__entries.get(key)
+        return None if entry is None else time.monotonic() - entry[0]
+
+    def put(self, key: Hashable, value: Any, age: float = 0.0) -> None:
+        """Enregistre une valeur (obtenue il y a `age` secondes) et évince les entrées les moins récemment utilisées"""
+        self.__entries[key] = (time.monotonic() - age, value)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.__max_size:
+            self.__entries.popitem(last=False)
+
+    def entries(self, max_age: float = None) -> list[tuple[Hashable, float, Any]]:
+        """Entrées de moins de max_age secondes, sous la forme (clé, âge, valeur), des moins aux plus récemment utilisées"""
+        now = time.monotonic()
+        max_age = self.__ttl if max_age is None else max_age
+        return [(key, now - stored_at, value) for key, (stored_at, value) in self.__entries.items()
+                if now - stored_at < max_age]
+
+    def clear(self) -> None:
+        """Vide le cache ; les requêtes en cours ne sont pas interrompues"""
+        self.__entries.clear()
+
+    async def get(self, key: Hashable, fetch: Fetch, priority: Priority = Priority.INTERACTIVE,
+                  max_age: float = None) -> Any:
+        """Donne la valeur en cache ou la récupère, une seule fois pour tous les appels simultanés
+
+        Une valeur de moins de max_age secondes (par défaut, la durée de vie du cache) est servie sans la récupérer.
+        """
+        max_age = self.__ttl if max_age is None else max_age
+        value = self.peek(key, max_age)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        inflight = self.__inflight.get(key)
+        if inflight is None:
+            self.misses += 1
+            ticket = Ticket(priority)
+            task = asyncio.create_task(self.__load(key, fetch, ticket, max_age))
+            self.__inflight[key] = (task, ticket)
+        else:
+            self.coalesced += 1
+            task, ticket = inflight
+            ticket.promote(priority)
+
+        # L'annulation d'un appelant ne doit pas interrompre la requête partagée avec les autres
+        return await asyncio.shield(task)
+
+    async def __load(self, key: Hashable, fetch: Fetch, ticket: Ticket, max_age: float) -> Any:
+        try:
+            if self.__shared is None:
+                value, age = await fetch(ticket), 0.0
+            else:
+                value, age = await self.__load_shared(key, fetch, ticket, max_age)
+            self.put(key, value, age)
+            return value
+        finally:
+            del self.__inflight[key]
+
+    async def __load_shared(self, key: Hashable, fetch: Fetch, ticket: Ticket, max_age: float) -> tuple[Any, float]:
+        """Récupère la valeur auprès des autres processus, ou la charge pour eux"""
+        try:
+            payload, age = await self.__lease(key, ticket, max_age)
+        except Exception as e:
+            # Cache partagé indisponible : chaque processus interroge l'API de son côté
+            print(f"Cache partagé indisponible : {e!r}")
+            return await fetch(ticket), 0.0
+
+        if payload is not None:
+            try:
+                value = self.__decode(payload)
+            except ValueError as e:
+                print(f"Valeur du cache partagé ignorée ({key}) : {e}")
+                return await fetch(ticket), 0.0
+            self.shared_hits += 1
+            return value, age
+
+        try:
+            value = await fetch(ticket)
+        except BaseException:
+            await self.__forward(self.__shared.release(str(key)))
+            raise
+        await self.__forward(self.__shared.put(str(key), self.__encode(value), self.__ttl))
+        return value, 0.0
+
+    async def __lease(self, key: Hashable, ticket: Ticket, max_age: float) -> tuple[Optional[bytes], float]:
+        """Demande le bail avec la priorité du ticket, et le redemande si le ticket est promu entre-temps
+
+        Un appel interactif qui rejoint un préchargement n'attend donc pas derrière le bail d'un autre processus.
+        """
+        promoted = asyncio.Event()
+        ticket.listen(promoted.set)
+        try:
+            while True:
+                promoted.clear()
+                lease = asyncio.ensure_future(self.__shared.lease(str(key), max_age, ticket.priority))
+                waiting = asyncio.ensure_future(promoted.wait())
+                try:
+                    await asyncio.wait((lease, waiting), return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    waiting.cancel()
+                    if not lease.done():
+                        lease.cancel()
+                if lease.done() and not lease.cancelled():
+                    return lease.result()
+        finally:
+            ticket.forget(promoted.set)
+
+    async def publish(self, key: Hashable, value: Any, ttl: float = None) -> None:
+        """Enregistre une valeur obtenue hors du cache et la transmet aux autres processus, qui la gardent
+        ttl secondes (par défaut, la durée de vie du cache)"""
+        self.put(key, value)
+        if self.__shared is not None:
+            ttl = self.__ttl if ttl is None else ttl
+            await self.__forward(self.__shared.put(str(key), self.__encode(value), ttl))
+
+    async def close(self) -> None:
+        if self.__shared is not None:
+            await self.__shared.close()
+
+    @staticmethod
+    async def __forward(call: Awaitable[None]) -> None:
+        try:
+            await call
+        except Exception as e:
+            print(f"Cache partagé indisponible : {e!r}")
+
+    @property
+    def stats(self) -> dict:
+        requests = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self.__entries),
+            'inflight': len(self.__inflight),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'shared_hits': self.shared_hits,
+            'hit_ratio': (self.hits + self.coalesced) / requests if requests else 0.0,
+        }
@@ -0,0 +1,55 @@
+import time
+from typing import Iterable, Optional
+
+from network.siri import Departure
+
+
+class DepartureStore:
+    """Passages temps réel conservés en mémoire, indexés par arrêt interrogé et par ligne"""
+
+    def __init__(self):
+        self.__by_ref: dict[str, tuple[float, list[Departure]]] = {}
+        self.__by_line: dict[str, dict[str, list[Departure]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.__by_ref)
+
+    def put(self, monitoring_ref: str, departures: list[Departure], fetched_at: float = None) -> None:
+        """Remplace les passages connus pour un arrêt"""
+        self.__remove(monitoring_ref)
+        self.__by_ref[monitoring_ref] = (time.monotonic() if fetched_at is None else fetched_at, departures)
+        for departure in departures:
+            self.__by_line.setdefault(departure.line_id, {}).setdefault(monitoring_ref, []).append(departure)
+
+    def get(self, monitoring_ref: str, max_age: float) -> Optional[list[Departure]]:
+        """Donne les passages d'un arrêt s'ils datent de moins de max_age secondes"""
+        entry = self.__by_ref.get(monitoring_ref)
+        if entry is None or time.monotonic() - entry[0] > max_age:
+            return None
+        return entry[1]
+
+    def age(self, monitoring_ref: str) -> Optional[float]:
+        """Âge en secondes des passages connus pour un arrêt"""
+        entry = self.__by_ref.get(monitoring_ref)
+        return None if entry is None else time.monotonic() - entry[0]
+
+    def for_line(self, line_id: str, max_age: float) -> dict[str, list[Departure]]:
+        """Passages d'une ligne, par arrêt interrogé, aux arrêts dont les données datent de moins de max_age secondes"""
+        now = time.monotonic()
+        return {monitoring_ref: departures for monitoring_ref, departures in self.__by_line.get(line_id, {}).items()
+                if now - self.__by_ref[monitoring_ref][0] <= max_age}
+
+    def discard(self, monitoring_refs: Iterable[str]) -> None:
+        """Oublie les passages des arrêts donnés"""
+        for monitoring_ref in monitoring_refs:
+            self.__remove(monitoring_ref)
+
+    def __remove(self, monitoring_ref: str) -> None:
+        previous = self.__by_ref.pop(monitoring_ref, None)
+        if previous is None:
+            return
+        for line_id in {departure.line_id for departure in previous[1]}:
+            stops = self.__by_line[line_id]
+            stops.pop(monitoring_ref, None)
+            if not stops:
+                del self.__by_line[line_id]
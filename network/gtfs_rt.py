@@ -0,0 +1,328 @@
+"""Décodage des flux GTFS-Realtime (TripUpdates) et passages qui en sont tirés, indexés par station
+
+Le décodeur lit directement le format binaire protobuf, sans bibliothèque générée : seuls les champs
+utiles aux prochains passages sont décodés (course, ligne, arrêts et horaires), les autres sont sautés
+sans être copiés. Un flux complet est lu en une passe.
+
+Les horaires donnés seulement sous forme de retard (sans heure absolue) sont ignorés : il faudrait pour
+les placer les horaires théoriques de chaque course.
+"""
+import struct
+import sys
+import time
+from typing import Iterable, Iterator, Optional
+
+from model.stop import DEPARTURE_GRACE
+from network.siri import Departure
+
+# Types de fil protobuf
+VARINT, FIXED64, LENGTH, FIXED32 = 0, 1, 2, 5
+
+# FeedHeader.incrementality
+FULL_DATASET, DIFFERENTIAL = 0, 1
+# TripDescriptor.schedule_relationship et StopTimeUpdate.schedule_relationship
+CANCELED, DELETED = 3, 7
+SKIPPED = 1
+
+_FIXED64 = struct.Struct('<Q')
+_FIXED32 = struct.Struct('<I')
+
+
+def _varint(data: bytes, pos: int) -> tuple[int, int]:
+    value = data[pos]
+    pos += 1
+    if value < 0x80:
+        return value, pos
+    value &= 0x7f
+    shift = 7
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _fields(data: bytes, pos: int, end: int) -> Iterator[tuple[int, int, int]]:
+    """Parcourt les champs d'un message, sous la forme (numéro, valeur, fin)
+
+    Pour un champ de longueur variable, la valeur est la position de son contenu, qui s'arrête à `fin`.
+    """
+    while pos < end:
+        key, pos = _varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == VARINT:
+            value, pos = _varint(data, pos)
+            yield number, value, pos
+        elif wire_type == LENGTH:
+            length, pos = _varint(data, pos)
+            yield number, pos, pos + length
+            pos += length
+        elif wire_type == FIXED64:
+            yield number, _FIXED64.unpack_from(data, pos)[0], pos + 8
+            pos += 8
+        elif wire_type == FIXED32:
+            yield number, _FIXED32.unpack_from(data, pos)[0], pos + 4
+            pos += 4
+        else:
+            raise ValueError(f"Type de champ protobuf non pris en charge : {wire_type}")
+
+
+def _string(data: bytes, start: int, end: int) -> str:
+    return sys.intern(data[start:end].decode())
+
+
+def _signed(value: int) -> int:
+    # Les entiers signés négatifs sont encodés sur 64 bits en complément à deux
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class TripUpdate:
+    """Course d'un flux TripUpdates : ses prochains arrêts, sous la forme (arrêt, horodatage)"""
+    __slots__ = ('trip_id', 'route_id', 'canceled', 'stops')
+
+    def __init__(self, trip_id: Optional[str], route_id: Optional[str], canceled: bool,
+                 stops: list[tuple[str, float]]):
+        self.trip_id = trip_id
+        self.route_id = route_id
+        self.canceled = canceled
+        self.stops = stops
+
+    @property
+    def destination(self) -> Optional[str]:
+        """Dernier arrêt connu de la course"""
+        return self.stops[-1][0] if self.stops else None
+
+    def departures(self, destination: str) -> list[Departure]:
+        """Passages de la course, terminus exclu"""
+        return [Departure(stop_id, self.route_id, destination, timestamp, self.trip_id)
+                for stop_id, timestamp in self.stops[:-1]]
+
+
+class FeedMessage:
+    """Flux décodé : entités mises à jour ou supprimées, par identifiant d'entité"""
+    __slots__ = ('incremental', 'timestamp', 'updates', 'deleted')
+
+    def __init__(self, incremental: bool, timestamp: int, updates: dict[str, TripUpdate], deleted: list[str]):
+        self.incremental = incremental
+        self.timestamp = timestamp
+        self.updates = updates
+        self.deleted = deleted
+
+
+def _skip(data: bytes, pos: int, wire_type: int) -> int:
+    """Position qui suit la valeur d'un champ ignoré"""
+    if wire_type == VARINT:
+        return _varint(data, pos)[1]
+    if wire_type == LENGTH:
+        length, pos = _varint(data, pos)
+        return pos + length
+    if wire_type == FIXED64:
+        return pos + 8
+    if wire_type == FIXED32:
+        return pos + 4
+    raise ValueError(f"Type de champ protobuf non pris en charge : {wire_type}")
+
+
+# Clés (numéro de champ et type) des champs lus sur le chemin critique, comparées sans être décomposées
+_EVENT_TIME = 2 << 3 | VARINT
+_UPDATE_ARRIVAL = 2 << 3 | LENGTH
+_UPDATE_DEPARTURE = 3 << 3 | LENGTH
+_UPDATE_STOP_ID = 4 << 3 | LENGTH
+_UPDATE_RELATIONSHIP = 5 << 3 | VARINT
+_TRIP_DESCRIPTOR = 1 << 3 | LENGTH
+_TRIP_STOP_TIME_UPDATE = 2 << 3 | LENGTH
+
+
+def _stop_time_event(data: bytes, pos: int, end: int) -> Optional[int]:
+    while pos < end:
+        key = data[pos]
+        pos += 1
+        if key >= 0x80:
+            key, pos = _varint(data, pos - 1)
+        if key == _EVENT_TIME:
+            return _signed(_varint(data, pos)[0])
+        pos = _skip(data, pos, key & 7)
+    return None
+
+
+def _stop_time_update(data: bytes, pos: int, end: int) -> Optional[tuple[str, float]]:
+    stop_id = None
+    # Seule l'heure de départ est décodée, celle d'arrivée n'étant lue qu'à défaut
+    arrival = departure = None
+    while pos < end:
+        # Clés et longueurs tiennent presque toujours sur un octet
+        key = data[pos]
+        pos += 1
+        if key >= 0x80:
+            key, pos = _varint(data, pos - 1)
+        if key == _UPDATE_STOP_ID or key == _UPDATE_DEPARTURE or key == _UPDATE_ARRIVAL:
+            length = data[pos]
+            pos += 1
+            if length >= 0x80:
+                length, pos = _varint(data, pos - 1)
+            if key == _UPDATE_STOP_ID:
+                stop_id = _string(data, pos, pos + length)
+            elif key == _UPDATE_DEPARTURE:
+                departure = pos, pos + length
+            else:
+                arrival = pos, pos + length
+            pos += length
+        elif key == _UPDATE_RELATIONSHIP:
+            value, pos = _varint(data, pos)
+            if value == SKIPPED:
+                return None
+        else:
+            pos = _skip(data, pos, key & 7)
+
+    if stop_id is None:
+        return None
+    timestamp = None if departure is None else _stop_time_event(data, *departure)
+    if timestamp is None and arrival is not None:
+        timestamp = _stop_time_event(data, *arrival)
+    return None if timestamp is None else (stop_id, float(timestamp))
+
+
+def _trip_update(data: bytes, pos: int, end: int) -> TripUpdate:
+    trip_id = route_id = None
+    canceled = False
+    stops = []
+    while pos < end:
+        key, pos = _varint(data, pos)
+        if key == _TRIP_STOP_TIME_UPDATE:
+            length, pos = _varint(data, pos)
+            stop_time = _stop_time_update(data, pos, pos + length)
+            if stop_time is not None:
+                stops.append(stop_time)
+            pos += length
+        elif key == _TRIP_DESCRIPTOR:
+            length, pos = _varint(data, pos)
+            for field, value, field_end in _fields(data, pos, pos + length):
+                if field == 1:
+                    trip_id = _string(data, value, field_end)
+                elif field == 5:
+                    route_id = _string(data, value, field_end)
+                elif field == 4 and value in (CANCELED, DELETED):
+                    canceled = True
+            pos += length
+        else:
+            pos = _skip(data, pos, key & 7)
+    stops.sort(key=lambda stop_time: stop_time[1])
+    return TripUpdate(trip_id, route_id, canceled, stops)
+
+
+def parse_feed(payload: bytes) -> FeedMessage:
+    """Décode un flux GTFS-Realtime ; seules les entités TripUpdate sont retenues"""
+    incremental = False
+    timestamp = 0
+    updates: dict[str, TripUpdate] = {}
+    deleted: list[str] = []
+
+    for number, value, end in _fields(payload, 0, len(payload)):
+        if number == 1:
+            for field, field_value, _ in _fields(payload, value, end):
+                if field == 2:
+                    incremental = field_value == DIFFERENTIAL
+                elif field == 3:
+                    timestamp = field_value
+        elif number == 2:
+            entity_id = None
+            is_deleted = False
+            trip_update = None
+            for field, field_value, field_end in _fields(payload, value, end):
+                if field == 1:
+                    entity_id = payload[field_value:field_end].decode()
+                elif field == 2:
+                    is_deleted = bool(field_value)
+                elif field == 3:
+                    trip_update = _trip_update(payload, field_value, field_end)
+            if entity_id is None:
+                continue
+            if is_deleted or (trip_update is not None and trip_update.canceled):
+                deleted.append(entity_id)
+            elif trip_update is not None and trip_update.route_id is not None and trip_update.stops:
+                updates[entity_id] = trip_update
+
+    return FeedMessage(incremental, timestamp, updates, deleted)
+
+
+class TripUpdateStore:
+    """Passages tirés d'un flux TripUpdates, indexés par station (ou par arrêt sans station parente)
+
+    Un flux complet remplace tout le contenu ; un flux différentiel ne remplace que les courses qu'il contient.
+    """
+
+    def __init__(self, parents: dict[str, str] = None):
+        self.__parents: dict[str, str] = parents or {}
+        self.__trips: dict[str, list[Departure]] = {}
+        self.__by_station: dict[str, dict[str, list[Departure]]] = {}
+        self.__updated_at: Optional[float] = None
+        self.timestamp = 0
+
+    def __len__(self) -> int:
+        return len(self.__trips)
+
+    def set_parents(self, parents: dict[str, str]) -> None:
+        """Renseigne la station parente de chaque arrêt ; les passages déjà connus sont réindexés"""
+        self.__parents = parents
+        trips = self.__trips
+        self.__trips, self.__by_station = {}, {}
+        for entity_id, departures in trips.items():
+            self.__put(entity_id, departures)
+
+    @property
+    def age(self) -> Optional[float]:
+        """Âge en secondes du dernier flux appliqué"""
+        return None if self.__updated_at is None else time.monotonic() - self.__updated_at
+
+    def apply(self, feed: FeedMessage, departures: dict[str, list[Departure]]) -> None:
+        """Applique un flux décodé, dont les passages de chaque entité ont déjà été construits"""
+        if not feed.incremental:
+            self.__trips, self.__by_station = {}, {}
+        for entity_id in feed.deleted:
+            self.__remove(entity_id)
+        for entity_id, trip_departures in departures.items():
+            self.__remove(entity_id)
+            self.__put(entity_id, trip_departures)
+        self.timestamp = feed.timestamp or self.timestamp
+        self.__updated_at = time.monotonic()
+
+    def departures(self, station_ids: Iterable[str], now: float = None) -> list[Departure]:
+        """Prochains passages des stations données, y compris ceux de moins de DEPARTURE_GRACE secondes
+
+        Une course vue depuis plusieurs stations n'est gardée qu'une fois.
+        """
+        now = time.time() if now is None else now
+        found = {}
+        for station_id in station_ids:
+            for entity_id, departures in self.__by_station.get(station_id, {}).items():
+                for departure in departures:
+                    if departure.timestamp >= now - DEPARTURE_GRACE:
+                        found.setdefault((entity_id, departure.stop_id), departure)
+        return list(found.values())
+
+    def prune(self, now: float = None) -> int:
+        """Oublie les courses dont tous les passages sont passés (les flux différentiels ne les suppriment pas)"""
+        now = time.time() if now is None else now
+        finished = [entity_id for entity_id, departures in self.__trips.items()
+                    if not departures or departures[-1].timestamp < now - DEPARTURE_GRACE]
+        for entity_id in finished:
+            self.__remove(entity_id)
+        return len(finished)
+
+    def __put(self, entity_id: str, departures: list[Departure]) -> None:
+        self.__trips[entity_id] = departures
+        for departure in departures:
+            station_id = self.__parents.get(departure.stop_id, departure.stop_id)
+            self.__by_station.setdefault(station_id, {}).setdefault(entity_id, []).append(departure)
+
+    def __remove(self, entity_id: str) -> None:
+        previous = self.__trips.pop(entity_id, None)
+        if previous is None:
+            return
+        for station_id in {self.__parents.get(departure.stop_id, departure.stop_id) for departure in previous}:
+            trips = self.__by_station[station_id]
+            trips.pop(entity_id, None)
+            if not trips:
+                del self.__by_station[station_id]
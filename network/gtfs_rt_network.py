@@ -0,0 +1,130 @@
+"""Réseau de transport alimenté par un flux GTFS-Realtime TripUpdates
+
+Le flux est téléchargé périodiquement, décodé hors de la boucle d'événements et appliqué à un index
+des passages par station (voir network/gtfs_rt.py) : les commandes sont ensuite servies depuis la mémoire,
+sans appel à l'API. Ajouter un réseau revient à l'ajouter à l'énumération Networks :
+
+    STAR = GTFSRealtimeNetwork("Rennes", "STAR", "https://exemple.fr/gtfs-rt/trip-updates")
+
+L'adresse du flux peut être remplacée par la variable {SCHEMA}_GTFS_RT_URL, sa période par {SCHEMA}_GTFS_RT_INTERVAL.
+"""
+import asyncio
+import os
+import time
+from typing import AsyncIterator
+
+from database.database import run_async, run_cpu
+from metrics.metrics import increment, timed, timer
+from model.board import LineBoard
+from model.line import Line
+from model.station import Station
+from network.gtfs_rt import FeedMessage, TripUpdateStore, parse_feed
+from network.http import HttpClient
+from network.network import Network
+from network.scheduler import Priority
+from network.siri import Departure
+
+# Âge maximal du dernier flux reçu avant de répondre avec les horaires théoriques, lorsqu'ils sont connus
+GTFS_RT_STALE_MAX_AGE = float(os.getenv('GTFS_RT_STALE_MAX_AGE', '180'))
+# Délai accordé au premier téléchargement du flux, au démarrage
+GTFS_RT_BUDGET = float(os.getenv('GTFS_RT_BUDGET', '2.5'))
+# Tableaux de ligne : nombre maximal de stations
+GTFS_RT_LINE_STATIONS_MAX = int(os.getenv('GTFS_RT_LINE_STATIONS_MAX', '80'))
+
+
+class GTFSRealtimeNetwork(Network):
+    def __init__(self, name: str, schema: str, url: str = None, headers: dict = None, interval: float = 30):
+        super().__init__(name, schema)
+        self.__url = os.getenv(f'{schema.upper()}_GTFS_RT_URL', url)
+        self.__interval = float(os.getenv(f'{schema.upper()}_GTFS_RT_INTERVAL', interval))
+        self._client = HttpClient(headers or {})
+        self._store = TripUpdateStore()
+        self.__received = asyncio.Event()
+
+    async def start(self) -> None:
+        await super().start()
+        if self.__url:
+            self._tasks.append(asyncio.create_task(self.__run()))
+
+    @property
+    def store(self) -> TripUpdateStore:
+        return self._store
+
+    async def __run(self) -> None:
+        try:
+            self._store.set_parents(await run_async(self.__parents))
+        except Exception as e:
+            print(e)
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Flux GTFS-RT {self.name} indisponible : {e!r}")
+                increment('koleka_gtfs_rt_errors_total', network=self.name)
+            await asyncio.sleep(self.__interval)
+
+    def __parents(self) -> dict[str, str]:
+        """Station parente de chaque arrêt, pour regrouper les passages par station"""
+        return {stop_id: parent for stop_id, _, parent in self._database.load_stops() if parent}
+
+    async def refresh(self) -> FeedMessage:
+        """Télécharge le flux et l'applique à l'index des passages"""
+        with timer('koleka_gtfs_rt_seconds', phase='fetch'):
+            payload = await self._client.get(self.__url)
+        with timer('koleka_gtfs_rt_seconds', phase='decode'):
+            feed = await run_cpu(parse_feed, payload)
+            names = await run_async(self.get_stop_names, {update.destination for update in feed.updates.values()})
+            departures = await run_cpu(self.trip_departures, feed, names)
+        with timer('koleka_gtfs_rt_seconds', phase='apply'):
+            self._store.apply(feed, departures)
+            self._store.prune()
+        self.__received.set()
+        return feed
+
+    @staticmethod
+    def trip_departures(feed: FeedMessage, names: dict[str, str]) -> dict[str, list[Departure]]:
+        """Construit les passages de chaque course du flux, d'après les noms de leurs destinations"""
+        return {entity_id: update.departures(names[update.destination]) for entity_id, update in feed.updates.items()}
+
+    def station_ids(self, station_id: str) -> list[str]:
+        """Donne la station demandée suivie des autres stations de même nom"""
+        return list(dict.fromkeys([station_id] + self.get_similar_stations(station_id)))
+
+    @timed('koleka_create_station_seconds', phase='total')
+    async def create_station(self, station_id: str, priority: Priority = Priority.INTERACTIVE) -> Station:
+        if not self.__received.is_set():
+            try:
+                await asyncio.wait_for(self.__received.wait(), GTFS_RT_BUDGET)
+            except asyncio.TimeoutError:
+                pass
+
+        station_ids = await run_async(self.station_ids, station_id)
+        age = self._store.age
+        if age is None or age > GTFS_RT_STALE_MAX_AGE:
+            if not self.has_timetable(station_id):
+                raise RuntimeError(f"Flux GTFS-RT {self.name} indisponible")
+            increment('koleka_theoretical_total', reason='stale')
+            departures = await run_cpu(self.theoretical_departures, station_ids)
+            return await self.build_station(station_id, departures, True)
+
+        return await self.build_station(station_id, self._store.departures(station_ids))
+
+    def build_board(self, line_id: str) -> LineBoard:
+        """Prépare le tableau d'une ligne : ses stations dans l'ordre de passage, encore sans horaires"""
+        station_ids = self.get_route_stations(line_id)[:GTFS_RT_LINE_STATIONS_MAX]
+        names = self.get_stop_names(station_ids)
+        name, color = self.get_routes_meta([line_id])[line_id]
+        return LineBoard(Line(line_id, name, color), [(station_id, names[station_id]) for station_id in station_ids])
+
+    async def fill_board(self, board: LineBoard, priority: Priority = Priority.REFRESH) -> AsyncIterator[LineBoard]:
+        """Complète le tableau depuis l'index des passages, d'un coup : aucun appel à l'API n'est nécessaire"""
+        now = time.time()
+        for stop in board.stations:
+            board.add_records(stop.id, [(departure.destination, departure.timestamp)
+                                        for departure in self._store.departures([stop.id], now)
+                                        if departure.line_id == board.line.id])
+        yield board
+
+    async def close(self) -> None:
+        await super().close()
+        await self._client.close()
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import random
+import time
+from typing import Optional
+
+import aiohttp
+
+from metrics.metrics import observe
+
+# Configuration du client HTTP
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '100'))
+HTTP_POOL_SIZE_PER_HOST = int(os.getenv('HTTP_POOL_SIZE_PER_HOST', '50'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '8'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3'))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '2'))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', '0.25'))
+
+# Les réponses 429 ne sont pas réessayées ici : l'ordonnanceur des appels suspend alors toutes les files
+RETRY_STATUS = {500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """Erreur renvoyée par l'API distante"""
+
+    def __init__(self, status: int, retry_after: Optional[float] = None):
+        super().__init__(f"Réponse HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Convertit l'en-tête Retry-After (en secondes) en flottant"""
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+class HttpClient:
+    """Client HTTP asynchrone partageant une seule session keep-alive"""
+
+    def __init__(self, headers: dict, limit: int = HTTP_POOL_SIZE, limit_per_host: int = HTTP_POOL_SIZE_PER_HOST,
+                 timeout: float = HTTP_TIMEOUT, retries: int = HTTP_RETRIES, backoff: float = HTTP_BACKOFF):
+        self.__headers = headers
+        self.__limit = limit
+        self.__limit_per_host = limit_per_host
+        self.__timeout = aiohttp.ClientTimeout(total=timeout, connect=HTTP_CONNECT_TIMEOUT)
+        self.__retries = retries
+        self.__backoff = backoff
+        self.__session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # La session doit être créée depuis la boucle d'événements qui l'utilise
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(limit=self.__limit, limit_per_host=self.__limit_per_host,
+                                             ttl_dns_cache=300, keepalive_timeout=60)
+            self.__session = aiohttp.ClientSession(headers=self.__headers, connector=connector,
+                                                   timeout=self.__timeout)
+        return self.__session
+
+    async def get(self, url: str, params: dict = None) -> bytes:
+        """Effectue une requête GET et renvoie le corps de la réponse, en réessayant sur les erreurs transitoires"""
+        for attempt in range(self.__retries + 1):
+            start = time.perf_counter()
+            status = 'error'
+            try:
+                async with self.session.get(url, params=params) as response:
+                    status = str(response.status)
+                    if response.status < 400:
+                        return await response.read()
+                    error = UpstreamError(response.status, parse_retry_after(response.headers.get('Retry-After')))
+                    if response.status not in RETRY_STATUS:
+                        raise error
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error = e
+            finally:
+                observe('koleka_http_request_seconds', time.perf_counter() - start, status=status)
+
+            if attempt == self.__retries:
+                raise error
+
+            # Attente exponentielle avec gigue, ou durée imposée par le serveur
+            delay = getattr(error, 'retry_after', None)
+            if delay is None:
+                delay = self.__backoff * (2 ** attempt) * (1 + random.random())
+            elif delay > self.__timeout.total:
+                raise error
+            await asyncio.sleep(delay)
+
+    async def close(self) -> None:
+        """Ferme la session et libère les connexions"""
+        if self.__session is not None and not self.__session.closed:
+            await self.__session.close()
@@ -1,16 +1,60 @@
+import asyncio
 import os
-from datetime import datetime
-
-import requests
-from sortedcontainers import SortedSet
+import time
+from typing import AsyncIterator, Iterable
 
+from database.database import run_async, run_cpu
+from metrics.metrics import increment, timed, timer
+from model.board import LineBoard
 from model.line import Line
 from model.station import Station
+from network.cache import RealtimeCache
+from network.departures import DepartureStore
+from network.http import HttpClient
 from network.network import Network
+from network.poller import RealtimePoller
+from network.scheduler import Priority, QuotaExceeded, Ticket, UpstreamScheduler
+from network.shared_cache import shared_cache
+from network.siri import (Departure, decode_departures, decode_entries, encode_departures, encode_entries,
+                          parse_stop_monitoring)
+from network.snapshot import Snapshot
 
-URL = 'https://prim.iledefrance-mobilites.fr/marketplace/stop-monitoring'
+URL = os.getenv('IDFM_API_URL', 'https://prim.iledefrance-mobilites.fr/marketplace/stop-monitoring')
 HEADERS = {'Accept': 'application/json', 'apikey': os.getenv('IDFM_API_KEY')}
 
+# Durée de vie (en secondes) et taille du cache des réponses temps réel
+CACHE_TTL = float(os.getenv('IDFM_CACHE_TTL', '20'))
+CACHE_SIZE = int(os.getenv('IDFM_CACHE_SIZE', '1024'))
+
+# Budget d'appels à PRIM (requêtes par seconde, rafale, appels simultanés) et âge maximal des données
+# servies en mode dégradé lorsque le budget est épuisé ou que PRIM ne répond pas
+RATE = float(os.getenv('IDFM_RATE', '5'))
+BURST = int(os.getenv('IDFM_BURST', '20'))
+CONCURRENCY = int(os.getenv('IDFM_CONCURRENCY', '20'))
+STALE_MAX_AGE = float(os.getenv('IDFM_STALE_MAX_AGE', '180'))
+
+# Arrêts interrogés en tâche de fond (identifiants séparés par des virgules), période et fraîcheur maximale
+HOT_STATIONS = [station.strip() for station in os.getenv('IDFM_HOT_STATIONS', '').split(',') if station.strip()]
+POLL_INTERVAL = float(os.getenv('IDFM_POLL_INTERVAL', '30'))
+POLL_MAX_AGE = float(os.getenv('IDFM_POLL_MAX_AGE', '60'))
+# Durée pendant laquelle les autres processus gardent les passages d'un arrêt suivi : jusqu'au relevé suivant,
+# avec une marge pour son temps de réponse
+POLL_SHARED_TTL = max(POLL_MAX_AGE, POLL_INTERVAL + 10)
+# Stations de même nom interrogées avec la station demandée : nombre maximal, appels simultanés et délai commun
+SIBLINGS_MAX = int(os.getenv('IDFM_SIBLINGS_MAX', '6'))
+SIBLINGS_CONCURRENCY = int(os.getenv('IDFM_SIBLINGS_CONCURRENCY', '4'))
+SIBLINGS_DEADLINE = float(os.getenv('IDFM_SIBLINGS_DEADLINE', '2'))
+
+# Tableaux de ligne : nombre maximal de stations, appels simultanés et réponses attendues avant chaque mise à jour
+LINE_STATIONS_MAX = int(os.getenv('IDFM_LINE_STATIONS_MAX', '80'))
+LINE_CONCURRENCY = int(os.getenv('IDFM_LINE_CONCURRENCY', '8'))
+LINE_BATCH = int(os.getenv('IDFM_LINE_BATCH', '8'))
+
+# Délai accordé au temps réel avant de répondre avec les horaires théoriques, lorsqu'ils sont connus
+REALTIME_BUDGET = float(os.getenv('IDFM_REALTIME_BUDGET', '2.5'))
+# Avec plusieurs processus, seul le processus principal interroge les arrêts suivis et partage leurs passages
+POLL_PRIMARY = os.getenv('KOLEKA_PRIMARY', '1') == '1'
+
 NAME = "Île-de-France"
 SCHEMA_NAME = "IDFM"
 
@@ -18,6 +62,71 @@ SCHEMA_NAME = "IDFM"
 class IDFM(Network):
     def __init__(self):
         super().__init__(NAME, SCHEMA_NAME)
+        self._client = HttpClient(HEADERS)
+        self._scheduler = UpstreamScheduler(RATE, BURST, CONCURRENCY)
+        self._realtime = RealtimeCache(CACHE_TTL, CACHE_SIZE, shared_cache(), encode_departures, decode_departures)
+        self._store = DepartureStore()
+        # Arrêts suivis : interrogés par le processus principal, servis par tous tant qu'ils datent du dernier relevé
+        self._hot = dict.fromkeys(self.to_stif(station) for station in HOT_STATIONS)
+        self._poller = RealtimePoller(self.poll_departures, self._store, list(self._hot) if POLL_PRIMARY else [],
+                                      POLL_INTERVAL)
+
+    async def start(self) -> None:
+        await super().start()
+        if self._poller.monitoring_refs:
+            self._tasks.append(asyncio.create_task(self._poller.run()))
+
+    async def _snapshot_sections(self) -> dict[str, bytes]:
+        sections = await super()._snapshot_sections()
+        sections['realtime'] = await run_cpu(encode_entries, self._realtime.entries(STALE_MAX_AGE))
+        return sections
+
+    async def _restore_sections(self, snapshot: Snapshot) -> None:
+        await super()._restore_sections(snapshot)
+        if 'realtime' not in snapshot:
+            return
+        # Les réponses encore fraîches sont servies telles quelles, les autres seulement en mode dégradé,
+        # en attendant d'être revalidées en arrière-plan
+        elapsed = max(snapshot.age, 0.0)
+        restored = []
+        for monitoring_ref, age, departures in await run_cpu(decode_entries, snapshot.section('realtime')):
+            if age + elapsed < STALE_MAX_AGE:
+                self._realtime.put(monitoring_ref, departures, age + elapsed)
+                restored.append(monitoring_ref)
+        print(f"Cache temps réel {self.name} repris de l'instantané : {len(restored)} arrêts")
+        # Le processus principal les redemande et partage les réponses avec les autres
+        if restored and POLL_PRIMARY:
+            self._tasks.append(asyncio.create_task(self.__revalidate(restored[::-1])))
+
+    async def __revalidate(self, monitoring_refs: list[str]) -> None:
+        """Redemande à PRIM les passages repris de l'instantané, des plus aux moins récemment utilisés
+
+        Les requêtes passent une à une, en préchargement : elles ne prennent pas le budget des commandes
+        et s'arrêtent dès qu'il est épuisé. Les arrêts déjà redemandés entre-temps sont sautés.
+        """
+        start = time.monotonic()
+        for monitoring_ref in monitoring_refs:
+            age = self._realtime.age(monitoring_ref)
+            if age is None or age < time.monotonic() - start:
+                continue
+            try:
+                await self.poll_departures(monitoring_ref)
+            except QuotaExceeded:
+                break
+            except Exception as e:
+                print(e)
+
+    @property
+    def realtime(self) -> RealtimeCache:
+        return self._realtime
+
+    @property
+    def poller(self) -> RealtimePoller:
+        return self._poller
+
+    @property
+    def scheduler(self) -> UpstreamScheduler:
+        return self._scheduler
 
     def get_color(self, id_ligne: str) -> hex:
         return self._database.get_color(self.to_idfm(id_ligne))
@@ -28,6 +137,16 @@ class IDFM(Network):
     def get_line_name(self, ligne: str) -> str:
         return self._database.get_line_name(self.to_idfm(ligne))
 
+    def get_stop_names(self, ids_arrets: Iterable[str]) -> dict[str, str]:
+        ids = {id_arret: self.to_idfm(id_arret) for id_arret in ids_arrets}
+        noms = self._database.get_stop_names(ids.values())
+        return {id_arret: noms[id_idfm] for id_arret, id_idfm in ids.items()}
+
+    def get_routes_meta(self, ids_lignes: Iterable[str]) -> dict[str, tuple[str, int]]:
+        ids = {id_ligne: self.to_idfm(id_ligne) for id_ligne in ids_lignes}
+        lignes = self._database.get_routes_meta(ids.values())
+        return {id_ligne: lignes[id_idfm] for id_ligne, id_idfm in ids.items()}
+
     @staticmethod
     def to_stif(string: str) -> str:
         """Convertit au format STIF toute chaîne de caractères"""
@@ -46,45 +165,177 @@ class IDFM(Network):
             return f"IDFM:{string[11:-1]}"
         return f"IDFM:{string[17:-1]}"
 
-    def create_station(self, station_id: str) -> Station:
-        station: Station = Station(station_id, self.get_stop_name(station_id))
+    async def fetch_departures(self, monitoring_ref: str) -> list[Departure]:
+        """Interroge PRIM pour obtenir les prochains passages à un arrêt"""
+        with timer('koleka_create_station_seconds', phase='fetch'):
+            payload = await self._client.get(URL, params={'MonitoringRef': monitoring_ref})
+        with timer('koleka_create_station_seconds', phase='parse'):
+            return parse_stop_monitoring(payload)
+
+    async def request_departures(self, monitoring_ref: str, priority: Priority | Ticket) -> list[Departure]:
+        """Interroge PRIM en passant par l'ordonnanceur des appels"""
+        return await self._scheduler.submit(lambda: self.fetch_departures(monitoring_ref), priority)
 
-        station.lines = SortedSet(key=lambda ligne: ligne.id)
-        params = {'MonitoringRef': self.to_stif(station.id)}
+    async def poll_departures(self, monitoring_ref: str) -> list[Departure]:
+        """Interroge PRIM pour un arrêt suivi et partage le résultat avec les autres processus"""
+        departures = await self.request_departures(monitoring_ref, Priority.PREFETCH)
+        await self._realtime.publish(monitoring_ref, departures, POLL_SHARED_TTL)
+        return departures
 
+    async def get_departures(self, monitoring_ref: str, priority: Priority = Priority.INTERACTIVE) -> list[Departure]:
+        """Donne les passages d'un arrêt depuis la mémoire, le cache ou PRIM, dans cet ordre"""
+        # Les arrêts suivis en tâche de fond sont servis depuis la mémoire tant que leurs données sont fraîches
+        departures = self._store.get(monitoring_ref, POLL_MAX_AGE)
+        if departures is not None:
+            return departures
+
+        # Budget presque épuisé : les rafraîchissements se contentent de données un peu plus anciennes
+        if priority != Priority.INTERACTIVE and self._scheduler.saturated(priority):
+            departures = self._realtime.peek(monitoring_ref, STALE_MAX_AGE)
+            if departures is not None:
+                return departures
+
+        try:
+            # Un appel interactif qui rejoint une requête de rafraîchissement en cours la fait passer devant
+            return await self._realtime.get(monitoring_ref,
+                                            lambda ticket: self.request_departures(monitoring_ref, ticket), priority,
+                                            POLL_MAX_AGE if monitoring_ref in self._hot else None)
+        except Exception as e:
+            print(e)
+            departures = self._realtime.peek(monitoring_ref, STALE_MAX_AGE)
+            if departures is None:
+                departures = self._store.get(monitoring_ref, STALE_MAX_AGE)
+            if departures is None:
+                raise
+            return departures
+
+    def station_ids(self, station_id: str) -> list[str]:
+        """Donne la station demandée suivie des autres stations de même nom (autres modes, autres gares routières)"""
+        station_ids = list(dict.fromkeys([station_id] + self.get_similar_stations(station_id)))
+        return station_ids[:SIBLINGS_MAX]
+
+    async def fan_out(self, station_ids: list[str], priority: Priority) -> list[Departure]:
+        """Interroge simultanément les stations données et fusionne leurs passages
+
+        La première station est attendue quoi qu'il arrive ; les autres ont un délai commun,
+        au-delà duquel leurs passages sont ignorés. Une course vue depuis plusieurs stations n'est gardée qu'une fois.
+        """
+        semaphore = asyncio.Semaphore(SIBLINGS_CONCURRENCY)
+
+        async def departures(station_id: str) -> list[Departure]:
+            async with semaphore:
+                return await self.get_departures(self.to_stif(station_id), priority)
+
+        tasks = [asyncio.ensure_future(departures(station_id)) for station_id in station_ids]
+        if len(tasks) > 1:
+            # Les requêtes en retard continuent : leurs réponses alimenteront le cache
+            for task in tasks[1:]:
+                task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            await asyncio.wait(tasks, timeout=SIBLINGS_DEADLINE)
+
+        merged = list(await tasks[0])
+        journeys = {departure.journey_id for departure in merged if departure.journey_id}
+        for task in tasks[1:]:
+            if not task.done():
+                increment('koleka_siblings_total', status='late')
+                continue
+            if task.exception() is not None:
+                increment('koleka_siblings_total', status='error')
+                continue
+            for departure in task.result():
+                if departure.journey_id:
+                    if departure.journey_id in journeys:
+                        continue
+                    journeys.add(departure.journey_id)
+                merged.append(departure)
+        return merged
+
+    async def station_departures(self, station_id: str, priority: Priority) -> tuple[list[Departure], bool]:
+        """Donne les passages temps réel de la station et de ses homonymes, ou leurs horaires théoriques si PRIM tarde
+
+        :return: Passages et indicateur d'horaires théoriques
+        """
+        station_ids = await run_async(self.station_ids, station_id)
+        request = self.fan_out(station_ids, priority)
+        if not self.has_timetable(station_id):
+            return await request, False
+
+        # La requête continue après le délai : sa réponse alimentera le cache pour les demandes suivantes
+        task = asyncio.ensure_future(request)
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
         try:
-            json = requests.get(URL, headers=HEADERS, params=params).json()
-            json = json['Siri']['ServiceDelivery']['StopMonitoringDelivery'][0]['MonitoredStopVisit']
+            return await asyncio.wait_for(asyncio.shield(task), REALTIME_BUDGET), False
+        except asyncio.TimeoutError:
+            increment('koleka_theoretical_total', reason='timeout')
         except Exception as e:
             print(e)
-            raise
+            increment('koleka_theoretical_total', reason='error')
+        return await run_cpu(self.theoretical_departures, station_ids), True
 
-        for entry in json:
-            stop_id: str = entry['MonitoringRef']['value']
-            journey: dict = entry['MonitoredVehicleJourney']
-            line_id: str = journey['LineRef']['value']
-            line: Line = station.get_line(line_id)
+    @timed('koleka_create_station_seconds', phase='total')
+    async def create_station(self, station_id: str, priority: Priority = Priority.INTERACTIVE) -> Station:
+        with timer('koleka_create_station_seconds', phase='departures'):
+            departures, theoretical = await self.station_departures(station_id, priority)
 
-            if not line:
-                line = Line(line_id, self.get_line_name(line_id), self.get_color(line_id))
-                station.add_line(line)
+        return await self.build_station(station_id, departures, theoretical)
 
-            line.add_stop(stop_id, self.get_stop_name(stop_id))
+    def build_board(self, line_id: str) -> LineBoard:
+        """Prépare le tableau d'une ligne : ses stations dans l'ordre de passage, encore sans horaires"""
+        station_ids = self.get_route_stations(line_id)[:LINE_STATIONS_MAX]
+        names = self.get_stop_names(station_ids)
+        name, color = self.get_routes_meta([line_id])[line_id]
+        return LineBoard(Line(line_id, name, color), [(station_id, names[station_id]) for station_id in station_ids])
 
-            wait_time = journey['MonitoredCall'].get('ExpectedDepartureTime', '2022-01-01T00:00:00.000Z')
-            wait_time = journey['MonitoredCall'].get('ExpectedArrivalTime', wait_time)
-            wait_time = datetime.strptime(wait_time, '%Y-%m-%dT%H:%M:%S.%fZ')
-            wait_time = round((wait_time - datetime.now()).total_seconds() / 60.0)
+    async def fill_board(self, board: LineBoard, priority: Priority = Priority.REFRESH) -> AsyncIterator[LineBoard]:
+        """Interroge toutes les stations du tableau et le complète au fil des réponses
 
-            destination = journey['MonitoredCall'].get('DestinationDisplay')
-            destination = journey.get('DestinationName', destination)
-            destination = journey.get('DirectionName', destination)
-            destination = destination[0]['value']
+        Les stations suivies en tâche de fond sont lues dans la mémoire, directement pour la ligne ;
+        les autres appels passent par le cache et l'ordonnanceur, LINE_CONCURRENCY à la fois.
+        Le tableau est rendu après les stations suivies, après chaque lot de LINE_BATCH réponses, puis une fois complet.
+        """
+        line_ref = self.to_stif(board.line.id)
+        semaphore = asyncio.Semaphore(LINE_CONCURRENCY)
 
-            if journey['JourneyNote'] and journey['JourneyNote'][0]['value'] != "":
-                destination = f"{journey['JourneyNote'][0]['value']} | {destination}"
+        async def departures(station_id: str) -> tuple[str, list[Departure] | None]:
+            async with semaphore:
+                try:
+                    return station_id, await self.get_departures(self.to_stif(station_id), priority)
+                except Exception as e:
+                    print(e)
+                    return station_id, None
 
-            if wait_time >= 0:
-                line.get_stop(stop_id).add_timetable_record(destination, wait_time)
+        polled = self._store.for_line(line_ref, POLL_MAX_AGE)
+        now = time.time()
+        for stop in board.stations:
+            known = polled.get(self.to_stif(stop.id))
+            if known is not None:
+                board.add_records(stop.id, [(departure.destination, departure.timestamp)
+                                            for departure in known if departure.wait_time(now) >= 0])
+        if polled:
+            yield board
+
+        received = 0
+        tasks = [asyncio.ensure_future(departures(stop.id)) for stop in board.stations
+                 if self.to_stif(stop.id) not in polled]
+        try:
+            for response in asyncio.as_completed(tasks):
+                station_id, result = await response
+                if result is None:
+                    board.set_failed(station_id)
+                else:
+                    now = time.time()
+                    board.add_records(station_id, [(departure.destination, departure.timestamp)
+                                                   for departure in result
+                                                   if departure.line_id == line_ref and departure.wait_time(now) >= 0])
+                received += 1
+                if received % LINE_BATCH == 0 or board.complete:
+                    yield board
+        finally:
+            # Tableau abandonné (rechargé, ou vue expirée) : les stations pas encore interrogées ne le seront pas
+            for task in tasks:
+                task.cancel()
 
-        return station
\ No newline at end of file
+    async def close(self) -> None:
+        await super().close()
+        await self._client.close()
+        await self._realtime.close()
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from model.station import Station
+
+# Mode direct : bornes de la période de rafraîchissement d'une station (en secondes), variation aléatoire
+# de cette période et budget global, en rafraîchissements par seconde
+LIVE_INTERVAL_MIN = float(os.getenv('KOLEKA_LIVE_INTERVAL_MIN', '30'))
+LIVE_INTERVAL_MAX = float(os.getenv('KOLEKA_LIVE_INTERVAL_MAX', '180'))
+LIVE_JITTER = float(os.getenv('KOLEKA_LIVE_JITTER', '0.15'))
+LIVE_BUDGET = float(os.getenv('KOLEKA_LIVE_BUDGET', '2'))
+# Modifications de messages Discord par seconde, tous abonnés confondus
+LIVE_EDITS_PER_SECOND = float(os.getenv('KOLEKA_LIVE_EDITS_PER_SECOND', '10'))
+
+Subscriber = Callable[[Station], Awaitable[None]]
+
+
+class _Watch:
+    """Station suivie en direct : ses abonnés, ses derniers horaires et la date de son prochain rafraîchissement"""
+    __slots__ = ('subscribers', 'station', 'due')
+
+    def __init__(self, station: Optional[Station], due: float):
+        self.subscribers: set[Subscriber] = set()
+        self.station = station
+        self.due = due
+
+
+class LiveRefresher:
+    """Rafraîchit les stations affichées en direct, une seule fois par station quel que soit le nombre de vues
+
+    La période de chaque station suit son prochain passage (la moitié de l'attente, entre LIVE_INTERVAL_MIN
+    et LIVE_INTERVAL_MAX) et s'allonge lorsque le budget global ne suffit plus pour toutes les stations suivies.
+    Les nouveaux horaires sont ensuite transmis aux abonnés à un rythme limité ; un abonné encore en attente
+    ne reçoit que les derniers horaires.
+    """
+
+    def __init__(self, fetch: Callable[[str], Awaitable[Station]], budget: float = LIVE_BUDGET,
+                 edits_per_second: float = LIVE_EDITS_PER_SECOND):
+        self.__fetch = fetch
+        self.__budget = budget
+        self.__edit_delay = 1 / edits_per_second
+        self.__watches: dict[str, _Watch] = {}
+        self.__edits: OrderedDict[Subscriber, str] = OrderedDict()
+        self.__wakeup = asyncio.Event()
+        self.__pending = asyncio.Event()
+        self.refreshes = 0
+        self.errors = 0
+        self.edits = 0
+
+    def __len__(self) -> int:
+        return len(self.__watches)
+
+    def subscribe(self, station_id: str, subscriber: Subscriber, station: Station = None) -> None:
+        """Abonne une vue aux horaires d'une station ; `station` est la station qu'elle affiche déjà"""
+        watch = self.__watches.get(station_id)
+        if watch is None:
+            watch = self.__watches[station_id] = _Watch(station, 0.0)
+            watch.due = time.monotonic() + self.interval(station)
+        elif station is not None and (watch.station is None or station.age < watch.station.age):
+            watch.station = station
+        watch.subscribers.add(subscriber)
+        self.__wakeup.set()
+
+    def unsubscribe(self, station_id: str, subscriber: Subscriber) -> None:
+        watch = self.__watches.get(station_id)
+        if watch is not None:
+            watch.subscribers.discard(subscriber)
+            if not watch.subscribers:
+                del self.__watches[station_id]
+        self.__edits.pop(subscriber, None)
+
+    def interval(self, station: Optional[Station]) -> float:
+        """Période de rafraîchissement d'une station, d'après son prochain passage et le nombre de stations suivies"""
+        interval = LIVE_INTERVAL_MAX
+        soonest = station.next_departure() if station is not None else None
+        if soonest is not None:
+            interval = min(LIVE_INTERVAL_MAX, max(LIVE_INTERVAL_MIN, (soonest - time.time()) / 2))
+        # Chaque station ne peut prétendre qu'à sa part du budget
+        interval = max(interval, len(self.__watches) / self.__budget)
+        return interval * random.uniform(1 - LIVE_JITTER, 1 + LIVE_JITTER)
+
+    async def __refresh(self, station_id: str) -> None:
+        try:
+            station = await self.__fetch(station_id)
+            self.refreshes += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"{station_id} : {e!r}")
+            station = None
+
+        watch = self.__watches.get(station_id)
+        if watch is None:
+            return
+        if station is not None:
+            watch.station = station
+            for subscriber in watch.subscribers:
+                self.__edits[subscriber] = station_id
+            self.__pending.set()
+        watch.due = time.monotonic() + self.interval(watch.station)
+        self.__wakeup.set()
+
+    async def __push(self) -> None:
+        """Transmet les nouveaux horaires aux abonnés, au plus LIVE_EDITS_PER_SECOND fois par seconde"""
+        while True:
+            if not self.__edits:
+                self.__pending.clear()
+                await self.__pending.wait()
+                continue
+            subscriber, station_id = self.__edits.popitem(last=False)
+            watch = self.__watches.get(station_id)
+            if watch is None or watch.station is None or subscriber not in watch.subscribers:
+                continue
+            try:
+                await subscriber(watch.station)
+                self.edits += 1
+            except Exception as e:
+                print(f"{station_id} : {e!r}")
+            await asyncio.sleep(self.__edit_delay)
+
+    async def run(self) -> None:
+        """Boucle de rafraîchissement, à lancer comme tâche de fond"""
+        push = asyncio.create_task(self.__push())
+        refreshes: set[asyncio.Task] = set()
+        try:
+            while True:
+                self.__wakeup.clear()
+                if not self.__watches:
+                    await self.__wakeup.wait()
+                    continue
+
+                station_id, watch = min(self.__watches.items(), key=lambda item: item[1].due)
+                delay = watch.due - time.monotonic()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self.__wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                # Aucune autre échéance tant que la réponse n'est pas arrivée
+                watch.due = float('inf')
+                task = asyncio.create_task(self.__refresh(station_id))
+                refreshes.add(task)
+                task.add_done_callback(refreshes.discard)
+                await asyncio.sleep(1 / self.__budget)
+        finally:
+            push.cancel()
+            for task in refreshes:
+                task.cancel()
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'stations': len(self.__watches),
+            'subscribers': sum(len(watch.subscribers) for watch in self.__watches.values()),
+            'refreshes': self.refreshes,
+            'errors': self.errors,
+            'edits': self.edits,
+            'pending_edits': len(self.__edits),
+        }
@@ -1,23 +1,239 @@
+import asyncio
+import os
+import time
 from abc import abstractmethod, ABC
+from typing import AsyncIterator, Iterable, Optional
 
+from database.database import run_async, run_cpu
 from database.database_gtfs import DatabaseGTFS
+from database.database_gtfs_sqlite import DatabaseGTFSSQLite
+from database.gtfs_backend import GTFSBackend
+from database.gtfs_reference import GTFSReference
+from database.timetable import Timetable, timetable
+from metrics.metrics import timer
+from model.board import LineBoard
+from model.line import Line
 from model.station import Station
+from network.live import LiveRefresher
+from network.scheduler import Priority
+from network.siri import Departure
+from network.snapshot import SNAPSHOT_INTERVAL, Snapshot, read_snapshot, snapshot_path, write_snapshot
+
+# Référentiel GTFS en mémoire (arrêts et lignes), rechargé lorsque le schéma change
+GTFS_REFERENCE = os.getenv('GTFS_REFERENCE', '1') == '1'
+GTFS_REFERENCE_INTERVAL = float(os.getenv('GTFS_REFERENCE_INTERVAL', '600'))
+# Avec plusieurs processus, seul le processus principal écrit l'instantané ; tous le lisent au démarrage,
+# et les autres y reprennent ensuite les tables de référence rechargées par le processus principal
+SNAPSHOT_WRITER = os.getenv('KOLEKA_PRIMARY', '1') == '1'
+
+
+def gtfs_backend(schema: str) -> GTFSBackend:
+    """Source GTFS d'un réseau, choisie par la variable {SCHEMA}_GTFS_BACKEND : « mysql » (par défaut) ou « sqlite:chemin »"""
+    kind, _, path = os.getenv(f'{schema.upper()}_GTFS_BACKEND', 'mysql').partition(':')
+    if kind == 'sqlite':
+        return DatabaseGTFSSQLite(path or f'{schema}.sqlite')
+    if kind == 'mysql':
+        return DatabaseGTFS(schema)
+    raise ValueError(f"Source GTFS inconnue pour {schema} : {kind}")
 
 
 class Network(ABC):
     def __init__(self, name: str, schema: str):
         self.name = name
-        self._database = DatabaseGTFS(schema)
+        backend = gtfs_backend(schema)
+        self._database: GTFSBackend = GTFSReference(backend, name) if GTFS_REFERENCE else backend
+        self._tasks: list[asyncio.Task] = []
+        self._ready = asyncio.Event()
+        # Stations affichées en direct, rafraîchies une fois pour toutes les vues qui les suivent ; un appel
+        # interactif qui rejoint l'un de ces rafraîchissements dans le cache temps réel le fait passer devant
+        self._live = LiveRefresher(lambda station_id: self.create_station(station_id, Priority.REFRESH))
+        # Index des horaires théoriques (voir database/timetable.py), désigné par la variable {SCHEMA}_TIMETABLE
+        self.__timetable_path = os.getenv(f'{schema.upper()}_TIMETABLE')
+        self._timetable: Optional[Timetable] = None
+        # Instantané de l'état chaud (voir network/snapshot.py) et tables de référence déjà encodées
+        self.__snapshot_path = snapshot_path(schema)
+        self.__reference_payload: tuple[object, Optional[bytes]] = (None, None)
+
+    async def start(self) -> None:
+        """Lance les tâches de fond du réseau, dont le chargement des données de référence
+
+        Le chargement ne retarde pas le démarrage du bot : en attendant, les requêtes sont transmises à la source GTFS.
+        S'il existe, l'instantané écrit par le processus précédent est repris d'abord ; les tables de référence sont
+        alors revalidées en arrière-plan.
+        """
+        if self._timetable is None:
+            self._timetable = await run_cpu(timetable, self.__timetable_path)
+
+        snapshot = await run_cpu(read_snapshot, self.__snapshot_path)
+        if snapshot is not None:
+            try:
+                await self._restore_sections(snapshot)
+            except Exception as e:
+                print(f"Instantané {self.__snapshot_path} illisible : {e!r}")
+            finally:
+                snapshot.close()
+
+        reference = self._database
+        if isinstance(reference, GTFSReference):
+            self._tasks.append(asyncio.create_task(self.__reference(reference)))
+        else:
+            self._ready.set()
+
+        if self.__snapshot_path and SNAPSHOT_WRITER:
+            self._tasks.append(asyncio.create_task(self.__snapshots()))
+        self._tasks.append(asyncio.create_task(self._live.run()))
+
+    async def __reference(self, reference: GTFSReference) -> None:
+        if not reference.loaded:
+            try:
+                await reference.reload()
+            except Exception as e:
+                print(e)
+        self._ready.set()
+        if self.__snapshot_path and not SNAPSHOT_WRITER:
+            # Le processus principal réécrit l'instantané au plus SNAPSHOT_INTERVAL secondes après un rechargement
+            await reference.watch(GTFS_REFERENCE_INTERVAL, self.__shared_reference, 3 * SNAPSHOT_INTERVAL)
+        else:
+            await reference.watch(GTFS_REFERENCE_INTERVAL)
+
+    def __shared_reference(self) -> Optional[bytes]:
+        """Tables de référence encodées dans l'instantané du processus principal"""
+        snapshot = read_snapshot(self.__snapshot_path)
+        if snapshot is None:
+            return None
+        try:
+            return snapshot.section('reference') if 'reference' in snapshot else None
+        finally:
+            snapshot.close()
+
+    async def __snapshots(self) -> None:
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            await self.write_snapshot()
+
+    async def write_snapshot(self) -> None:
+        """Écrit l'instantané de l'état chaud du réseau, hors de la boucle d'évènements"""
+        try:
+            sections = await self._snapshot_sections()
+            await run_cpu(write_snapshot, self.__snapshot_path, sections)
+        except Exception as e:
+            print(f"Écriture de l'instantané {self.__snapshot_path} impossible : {e!r}")
+
+    async def _snapshot_sections(self) -> dict[str, bytes]:
+        """Sections encodées de l'instantané ; les sous-classes y ajoutent leurs caches"""
+        reference = self._database
+        if not isinstance(reference, GTFSReference) or not reference.loaded:
+            return {}
+        # Les tables ne changent qu'au rechargement : elles ne sont encodées qu'une fois par version
+        tables = reference.tables
+        if self.__reference_payload[0] is not tables:
+            self.__reference_payload = (tables, await run_cpu(tables.encode))
+        return {'reference': self.__reference_payload[1]}
+
+    async def _restore_sections(self, snapshot: Snapshot) -> None:
+        """Reprend les sections d'un instantané ; les sous-classes y reprennent leurs caches"""
+        reference = self._database
+        if isinstance(reference, GTFSReference) and not reference.loaded and 'reference' in snapshot:
+            await run_cpu(reference.restore, snapshot.section('reference'))
+
+    @property
+    def live(self) -> LiveRefresher:
+        return self._live
+
+    async def wait_ready(self) -> None:
+        """Attend le premier chargement des données de référence"""
+        await self._ready.wait()
 
     def get_stations(self, stop_name: str) -> list[str]:
         return self._database.get_stations(stop_name)
 
+    def get_similar_stations(self, stop_id: str) -> list[str]:
+        return self._database.get_similar_stations(stop_id)
+
+    def get_route_stations(self, line_id: str) -> list[str]:
+        return self._database.get_route_stations(line_id)
+
     def get_stop_name(self, stop_id: str) -> str:
         return self._database.get_stop_name(stop_id)
 
+    def get_stop_names(self, stop_ids: Iterable[str]) -> dict[str, str]:
+        return self._database.get_stop_names(stop_ids)
+
+    def get_routes_meta(self, line_ids: Iterable[str]) -> dict[str, tuple[str, int]]:
+        return self._database.get_routes_meta(line_ids)
+
     def get_lines(self, ligne: str) -> list[str]:
         return self._database.get_lines(ligne)
 
+    def has_timetable(self, station_id: str) -> bool:
+        """Indique si des horaires théoriques sont connus pour la station"""
+        return self._timetable is not None and station_id in self._timetable
+
+    def theoretical_departures(self, station_ids: list[str], now: float = None) -> list[Departure]:
+        """Donne les prochains départs théoriques des stations, d'après l'index des horaires"""
+        now = time.time() if now is None else now
+        return [Departure(stop_id, line_id, destination, timestamp, None)
+                for station_id in station_ids if self.has_timetable(station_id)
+                for stop_id, line_id, destination, timestamp in self._timetable.departures(station_id, now)]
+
+    def resolve_station(self, station_id: str, departures: list[Departure]) -> tuple[dict[str, str],
+                                                                                    dict[str, tuple[str, int]]]:
+        """Résout les noms des arrêts et des lignes des passages, en une requête par table quel que soit leur nombre"""
+        stop_names = self.get_stop_names({station_id} | {departure.stop_id for departure in departures})
+        routes = self.get_routes_meta({departure.line_id for departure in departures})
+        return stop_names, routes
+
+    async def build_station(self, station_id: str, departures: list[Departure], theoretical: bool = False) -> Station:
+        """Construit la station à partir des passages reçus
+
+        Les noms sont résolus sur les threads de la base de données (ils peuvent l'interroger),
+        la construction elle-même sur ceux des traitements longs.
+        """
+        with timer('koleka_create_station_seconds', phase='resolve'):
+            stop_names, routes = await run_async(self.resolve_station, station_id, departures)
+
+        with timer('koleka_create_station_seconds', phase='build'):
+            return await run_cpu(self._build, station_id, departures, time.time(), stop_names, routes, theoretical)
+
+    @staticmethod
+    def _build(station_id: str, departures: list[Departure], now: float, stop_names: dict[str, str],
+                routes: dict[str, tuple[str, int]], theoretical: bool = False) -> Station:
+        station: Station = Station(station_id, stop_names[station_id], theoretical, now)
+
+        for departure in departures:
+            # Les temps d'attente sont calculés au rendu ; les passages déjà partis ne sont pas conservés
+            if departure.wait_time(now) < 0:
+                continue
+
+            line: Line = station.get_line(departure.line_id)
+            if not line:
+                line = Line(departure.line_id, *routes[departure.line_id])
+                station.add_line(line)
+
+            stop = line.add_stop(departure.stop_id, stop_names[departure.stop_id])
+            stop.add_timetable_record(departure.destination, departure.timestamp)
+
+        return station
+
+    @abstractmethod
+    async def create_station(self, station_id: str, priority: Priority = Priority.INTERACTIVE) -> Station:
+        pass
+
     @abstractmethod
-    def create_station(self, station_id: str) -> Station:
+    def build_board(self, line_id: str) -> LineBoard:
         pass
+
+    @abstractmethod
+    def fill_board(self, board: LineBoard, priority: Priority = Priority.REFRESH) -> AsyncIterator[LineBoard]:
+        pass
+
+    async def close(self) -> None:
+        """Arrête les tâches de fond et libère les ressources du réseau de transport"""
+        if self.__snapshot_path and SNAPSHOT_WRITER:
+            await self.write_snapshot()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        if self._timetable is not None:
+            self._timetable.close()
+            self._timetable = None
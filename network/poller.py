@@ -0,0 +1,66 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Iterable
+
+from network.departures import DepartureStore
+from network.siri import Departure
+
+
+class RealtimePoller:
+    """Interroge périodiquement les arrêts les plus demandés et garde leurs passages en mémoire
+
+    Le nombre d'appels à l'API dépend alors de la fréquence d'interrogation et non plus du
+    nombre d'utilisateurs.
+    """
+
+    def __init__(self, fetch: Callable[[str], Awaitable[list[Departure]]], store: DepartureStore,
+                 monitoring_refs: Iterable[str], interval: float, concurrency: int = 8):
+        self.__fetch = fetch
+        self.__store = store
+        self.__refs: set[str] = set(monitoring_refs)
+        self.__interval = interval
+        self.__semaphore = asyncio.Semaphore(concurrency)
+        self.polls = 0
+        self.errors = 0
+        self.last_cycle = 0.0
+
+    @property
+    def monitoring_refs(self) -> frozenset[str]:
+        return frozenset(self.__refs)
+
+    def add(self, monitoring_ref: str) -> None:
+        self.__refs.add(monitoring_ref)
+
+    def discard(self, monitoring_ref: str) -> None:
+        self.__refs.discard(monitoring_ref)
+        self.__store.discard([monitoring_ref])
+
+    async def __poll(self, monitoring_ref: str) -> None:
+        async with self.__semaphore:
+            try:
+                self.__store.put(monitoring_ref, await self.__fetch(monitoring_ref))
+                self.polls += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"{monitoring_ref} : {e!r}")
+
+    async def poll_once(self) -> None:
+        """Interroge une fois tous les arrêts suivis"""
+        start = time.monotonic()
+        await asyncio.gather(*(self.__poll(monitoring_ref) for monitoring_ref in list(self.__refs)))
+        self.last_cycle = time.monotonic() - start
+
+    async def run(self) -> None:
+        """Boucle d'interrogation, à lancer comme tâche de fond"""
+        while True:
+            await self.poll_once()
+            await asyncio.sleep(max(0.0, self.__interval - self.last_cycle))
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'stations': len(self.__refs),
+            'polls': self.polls,
+            'errors': self.errors,
+            'last_cycle_ms': 1000 * self.last_cycle,
+        }
@@ -0,0 +1,197 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Awaitable, Callable, Optional, TypeVar, Union
+
+from network.http import UpstreamError
+
+T = TypeVar('T')
+
+
+class Priority(IntEnum):
+    """Files d'attente des appels à l'API, de la plus prioritaire à la moins prioritaire"""
+    INTERACTIVE = 0
+    REFRESH = 1
+    PREFETCH = 2
+
+
+# Part du budget qui doit rester disponible pour qu'une file puisse consommer un jeton
+RESERVES = {Priority.INTERACTIVE: 0.0, Priority.REFRESH: 0.2, Priority.PREFETCH: 0.5}
+# Attente maximale (en secondes) d'un jeton avant d'abandonner l'appel
+MAX_WAITS = {Priority.INTERACTIVE: 6.0, Priority.REFRESH: 4.0, Priority.PREFETCH: 20.0}
+
+
+class QuotaExceeded(Exception):
+    """Le budget d'appels à l'API ne permet pas d'effectuer l'appel à temps"""
+
+
+class Ticket:
+    """Priorité d'un appel partagé par plusieurs appelants
+
+    Elle peut être relevée à tout moment, avant que l'appel soit soumis comme pendant l'attente de son jeton :
+    un appelant plus prioritaire qui rejoint l'appel ne doit pas hériter de la file de celui qui l'a lancé.
+    """
+    __slots__ = ('priority', '__listeners')
+
+    def __init__(self, priority: Priority):
+        self.priority = priority
+        self.__listeners: list[Callable[[], None]] = []
+
+    def promote(self, priority: Priority) -> None:
+        """Relève la priorité si `priority` est plus prioritaire, et prévient ceux qui attendent pour cet appel"""
+        if priority >= self.priority:
+            return
+        self.priority = priority
+        for listener in list(self.__listeners):
+            listener()
+
+    def listen(self, listener: Callable[[], None]) -> None:
+        self.__listeners.append(listener)
+
+    def forget(self, listener: Callable[[], None]) -> None:
+        self.__listeners.remove(listener)
+
+
+class _Waiter:
+    """Appel en attente de son jeton ; sa priorité et son échéance suivent celles de son ticket"""
+    __slots__ = ('ticket', 'priority', 'deadline', 'future')
+
+    def __init__(self, ticket: Ticket, future: asyncio.Future):
+        self.ticket = ticket
+        self.priority = ticket.priority
+        self.deadline = time.monotonic() + MAX_WAITS[ticket.priority]
+        self.future = future
+
+
+class UpstreamScheduler:
+    """Ordonnanceur des appels à l'API : seau à jetons, files par priorité et limite de concurrence
+
+    Le seau se remplit de `rate` jetons par seconde jusqu'à `burst`. Les jetons sont attribués
+    à la requête en attente la plus prioritaire ; les files les moins prioritaires laissent une
+    réserve aux autres. Un en-tête Retry-After suspend toutes les files. Un appel soumis avec un ticket
+    passe dans une file plus prioritaire dès que son ticket est promu (voir Ticket).
+    """
+
+    def __init__(self, rate: float, burst: int, concurrency: int):
+        self.__rate = rate
+        self.__burst = burst
+        self.__tokens = float(burst)
+        self.__updated = time.monotonic()
+        self.__paused_until = 0.0
+        self.__concurrency = asyncio.Semaphore(concurrency)
+        self.__waiters: list[tuple[int, int, _Waiter]] = []
+        self.__sequence = itertools.count()
+        self.__timer: Optional[asyncio.TimerHandle] = None
+        self.__depths = {priority: 0 for priority in Priority}
+        self.__waited = {priority: [0, 0.0] for priority in Priority}
+        self.rejected = 0
+        self.throttled = 0
+
+    def __refill(self) -> None:
+        now = time.monotonic()
+        self.__tokens = min(self.__burst, self.__tokens + (now - self.__updated) * self.__rate)
+        self.__updated = now
+
+    def __threshold(self, priority: Priority) -> float:
+        return RESERVES[priority] * self.__burst + 1
+
+    def saturated(self, priority: Priority) -> bool:
+        """Indique si un appel de cette priorité devrait attendre son jeton"""
+        self.__refill()
+        return time.monotonic() < self.__paused_until or self.__tokens < self.__threshold(priority)
+
+    def __dispatch(self) -> None:
+        self.__timer = None
+        self.__refill()
+
+        delay = self.__paused_until - time.monotonic()
+        while self.__waiters and delay <= 0:
+            priority, _, waiter = self.__waiters[0]
+            # Appel abandonné, ou promu : sa place dans son ancienne file est périmée
+            if waiter.future.done() or waiter.priority != priority:
+                heapq.heappop(self.__waiters)
+                continue
+            missing = self.__threshold(Priority(priority)) - self.__tokens
+            if missing > 0:
+                delay = missing / self.__rate
+                break
+            heapq.heappop(self.__waiters)
+            self.__tokens -= 1
+            waiter.future.set_result(None)
+
+        if self.__waiters and self.__timer is None:
+            self.__timer = asyncio.get_running_loop().call_later(max(delay, 0.001), self.__dispatch)
+
+    def __promote(self, waiter: _Waiter) -> None:
+        priority = waiter.ticket.priority
+        if waiter.future.done() or waiter.priority <= priority:
+            return
+        self.__depths[waiter.priority] -= 1
+        self.__depths[priority] += 1
+        waiter.priority = priority
+        waiter.deadline = max(waiter.deadline, time.monotonic() + MAX_WAITS[priority])
+        heapq.heappush(self.__waiters, (priority, next(self.__sequence), waiter))
+        if self.__timer is not None:
+            self.__timer.cancel()
+        self.__dispatch()
+
+    async def __acquire(self, ticket: Ticket) -> None:
+        waiter = _Waiter(ticket, asyncio.get_running_loop().create_future())
+        heapq.heappush(self.__waiters, (waiter.priority, next(self.__sequence), waiter))
+        self.__dispatch()
+        if waiter.future.done():
+            return
+
+        promote = functools.partial(self.__promote, waiter)
+        ticket.listen(promote)
+        self.__depths[waiter.priority] += 1
+        start = time.monotonic()
+        try:
+            # L'échéance recule si l'appel est promu pendant l'attente
+            while not waiter.future.done():
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), waiter.deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    if time.monotonic() >= waiter.deadline:
+                        self.rejected += 1
+                        raise QuotaExceeded(f"Aucun jeton disponible pour la file {waiter.priority.name}")
+        finally:
+            waiter.future.cancel()
+            ticket.forget(promote)
+            self.__depths[waiter.priority] -= 1
+            self.__waited[waiter.priority][0] += 1
+            self.__waited[waiter.priority][1] += time.monotonic() - start
+
+    async def submit(self, call: Callable[[], Awaitable[T]],
+                     priority: Union[Priority, Ticket] = Priority.INTERACTIVE) -> T:
+        """Effectue l'appel dès que le budget et la limite de concurrence le permettent
+
+        Avec un ticket, l'appel entre dans la file de sa priorité au moment de la soumission, puis suit ses promotions.
+        """
+        await self.__acquire(priority if isinstance(priority, Ticket) else Ticket(priority))
+        async with self.__concurrency:
+            try:
+                return await call()
+            except UpstreamError as e:
+                if e.status == 429 or e.retry_after is not None:
+                    self.throttled += 1
+                    # Le serveur impose une pause : le budget est vidé et toutes les files sont suspendues
+                    self.__paused_until = max(self.__paused_until, time.monotonic() + (e.retry_after or 1.0))
+                    self.__tokens = 0.0
+                raise
+
+    @property
+    def stats(self) -> dict:
+        self.__refill()
+        return {
+            'tokens': round(self.__tokens, 1),
+            'paused_s': round(max(0.0, self.__paused_until - time.monotonic()), 1),
+            'queued': {priority.name: depth for priority, depth in self.__depths.items()},
+            'wait_avg_ms': {priority.name: 1000 * total / count if count else 0.0
+                            for priority, (count, total) in self.__waited.items()},
+            'rejected': self.rejected,
+            'throttled': self.throttled,
+        }
@@ -0,0 +1,311 @@
+"""Cache temps réel partagé entre les processus du bot
+
+Un démon local garde les réponses de l'API ; les processus s'y adressent avant d'interroger l'API.
+Pour une clé absente, le démon désigne un seul processus chargé de la récupérer (bail) : les autres
+attendent sa réponse plutôt que d'interroger l'API à leur tour.
+
+Le démon écoute sur un socket Unix créé avec les droits 0600 : seul l'utilisateur du bot peut s'y adresser.
+Les valeurs échangées sont des données brutes (voir network/siri.py, encode_departures), jamais des objets
+Python sérialisés.
+
+Chaque demande de bail porte la priorité de l'appelant (0 pour une commande, voir network/scheduler.py) :
+une demande plus urgente que celle du détenteur reprend le bail au lieu d'attendre derrière un préchargement.
+
+Protocole : chaque trame est un en-tête `!BBIdHI` (opération, priorité, identifiant de requête,
+durée, longueur de la clé, longueur de la valeur) suivi de la clé puis de la valeur.
+"""
+import asyncio
+import itertools
+import os
+import struct
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+# Chemin du socket du démon, « local » pour un cache propre au processus, vide pour ne rien partager
+SHARED_CACHE = os.getenv('KOLEKA_SHARED_CACHE', '')
+SHARED_CACHE_SIZE = int(os.getenv('KOLEKA_SHARED_CACHE_SIZE', '8192'))
+# Durée d'un bail : passé ce délai, un autre processus est désigné pour récupérer la valeur
+LEASE_TIMEOUT = float(os.getenv('KOLEKA_SHARED_CACHE_LEASE', '10'))
+
+HEADER = struct.Struct('!BBIdHI')
+
+# Opérations des clients
+LEASE = 1
+PUT = 2
+RELEASE = 3
+# Réponses du démon
+HIT = 10
+LEADER = 11
+OK = 12
+
+
+class SharedCache(ABC):
+    """Cache partagé de valeurs binaires, avec désignation d'un seul processus pour chaque chargement"""
+
+    @abstractmethod
+    async def lease(self, key: str, max_age: float, priority: int = 0) -> tuple[Optional[bytes], float]:
+        """Donne la valeur et son âge si elle a moins de max_age secondes
+
+        Sinon, renvoie (None, 0) : l'appelant détient alors le bail et doit appeler put ou release.
+        Un appelant plus prioritaire (valeur plus petite) que le détenteur du bail le reprend aussitôt.
+        """
+
+    @abstractmethod
+    async def put(self, key: str, value: bytes, ttl: float) -> None:
+        """Enregistre la valeur pour ttl secondes et réveille les processus en attente"""
+
+    @abstractmethod
+    async def release(self, key: str) -> None:
+        """Abandonne le bail après un échec de chargement"""
+
+    async def close(self) -> None:
+        pass
+
+
+class _Entry:
+    __slots__ = ('value', 'stored_at', 'expires_at')
+
+    def __init__(self, value: bytes, ttl: float):
+        self.value = value
+        self.stored_at = time.monotonic()
+        self.expires_at = self.stored_at + ttl
+
+
+class LocalSharedCache(SharedCache):
+    """Cache partagé au sein d'un seul processus ; sert aussi de mémoire au démon"""
+
+    def __init__(self, max_size: int = SHARED_CACHE_SIZE, lease_timeout: float = LEASE_TIMEOUT):
+        self.__max_size = max_size
+        self.__lease_timeout = lease_timeout
+        self.__entries: OrderedDict[str, _Entry] = OrderedDict()
+        # Bail en cours par clé : échéance, processus en attente de la valeur (avec leur priorité)
+        # et priorité du détenteur
+        self.__leases: dict[str, tuple[float, list[tuple[int, asyncio.Future]], int]] = {}
+        self.hits = 0
+        self.leases = 0
+        self.takeovers = 0
+
+    def __fresh(self, key: str, max_age: float) -> Optional[_Entry]:
+        entry = self.__entries.get(key)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if now >= entry.expires_at:
+            del self.__entries[key]
+            return None
+        if now - entry.stored_at >= max_age:
+            return None
+        self.__entries.move_to_end(key)
+        return entry
+
+    async def lease(self, key: str, max_age: float, priority: int = 0) -> tuple[Optional[bytes], float]:
+        while True:
+            entry = self.__fresh(key, max_age)
+            if entry is not None:
+                self.hits += 1
+                return entry.value, time.monotonic() - entry.stored_at
+
+            current = self.__leases.get(key)
+            if current is None or time.monotonic() >= current[0] or priority < current[2]:
+                # Aucun chargement en cours, le détenteur du bail ne répond plus, ou son chargement est moins
+                # urgent (il peut attendre des secondes son jeton) : l'appelant s'en charge
+                if current is not None and time.monotonic() < current[0]:
+                    self.takeovers += 1
+                waiters = current[1] if current else []
+                self.__leases[key] = (time.monotonic() + self.__lease_timeout, waiters, priority)
+                self.leases += 1
+                return None, 0.0
+
+            future = asyncio.get_running_loop().create_future()
+            current[1].append((priority, future))
+            try:
+                promoted = await asyncio.wait_for(future, max(0.0, current[0] - time.monotonic()))
+            except asyncio.TimeoutError:
+                continue
+            if promoted:
+                return None, 0.0
+
+    def __wake(self, key: str, promote: bool) -> None:
+        current = self.__leases.pop(key, None)
+        if current is None:
+            return
+        waiters = [waiter for waiter in current[1] if not waiter[1].done()]
+        if promote and waiters:
+            # Échec du chargement : le processus en attente le plus prioritaire prend le bail,
+            # les autres attendent encore
+            leader = min(waiters, key=lambda waiter: waiter[0])
+            waiters.remove(leader)
+            self.__leases[key] = (time.monotonic() + self.__lease_timeout, waiters, leader[0])
+            self.leases += 1
+            leader[1].set_result(True)
+            return
+        for _, future in waiters:
+            future.set_result(None)
+
+    async def put(self, key: str, value: bytes, ttl: float) -> None:
+        self.__entries[key] = _Entry(value, ttl)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.__max_size:
+            self.__entries.popitem(last=False)
+        self.__wake(key, promote=False)
+
+    async def release(self, key: str) -> None:
+        self.__wake(key, promote=True)
+
+    @property
+    def stats(self) -> dict:
+        return {'size': len(self.__entries), 'leases': len(self.__leases), 'hits': self.hits,
+                'loads': self.leases, 'takeovers': self.takeovers}
+
+
+def _frame(op: int, request_id: int, number: float, key: bytes, value: bytes = b'', priority: int = 0) -> bytes:
+    return HEADER.pack(op, priority, request_id, number, len(key), len(value)) + key + value
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> tuple[int, int, int, float, bytes, bytes]:
+    op, priority, request_id, number, key_length, value_length = HEADER.unpack(
+        await reader.readexactly(HEADER.size))
+    key = await reader.readexactly(key_length)
+    value = await reader.readexactly(value_length)
+    return op, priority, request_id, number, key, value
+
+
+class CacheDaemon:
+    """Démon de cache local, à l'écoute des processus du bot sur un socket Unix réservé à son utilisateur"""
+
+    def __init__(self, path: str, cache: LocalSharedCache = None):
+        self.__path = path
+        self.__cache = cache or LocalSharedCache()
+        self.__server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def address(self) -> str:
+        return self.__path
+
+    @property
+    def stats(self) -> dict:
+        return self.__cache.stats
+
+    async def __answer(self, writer: asyncio.StreamWriter, op: int, priority: int, request_id: int, number: float,
+                       key: bytes, value: bytes) -> None:
+        name = key.decode()
+        if op == LEASE:
+            payload, age = await self.__cache.lease(name, number, priority)
+            writer.write(_frame(HIT, request_id, age, key, payload) if payload is not None
+                         else _frame(LEADER, request_id, 0.0, key))
+        elif op == PUT:
+            await self.__cache.put(name, value, number)
+            writer.write(_frame(OK, request_id, 0.0, key))
+        elif op == RELEASE:
+            await self.__cache.release(name)
+            writer.write(_frame(OK, request_id, 0.0, key))
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        tasks = set()
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                # Les attentes de bail ne doivent pas bloquer les autres requêtes du même processus
+                task = asyncio.create_task(self.__answer(writer, *frame))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Connexion fermée par le processus, ou démon arrêté
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def start(self) -> None:
+        if os.path.exists(self.__path):
+            # Socket laissé par un démon précédent
+            os.unlink(self.__path)
+        # Le socket est créé directement avec les droits 0600 : aucun autre utilisateur ne peut s'y connecter,
+        # même entre sa création et un éventuel chmod
+        umask = os.umask(0o177)
+        try:
+            self.__server = await asyncio.start_unix_server(self.__handle, self.__path)
+        finally:
+            os.umask(umask)
+
+    async def close(self) -> None:
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            if os.path.exists(self.__path):
+                os.unlink(self.__path)
+
+
+class CacheDaemonClient(SharedCache):
+    """Client du démon de cache : une connexion par processus, requêtes multiplexées"""
+
+    def __init__(self, path: str, timeout: float = LEASE_TIMEOUT + 1):
+        self.__path = path
+        self.__timeout = timeout
+        self.__reader: Optional[asyncio.StreamReader] = None
+        self.__writer: Optional[asyncio.StreamWriter] = None
+        self.__receiver: Optional[asyncio.Task] = None
+        self.__connecting = asyncio.Lock()
+        self.__pending: dict[int, asyncio.Future] = {}
+        self.__ids = itertools.count()
+
+    async def __connect(self) -> asyncio.StreamWriter:
+        async with self.__connecting:
+            if self.__writer is None or self.__writer.is_closing():
+                self.__reader, self.__writer = await asyncio.open_unix_connection(self.__path)
+                self.__receiver = asyncio.create_task(self.__receive(self.__reader))
+            return self.__writer
+
+    async def __receive(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                op, _, request_id, number, _, value = await _read_frame(reader)
+                future = self.__pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result((op, number, value))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            for future in self.__pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Démon de cache indisponible : {e!r}"))
+            self.__pending.clear()
+            if self.__writer is not None:
+                self.__writer.close()
+
+    async def __request(self, op: int, key: str, number: float, value: bytes = b'',
+                        priority: int = 0) -> tuple[int, float, bytes]:
+        writer = await self.__connect()
+        request_id = next(self.__ids) & 0xFFFFFFFF
+        future = self.__pending[request_id] = asyncio.get_running_loop().create_future()
+        writer.write(_frame(op, request_id, number, key.encode(), value, priority))
+        try:
+            return await asyncio.wait_for(future, self.__timeout)
+        finally:
+            self.__pending.pop(request_id, None)
+
+    async def lease(self, key: str, max_age: float, priority: int = 0) -> tuple[Optional[bytes], float]:
+        op, age, value = await self.__request(LEASE, key, max_age, priority=priority)
+        return (value, age) if op == HIT else (None, 0.0)
+
+    async def put(self, key: str, value: bytes, ttl: float) -> None:
+        await self.__request(PUT, key, ttl, value)
+
+    async def release(self, key: str) -> None:
+        await self.__request(RELEASE, key, 0.0)
+
+    async def close(self) -> None:
+        if self.__receiver is not None:
+            self.__receiver.cancel()
+        if self.__writer is not None:
+            self.__writer.close()
+
+
+def shared_cache(address: str = SHARED_CACHE) -> Optional[SharedCache]:
+    """Cache partagé désigné par la configuration"""
+    if not address:
+        return None
+    if address == 'local':
+        return LocalSharedCache()
+    return CacheDaemonClient(address)
@@ -0,0 +1,133 @@
+import calendar
+import time
+from datetime import datetime
+from typing import Optional
+
+from model.stop import DEPARTURE_GRACE, wait_time
+
+try:
+    import orjson
+
+    loads = orjson.loads
+    dumps = orjson.dumps
+except ImportError:
+    import json
+
+    loads = json.loads
+
+    def dumps(value) -> bytes:
+        return json.dumps(value, separators=(',', ':')).encode()
+
+
+class Departure:
+    """Passage à un arrêt, décodé d'une réponse SIRI"""
+    __slots__ = ('stop_id', 'line_id', 'destination', 'timestamp', 'journey_id')
+
+    def __init__(self, stop_id: str, line_id: str, destination: str, timestamp: float, journey_id: Optional[str]):
+        self.stop_id = stop_id
+        self.line_id = line_id
+        self.destination = destination
+        self.timestamp = timestamp
+        self.journey_id = journey_id
+
+    def wait_time(self, now: float) -> int:
+        """Temps d'attente en minutes par rapport à l'horloge de référence"""
+        return wait_time(self.timestamp, now)
+
+
+def encode_departures(departures: list[Departure]) -> bytes:
+    """Encode des passages pour le cache partagé, sous forme de listes de champs"""
+    return dumps([(departure.stop_id, departure.line_id, departure.destination, departure.timestamp,
+                   departure.journey_id) for departure in departures])
+
+
+def decode_departures(payload: bytes) -> list[Departure]:
+    """Décode des passages encodés par encode_departures ; une valeur mal formée lève ValueError"""
+    try:
+        return [Departure(str(stop_id), str(line_id), str(destination), float(timestamp),
+                          None if journey_id is None else str(journey_id))
+                for stop_id, line_id, destination, timestamp, journey_id in loads(payload)]
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Passages mal formés : {e}") from e
+
+
+def encode_entries(entries: list[tuple[str, float, list[Departure]]]) -> bytes:
+    """Encode des entrées du cache temps réel (arrêt, âge, passages) pour l'instantané
+
+    Chaque entrée tient sur deux lignes : l'arrêt et l'âge, puis les passages encodés par encode_departures.
+    """
+    return b''.join(dumps([monitoring_ref, age]) + b'\n' + encode_departures(departures) + b'\n'
+                    for monitoring_ref, age, departures in entries)
+
+
+def decode_entries(payload: bytes) -> list[tuple[str, float, list[Departure]]]:
+    """Décode des entrées encodées par encode_entries ; une valeur mal formée lève ValueError"""
+    lines = payload.split(b'\n')
+    entries = []
+    try:
+        for header, departures in zip(lines[::2], lines[1::2]):
+            monitoring_ref, age = loads(header)
+            entries.append((str(monitoring_ref), float(age), decode_departures(departures)))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Entrées mal formées : {e}") from e
+    return entries
+
+
+_MIDNIGHTS: dict[str, int] = {}
+
+
+def parse_timestamp(value: str) -> float:
+    """Convertit un horodatage ISO-8601 en secondes depuis l'epoch
+
+    Le format renvoyé par PRIM (« 2025-03-01T08:03:00.000Z ») est décodé à la main ;
+    les autres formats passent par datetime.fromisoformat.
+    """
+    if len(value) >= 20 and value[-1] == 'Z' and value[10] == 'T':
+        date = value[:10]
+        midnight = _MIDNIGHTS.get(date)
+        if midnight is None:
+            midnight = _MIDNIGHTS[date] = calendar.timegm((int(value[:4]), int(value[5:7]), int(value[8:10]), 0, 0, 0))
+        seconds = midnight + int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19])
+        return seconds + float(value[19:-1]) if value[19] == '.' else seconds
+
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def _value(items: Optional[list]) -> Optional[str]:
+    return items[0]['value'] if items else None
+
+
+def parse_stop_monitoring(payload: bytes | str, now: float = None) -> list[Departure]:
+    """Décode une réponse stop-monitoring en passages futurs
+
+    Une seule horloge de référence est utilisée pour toute la réponse.
+    """
+    now = time.time() if now is None else now
+    departures = []
+
+    for delivery in loads(payload)['Siri']['ServiceDelivery']['StopMonitoringDelivery']:
+        for entry in delivery.get('MonitoredStopVisit', ()):
+            journey = entry['MonitoredVehicleJourney']
+            call = journey['MonitoredCall']
+
+            expected = call.get('ExpectedArrivalTime') or call.get('ExpectedDepartureTime')
+            if not expected:
+                continue
+            timestamp = parse_timestamp(expected)
+            if timestamp < now - DEPARTURE_GRACE:
+                continue
+
+            destination = (_value(journey.get('DirectionName')) or _value(journey.get('DestinationName'))
+                           or _value(call.get('DestinationDisplay')))
+            note = _value(journey.get('JourneyNote'))
+            if note:
+                destination = f"{note} | {destination}"
+
+            journey_ref = journey.get('FramedVehicleJourneyRef')
+            departures.append(Departure(entry['MonitoringRef']['value'],
+                                        journey['LineRef']['value'],
+                                        destination,
+                                        timestamp,
+                                        journey_ref.get('DatedVehicleJourneyRef') if journey_ref else None))
+
+    return departures
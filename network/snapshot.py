@@ -0,0 +1,88 @@
+"""Instantané de l'état chaud d'un réseau (cache temps réel, référentiel GTFS), pour redémarrer sans cache vide
+
+Le fichier est écrit périodiquement et à l'arrêt, puis projeté en mémoire au démarrage ; chaque
+section n'est décodée que lorsqu'elle est demandée.
+
+Format : en-tête `!4sHdH` (signature, version du format, date d'écriture, nombre de sections), puis
+pour chaque section un en-tête `!16sQ` (nom, longueur) suivi de son contenu. Chaque section est encodée
+par son propriétaire en données brutes (voir GTFSReference.encode et network/siri.py, encode_entries),
+jamais en objets Python sérialisés : un fichier modifié ne peut pas exécuter de code au démarrage.
+"""
+import mmap
+import os
+import struct
+import time
+from typing import Optional
+
+# Dossier des instantanés (désactivés si vide) et période d'écriture, en secondes
+SNAPSHOT_DIR = os.getenv('KOLEKA_SNAPSHOT_DIR', '')
+SNAPSHOT_INTERVAL = float(os.getenv('KOLEKA_SNAPSHOT_INTERVAL', '60'))
+
+MAGIC = b'KSN1'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('!4sHdH')
+SECTION = struct.Struct('!16sQ')
+
+
+def snapshot_path(name: str, directory: str = SNAPSHOT_DIR) -> Optional[str]:
+    """Chemin de l'instantané d'un réseau, ou None si les instantanés sont désactivés"""
+    return os.path.join(directory, f'{name}.snapshot') if directory else None
+
+
+def write_snapshot(path: str, sections: dict[str, bytes]) -> int:
+    """Écrit les sections données de façon atomique et renvoie la taille du fichier"""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, time.time(), len(sections)))
+        for name, payload in sections.items():
+            file.write(SECTION.pack(name.encode(), len(payload)))
+            file.write(payload)
+    os.replace(temporary, path)
+    return os.path.getsize(path)
+
+
+class Snapshot:
+    """Instantané projeté en mémoire"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            self.__mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.written_at, count = HEADER.unpack_from(self.__mmap)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.__mmap.close()
+            raise ValueError(f"{path} n'est pas un instantané lisible")
+
+        self.__sections: dict[str, tuple[int, int]] = {}
+        offset = HEADER.size
+        for _ in range(count):
+            name, length = SECTION.unpack_from(self.__mmap, offset)
+            offset += SECTION.size
+            self.__sections[name.rstrip(b'\0').decode()] = (offset, length)
+            offset += length
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.written_at
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.__sections
+
+    def section(self, name: str) -> bytes:
+        """Contenu d'une section, à décoder par son propriétaire"""
+        offset, length = self.__sections[name]
+        return self.__mmap[offset:offset + length]
+
+    def close(self) -> None:
+        self.__mmap.close()
+
+
+def read_snapshot(path: Optional[str]) -> Optional[Snapshot]:
+    """Ouvre l'instantané donné, s'il existe et est lisible"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return Snapshot(path)
+    except (OSError, ValueError, struct.error) as e:
+        print(e)
+        return None
@@ -0,0 +1,152 @@
+"""Lance le bot sur plusieurs processus, chacun gérant une plage de shards
+
+Le superviseur démarre le démon de cache partagé, répartit les shards entre les processus, les
+démarre en respectant la limite d'identification de Discord et les relance s'ils s'arrêtent.
+
+Utilisation :
+    python supervisor.py --workers 4
+    python supervisor.py --workers 2 --shards 8
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from network.shared_cache import CacheDaemon
+
+# Délai entre deux identifications d'un même groupe de shards, imposé par Discord
+IDENTIFY_DELAY = 5.5
+RESTART_BACKOFF = 1.0
+RESTART_BACKOFF_MAX = 60.0
+# Un processus resté en vie au moins ce temps est considéré stable : son délai de relance est réinitialisé
+STABLE_AFTER = 60.0
+
+
+async def gateway_info(token: str) -> tuple[int, int]:
+    """Nombre de shards recommandé par Discord et nombre d'identifications simultanées permises"""
+    base = os.getenv('DISCORD_API_URL', 'https://discord.com/api/v10')
+    async with aiohttp.ClientSession(headers={'Authorization': f'Bot {token}'}) as session:
+        async with session.get(f'{base}/gateway/bot') as response:
+            response.raise_for_status()
+            data = await response.json()
+    return data['shards'], data.get('session_start_limit', {}).get('max_concurrency', 1)
+
+
+def split(shard_count: int, workers: int) -> list[list[int]]:
+    """Répartit les shards en plages contiguës de tailles égales à un près"""
+    size, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for i in range(workers):
+        end = start + size + (i < extra)
+        ranges.append(list(range(start, end)))
+        start = end
+    return [shards for shards in ranges if shards]
+
+
+class Worker:
+    """Processus du bot gérant une plage de shards, relancé s'il s'arrête"""
+
+    def __init__(self, index: int, shard_ids: list[int], shard_count: int, cache_address: str):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.__env = dict(os.environ,
+                          KOLEKA_SHARD_COUNT=str(shard_count),
+                          KOLEKA_SHARD_IDS=','.join(map(str, shard_ids)),
+                          KOLEKA_SHARED_CACHE=cache_address,
+                          KOLEKA_PRIMARY='1' if index == 0 else '0')
+        self.__process: asyncio.subprocess.Process | None = None
+        self.__stopping = False
+        self.restarts = 0
+
+    async def run(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        backoff = RESTART_BACKOFF
+        while not self.__stopping:
+            started = time.monotonic()
+            self.__process = await asyncio.create_subprocess_exec(sys.executable, 'koleka.py', env=self.__env)
+            print(f"Processus {self.index} (shards {self.shard_ids[0]}-{self.shard_ids[-1]}) "
+                  f"démarré : pid {self.__process.pid}")
+            code = await self.__process.wait()
+            if self.__stopping:
+                break
+
+            if time.monotonic() - started >= STABLE_AFTER:
+                backoff = RESTART_BACKOFF
+            print(f"Processus {self.index} arrêté (code {code}), relance dans {backoff:.0f} s")
+            self.restarts += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+
+    async def stop(self) -> None:
+        self.__stopping = True
+        if self.__process is not None and self.__process.returncode is None:
+            self.__process.terminate()
+            try:
+                await asyncio.wait_for(self.__process.wait(), 10)
+            except asyncio.TimeoutError:
+                self.__process.kill()
+
+
+async def supervise(workers: int, shard_count: int | None, cache_socket: str | None) -> None:
+    max_concurrency = 1
+    if shard_count is None:
+        shard_count, max_concurrency = await gateway_info(os.getenv('DISCORD_TOKEN'))
+    shard_count = max(shard_count, workers)
+
+    # Par défaut, le socket du démon est placé dans un dossier temporaire réservé à l'utilisateur du bot
+    directory = None
+    if cache_socket is None:
+        directory = tempfile.mkdtemp(prefix='koleka-')
+        cache_socket = os.path.join(directory, 'cache.sock')
+    daemon = CacheDaemon(cache_socket)
+    await daemon.start()
+    print(f"Cache partagé sur {daemon.address}, {shard_count} shards sur {workers} processus")
+
+    processes = [Worker(i, shard_ids, shard_count, daemon.address)
+                 for i, shard_ids in enumerate(split(shard_count, workers))]
+
+    # Les processus s'identifient les uns après les autres : chacun attend que les shards précédents soient connectés
+    delays = []
+    started = 0
+    for worker in processes:
+        delays.append(IDENTIFY_DELAY * (started // max_concurrency))
+        started += len(worker.shard_ids)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    tasks = [asyncio.create_task(worker.run(delay)) for worker, delay in zip(processes, delays)]
+    await stop.wait()
+
+    print("Arrêt des processus")
+    await asyncio.gather(*(worker.stop() for worker in processes))
+    for task in tasks:
+        task.cancel()
+    await daemon.close()
+    if directory is not None:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=int(os.getenv('KOLEKA_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--shards', type=int, default=int(os.getenv('KOLEKA_SHARDS', '0')) or None,
+                        help="nombre total de shards (par défaut, celui recommandé par Discord)")
+    parser.add_argument('--cache-socket', default=os.getenv('KOLEKA_CACHE_SOCKET') or None,
+                        help="socket Unix du démon de cache (par défaut, dans un dossier temporaire privé)")
+    args = parser.parse_args()
+
+    asyncio.run(supervise(args.workers, args.shards, args.cache_socket))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Priorité des requêtes mutualisées par le cache temps réel
+
+Utilisation :
+    python -m unittest tests.test_cache_priority
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+import unittest.mock
+from typing import Optional
+
+from network.cache import RealtimeCache
+from network.scheduler import MAX_WAITS, Priority, QuotaExceeded, Ticket, UpstreamScheduler
+from network.shared_cache import CacheDaemon, CacheDaemonClient, LocalSharedCache, SharedCache
+
+REF = 'STIF:StopArea:SP:1:'
+
+
+class BlockedSharedCache(SharedCache):
+    """Cache partagé dont le bail est tenu par le préchargement d'un autre processus
+
+    Seul un appel interactif, plus prioritaire que ce préchargement, obtient le bail aussitôt.
+    """
+
+    def __init__(self):
+        self.priorities = []
+
+    async def lease(self, key: str, max_age: float, priority: int = 0) -> tuple[Optional[bytes], float]:
+        self.priorities.append(priority)
+        if priority > Priority.INTERACTIVE:
+            await asyncio.Event().wait()
+        return None, 0.0
+
+    async def put(self, key: str, value: bytes, ttl: float) -> None:
+        pass
+
+    async def release(self, key: str) -> None:
+        pass
+
+
+class CachePriorityTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # Seau presque vide, qui ne se remplit pas pendant le test : il reste 2 jetons sur 10,
+        # sous la réserve des rafraîchissements (3 jetons) mais assez pour un appel interactif
+        self.scheduler = UpstreamScheduler(rate=0.001, burst=10, concurrency=4)
+        for _ in range(8):
+            await self.scheduler.submit(self.call)
+        self.cache = RealtimeCache(ttl=30, max_size=10)
+        self.calls = 0
+
+    async def call(self) -> list:
+        return []
+
+    def fetch(self, name: str):
+        async def fetch(ticket: Ticket) -> list:
+            async def call():
+                self.calls += 1
+                return [name]
+            return await self.scheduler.submit(call, ticket)
+        return fetch
+
+    async def assert_served(self, cache: RealtimeCache, leader: asyncio.Task):
+        start = time.monotonic()
+        value = await asyncio.wait_for(cache.get(REF, self.fetch('INTERACTIVE'), Priority.INTERACTIVE), 1.0)
+        self.assertLess(time.monotonic() - start, MAX_WAITS[Priority.REFRESH])
+        self.assertEqual(value, ['REFRESH'])
+        self.assertEqual(await leader, ['REFRESH'])
+        # Une seule requête, partagée par les deux appelants
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.stats['coalesced'], 1)
+
+    async def test_interactive_joins_waiting_refresh(self):
+        refresh = asyncio.create_task(self.cache.get(REF, self.fetch('REFRESH'), Priority.REFRESH))
+        await asyncio.sleep(0.05)
+        self.assertFalse(refresh.done(), "le rafraîchissement devrait attendre son jeton")
+        await self.assert_served(self.cache, refresh)
+
+    async def test_interactive_joins_before_refresh_is_queued(self):
+        # Le rafraîchissement n'a pas encore atteint l'ordonnanceur quand l'appel interactif le rejoint
+        refresh = asyncio.create_task(self.cache.get(REF, self.fetch('REFRESH'), Priority.REFRESH))
+        await asyncio.sleep(0)
+        await self.assert_served(self.cache, refresh)
+
+    async def test_interactive_joins_refresh_blocked_in_shared_lease(self):
+        shared = BlockedSharedCache()
+        cache = RealtimeCache(ttl=30, max_size=10, shared=shared, encode=lambda value: json.dumps(value).encode(),
+                              decode=json.loads)
+        refresh = asyncio.create_task(cache.get(REF, self.fetch('REFRESH'), Priority.REFRESH))
+        await asyncio.sleep(0.05)
+        self.assertFalse(refresh.done(), "le rafraîchissement devrait attendre le bail de l'autre processus")
+        # La promotion redemande le bail en priorité interactive, puis la requête entre dans la file interactive
+        joined = cache.get(REF, self.fetch('INTERACTIVE'), Priority.INTERACTIVE)
+        self.assertEqual(await asyncio.wait_for(joined, 1.0), ['REFRESH'])
+        self.assertEqual(await refresh, ['REFRESH'])
+        self.assertEqual(shared.priorities, [Priority.REFRESH, Priority.INTERACTIVE])
+        self.assertEqual(self.calls, 1)
+
+    async def test_refresh_still_waits_alone(self):
+        with self.assertRaises(QuotaExceeded):
+            await asyncio.wait_for(self.cache.get(REF, self.fetch('REFRESH'), Priority.REFRESH),
+                                   MAX_WAITS[Priority.REFRESH] + 1)
+        self.assertEqual(self.calls, 0)
+
+    async def test_lower_priority_does_not_demote(self):
+        interactive = asyncio.create_task(self.cache.get(REF, self.fetch('INTERACTIVE'), Priority.INTERACTIVE))
+        await asyncio.sleep(0)
+        prefetch = self.cache.get(REF, self.fetch('PREFETCH'), Priority.PREFETCH)
+        self.assertEqual(await prefetch, ['INTERACTIVE'])
+        self.assertEqual(await interactive, ['INTERACTIVE'])
+
+
+class SharedLeasePriorityTest(unittest.IsolatedAsyncioTestCase):
+    async def assert_lease_priority(self, shared: SharedCache):
+        # Un autre processus précharge la station et tient le bail
+        self.assertEqual(await shared.lease(REF, 30, Priority.PREFETCH), (None, 0.0))
+        # Un autre préchargement attend sa réponse…
+        waiting = asyncio.create_task(shared.lease(REF, 30, Priority.PREFETCH))
+        await asyncio.sleep(0.05)
+        self.assertFalse(waiting.done())
+        # …mais une commande reprend le bail sans attendre
+        self.assertEqual(await asyncio.wait_for(shared.lease(REF, 30, Priority.INTERACTIVE), 1.0), (None, 0.0))
+        await shared.put(REF, b'[]', 30)
+        self.assertEqual(await asyncio.wait_for(waiting, 1.0), (b'[]', unittest.mock.ANY))
+
+    async def test_local_lease_taken_over(self):
+        shared = LocalSharedCache(lease_timeout=10)
+        await self.assert_lease_priority(shared)
+        self.assertEqual(shared.stats['takeovers'], 1)
+
+    async def test_daemon_lease_taken_over(self):
+        with tempfile.TemporaryDirectory() as directory:
+            daemon = CacheDaemon(os.path.join(directory, 'cache.sock'), LocalSharedCache(lease_timeout=10))
+            await daemon.start()
+            client = CacheDaemonClient(daemon.address)
+            try:
+                await self.assert_lease_priority(client)
+                self.assertEqual(daemon.stats['takeovers'], 1)
+            finally:
+                await client.close()
+                await daemon.close()
+
+
+if __name__ == '__main__':
+    unittest.main()